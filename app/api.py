@@ -0,0 +1,369 @@
+"""
+Quoting API used by the Streamlit portal.
+
+    uvicorn app.api:app --host 0.0.0.0 --port 8000
+
+Auth: every /v1 call sends x-client-id and x-api-key. Keys come from the
+API_KEYS env var as JSON ({"acme": "secret", ...}); if it is unset every
+call is rejected, unless API_DEV_MODE=1 (local only: then just a client id
+is required). /metrics and /v1/stats span every tenant, so they want the
+operator token instead ("Authorization: Bearer $METRICS_TOKEN"); without
+METRICS_TOKEN they are only served in dev mode.
+"""
+import asyncio
+import hmac
+import json
+import logging
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from pathlib import Path
+from typing import Any, AsyncIterator, Dict, List, Literal, Optional, Union
+
+ROOT = Path(__file__).resolve().parents[1]
+APP_DIR = ROOT / "app"
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+if str(APP_DIR) not in sys.path:
+    sys.path.insert(0, str(APP_DIR))
+
+import httpx
+from fastapi import Depends, FastAPI, Header, HTTPException, Query, Response
+from fastapi.responses import PlainTextResponse, StreamingResponse
+from pydantic import BaseModel, Field
+
+from pricing_rules import RULES_STORE
+from quote_cache import QUOTE_CACHE
+from rate_cards import RATE_CARDS
+from quoting import cache_lookup, cache_store, finish_quote, quote, quote_many
+from route_cache import cache_stats
+from route_features_mapbox import compute_route_features_async
+from sweep import SweepTooLarge, sweep
+from src.batching import BatcherOverloaded, MicroBatcher
+from src import inference
+from src.inference import get_compiled, load_model, registry
+from src.metrics import METRICS, trace
+
+log = logging.getLogger("optimumlogit.api")
+
+BATCH_CHUNK_ROWS = int(os.environ.get("API_BATCH_CHUNK_ROWS", 1000))
+MAX_BATCH_ROWS = int(os.environ.get("API_MAX_BATCH_ROWS", 100_000))
+# Micro-batching de /v1/quote: "1" siempre, "0" nunca, "auto" si el modelo no es compilable
+QUOTE_MICROBATCH = os.environ.get("QUOTE_MICROBATCH", "auto")
+MICROBATCH_MAX_WAIT_MS = float(os.environ.get("QUOTE_MICROBATCH_WAIT_MS", 3.0))
+MICROBATCH_MAX_SIZE = int(os.environ.get("QUOTE_MICROBATCH_SIZE", 64))
+MICROBATCH_MAX_QUEUE = int(os.environ.get("QUOTE_MICROBATCH_QUEUE", 2048))
+# Sin API_KEYS se rechaza todo salvo en desarrollo local explícito
+API_DEV_MODE = os.environ.get("API_DEV_MODE") == "1"
+METRICS_TOKEN = os.environ.get("METRICS_TOKEN", "")
+
+
+# =========================
+#   Schemas
+# =========================
+class QuotePayload(BaseModel):
+    client_type: str
+    origin: str
+    destination: str
+    distance_km: float = Field(gt=0, le=5000)
+    load_type: str
+    load_weight_tons: float = Field(gt=0, le=100)
+    vehicle_type: str
+    fuel_price_aed_per_litre: float = Field(gt=0, le=20)
+    salik_gates: int = Field(ge=0, le=100)
+    salik_charges_aed: float = Field(ge=0)
+    customs_fees_aed: float = Field(ge=0)
+    waiting_time_hours: float = Field(ge=0, le=72)
+    contract_type: Literal["spot", "contract"]
+    backhaul_available: Literal[0, 1]
+    month: int = Field(ge=1, le=12)
+    season: str
+    weather: str
+    peak_demand_factor: float = Field(gt=0, le=5)
+
+
+class FixedCharges(BaseModel):
+    doc_fee: float
+    gate_in_out: float
+
+
+class Breakdown(BaseModel):
+    raw_rate: float
+    after_minimum: float
+    after_fixed_charges: float
+    final_rate: float
+    rounded_multiple: int
+    fixed_charges: FixedCharges
+    vehicle_minimum_applied: float
+
+
+class QuoteResponse(BaseModel):
+    client_id: str
+    raw_rate: float
+    final_rate: float
+    breakdown: Breakdown
+    model_version: str
+    rules_version: str
+
+
+class LatLon(BaseModel):
+    lat: float
+    lon: float
+    label: str
+
+
+class RouteFeaturesResponse(BaseModel):
+    origin: LatLon
+    destination: LatLon
+    distance_km: float
+    salik_gates: int
+    salik_charges_aed: float
+    salik_gates_crossed: List[str] = []
+    provider: str
+
+
+class SweepAxis(BaseModel):
+    field: str
+    values: Optional[List[Union[int, float, str]]] = None
+    start: Optional[float] = None
+    stop: Optional[float] = None
+    steps: Optional[int] = Field(default=None, ge=1)
+
+
+class SweepRequest(BaseModel):
+    base: QuotePayload
+    axes: List[SweepAxis] = Field(min_length=1, max_length=2)
+
+
+# =========================
+#   App + lifecycle
+# =========================
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    if _api_keys() is None:
+        if API_DEV_MODE:
+            log.warning("API_DEV_MODE=1: API keys are not checked")
+        else:
+            log.error("API_KEYS is not set: every /v1 call will be rejected (set API_DEV_MODE=1 for local use)")
+    RULES_STORE.start_watcher()
+    # Inferencia en un pool del tamaño de la máquina (predict libera el GIL sólo a ratos)
+    app.state.pool = ThreadPoolExecutor(max_workers=os.cpu_count() or 1, thread_name_prefix="infer")
+    compiled = None
+    try:
+        compiled = get_compiled(load_model())
+    except FileNotFoundError as e:
+        log.warning("Model not preloaded: %s", e)
+
+    if inference.INFERENCE_BACKEND == "pool":
+        from src.inference_pool import get_pool
+        workers = await asyncio.to_thread(lambda: get_pool().size)  # procesos listos antes de la 1ª petición
+        log.info("Batch scoring on %d inference worker processes", workers)
+
+    use_batcher = QUOTE_MICROBATCH == "1" or (QUOTE_MICROBATCH == "auto" and compiled is None)
+    app.state.batcher = MicroBatcher(
+        max_batch_size=MICROBATCH_MAX_SIZE, max_wait_ms=MICROBATCH_MAX_WAIT_MS, max_queue=MICROBATCH_MAX_QUEUE,
+    ) if use_batcher else None
+    yield
+    if app.state.batcher is not None:
+        app.state.batcher.close()
+    app.state.pool.shutdown(wait=False, cancel_futures=True)
+    RULES_STORE.stop_watcher()
+    if inference.INFERENCE_BACKEND == "pool":
+        from src.inference_pool import shutdown_pool
+        shutdown_pool()
+
+
+app = FastAPI(title="OptimumLogit quoting API", version="1.0", lifespan=lifespan)
+
+
+def _collect_gauges():
+    """Cache hit ratios and queue depth, read on each /metrics scrape."""
+    caches = {f"route_{ns}": s for ns, s in cache_stats().items() if isinstance(s, dict)}
+    for name, s in caches.items():
+        yield ("cache_hit_ratio", "gauge", "Hit ratio per cache", {"cache": name}, s["hit_ratio"])
+        yield ("cache_hits", "gauge", "Hits per cache and level", {"cache": name, "level": "memory"}, s["mem_hits"])
+        yield ("cache_hits", "gauge", "Hits per cache and level", {"cache": name, "level": "disk"}, s["disk_hits"])
+        yield ("cache_misses", "gauge", "Misses per cache", {"cache": name}, s["misses"])
+    q = QUOTE_CACHE.stats()
+    yield ("cache_hit_ratio", "gauge", "Hit ratio per cache", {"cache": "quote"}, q["hit_ratio"])
+    yield ("cache_hits", "gauge", "Hits per cache and level", {"cache": "quote", "level": "memory"}, q["hits"])
+    yield ("cache_hits", "gauge", "Hits per cache and level", {"cache": "quote", "level": "disk"}, q["shared_hits"])
+    yield ("cache_misses", "gauge", "Misses per cache", {"cache": "quote"}, q["misses"])
+    r = RATE_CARDS.stats()
+    yield ("cache_hit_ratio", "gauge", "Hit ratio per cache", {"cache": "rate_card"}, r["hit_ratio"])
+    yield ("cache_hits", "gauge", "Hits per cache and level", {"cache": "rate_card", "level": "memory"}, r["hits"])
+    yield ("cache_misses", "gauge", "Misses per cache", {"cache": "rate_card"}, r["misses"])
+    yield ("models_loaded", "gauge", "Models held by the registry", {}, len(registry.stats()))
+    batcher: Optional[MicroBatcher] = getattr(app.state, "batcher", None)
+    if batcher is not None:
+        m = batcher.metrics()
+        yield ("microbatch_queue_depth", "gauge", "Requests waiting for the model", {}, m["queue_depth"])
+        yield ("microbatch_rejected", "gauge", "Requests rejected with 503", {}, m["rejected"])
+        yield ("microbatch_avg_batch_size", "gauge", "Average rows per model call", {}, m["avg_batch_size"])
+
+
+METRICS.add_collector(_collect_gauges)
+
+
+def _api_keys() -> Optional[Dict[str, str]]:
+    raw = os.environ.get("API_KEYS")
+    return json.loads(raw) if raw else None
+
+
+def _same_secret(expected: Optional[str], given: str) -> bool:
+    """Constant-time comparison; a missing or empty expected secret never matches."""
+    if not expected:
+        return False
+    return hmac.compare_digest(expected.encode(), given.encode())
+
+
+def authenticate(
+    x_client_id: str = Header(..., alias="x-client-id"),
+    x_api_key: str = Header("", alias="x-api-key"),
+) -> str:
+    keys = _api_keys()
+    if keys is None:
+        if not API_DEV_MODE:
+            raise HTTPException(status_code=401, detail="API keys are not configured")
+    elif not _same_secret(keys.get(x_client_id), x_api_key):
+        raise HTTPException(status_code=401, detail="Invalid client id or API key")
+    if "/" in x_client_id or x_client_id.startswith("."):
+        raise HTTPException(status_code=400, detail="Invalid client id")
+    return x_client_id
+
+
+def authenticate_operator(authorization: str = Header("", alias="authorization")) -> None:
+    if not METRICS_TOKEN:
+        if not API_DEV_MODE:
+            raise HTTPException(status_code=401, detail="METRICS_TOKEN is not configured")
+    elif not _same_secret(f"Bearer {METRICS_TOKEN}", authorization):
+        raise HTTPException(status_code=401, detail="Invalid operator token")
+
+
+async def _in_pool(fn, *args):
+    return await asyncio.get_running_loop().run_in_executor(app.state.pool, fn, *args)
+
+
+def _finish_and_store(raw: float, data: Dict[str, Any], client_id: str, key: Optional[str]) -> Dict[str, Any]:
+    result = finish_quote(raw, data, client_id)
+    cache_store(key, result)  # con QUOTE_CACHE_DB es una escritura SQLite
+    return result
+
+
+# =========================
+#   Endpoints
+# =========================
+@app.get("/healthz")
+async def healthz() -> Dict[str, str]:
+    return {"status": "ok"}
+
+
+@app.get("/metrics", response_class=PlainTextResponse, dependencies=[Depends(authenticate_operator)])
+async def metrics() -> str:
+    """Prometheus scrape endpoint (bearer_token in the scrape config)."""
+    return METRICS.render()
+
+
+@app.get("/v1/stats", dependencies=[Depends(authenticate_operator)])
+async def stats() -> Dict[str, Any]:
+    """Operator view of every tenant (model paths, rules errors, rate cards): not for client keys."""
+    batcher: Optional[MicroBatcher] = getattr(app.state, "batcher", None)
+    return {
+        "models": registry.stats(),
+        "rules": RULES_STORE.stats(),
+        "quote_cache": QUOTE_CACHE.stats(),
+        "rate_cards": RATE_CARDS.stats(),
+        "route_cache": cache_stats(),
+        "microbatch": batcher.metrics() if batcher is not None else None,
+        "stages": METRICS.snapshot(),
+    }
+
+
+@app.get("/v1/route_features", response_model=RouteFeaturesResponse)
+async def route_features(
+    response: Response,
+    origin: str = Query(..., min_length=1),
+    destination: str = Query(..., min_length=1),
+    client_id: str = Depends(authenticate),
+) -> Dict[str, Any]:
+    try:
+        # sin profile_if_slow: alrededor de un await perfilaría todo el event loop, no esta petición
+        with trace() as spans:
+            result = await compute_route_features_async(origin, destination)
+        # desglose por etapa para el panel de tiempos del portal
+        response.headers["Server-Timing"] = ", ".join(f"{name};dur={ms}" for name, ms in spans)
+        return result
+    except ValueError as e:              # dirección/ruta no encontrada
+        raise HTTPException(status_code=404, detail=str(e))
+    except RuntimeError as e:            # MAPBOX_TOKEN no configurado
+        raise HTTPException(status_code=503, detail=str(e))
+    except httpx.HTTPError as e:
+        raise HTTPException(status_code=502, detail=f"Mapbox error: {e}")
+
+
+@app.post("/v1/quote", response_model=QuoteResponse)
+async def quote_one(payload: QuotePayload, client_id: str = Depends(authenticate)) -> Dict[str, Any]:
+    data = payload.model_dump()
+    batcher: Optional[MicroBatcher] = app.state.batcher
+    try:
+        if batcher is None:
+            return await _in_pool(quote, data, client_id)
+        # caché, tarifas de contrato y carga del modelo tocan disco: fuera del event loop
+        key, hit = await _in_pool(cache_lookup, data, client_id)
+        if hit is not None:
+            return hit
+        raw = await batcher.apredict(data, client_id)
+        return await _in_pool(_finish_and_store, raw, data, client_id, key)
+    except BatcherOverloaded as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "1"})
+    except FileNotFoundError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    except (KeyError, ValueError) as e:
+        raise HTTPException(status_code=422, detail=str(e))
+
+
+@app.post("/v1/quote:sweep")
+async def quote_sweep(body: SweepRequest, client_id: str = Depends(authenticate)) -> Dict[str, Any]:
+    """
+    What-if grid around `base`: one or two axes, each with explicit `values`
+    or numeric start/stop/steps. Scored in one batched pass (app/sweep.py);
+    rates come back as nested lists indexed like `values`.
+    """
+    axes = [a.model_dump(exclude_none=True) for a in body.axes]
+    try:
+        return await _in_pool(sweep, body.base.model_dump(), axes, client_id)
+    except SweepTooLarge as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except FileNotFoundError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    except (KeyError, ValueError) as e:
+        raise HTTPException(status_code=422, detail=str(e))
+
+
+@app.post("/v1/quote:batch")
+async def quote_batch(payloads: List[Dict[str, Any]], client_id: str = Depends(authenticate)) -> StreamingResponse:
+    """
+    Body: JSON array of quote payloads. Response: NDJSON, one line per row
+    ({index, raw_rate, final_rate, error}) streamed chunk by chunk.
+    Rows are validated by the batch path itself so one bad row does not
+    reject the whole request.
+    """
+    if len(payloads) > MAX_BATCH_ROWS:
+        raise HTTPException(status_code=413, detail=f"At most {MAX_BATCH_ROWS} rows per batch")
+
+    async def lines() -> AsyncIterator[bytes]:
+        for start in range(0, len(payloads), BATCH_CHUNK_ROWS):
+            chunk = payloads[start:start + BATCH_CHUNK_ROWS]
+            rows = await _in_pool(quote_many, chunk, client_id)
+            yield "".join(
+                json.dumps({**r, "index": r["index"] + start}) + "\n" for r in rows
+            ).encode("utf-8")
+
+    return StreamingResponse(lines(), media_type="application/x-ndjson")
+
+
+if __name__ == "__main__":
+    import uvicorn
+
+    uvicorn.run(app, host=os.environ.get("HOST", "127.0.0.1"), port=int(os.environ.get("PORT", 8000)))
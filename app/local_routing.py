@@ -0,0 +1,442 @@
+"""
+Local routing backend: driving distance and SALIK gates from a precomputed
+road graph, with no call to the Mapbox Directions API.
+
+    python app/local_routing.py build uae-latest.osm .cache/road_graph --hubs hubs.csv
+    python app/local_routing.py query .cache/road_graph "Jebel Ali Port" "Sharjah"
+
+    ROUTING_BACKEND=local      # always local
+    ROUTING_BACKEND=fallback   # Mapbox first, local when Mapbox is unreachable
+    ROUTING_GRAPH_DIR=.cache/road_graph
+
+`build` reads an OSM XML extract (.osm / .osm.bz2 / .osm.gz, e.g. from
+osmium cat uae-latest.osm.pbf -o uae.osm), keeps the drivable ways, and
+writes a directed CSR graph of the largest strongly connected component as
+plain .npy arrays:
+
+    indptr.npy   int64   (N+1,)  out-edges of node u: indices[indptr[u]:indptr[u+1]]
+    indices.npy  int32   (E,)    edge heads
+    weights.npy  float32 (E,)    edge length in metres (haversine)
+    latlon.npy   float64 (N, 2)
+    xyz.npy      float64 (N, 3)  unit vectors, for snapping and the A* bound
+    hub_dist.npy float32 (H, H)     hub-to-hub metres (hubs listed in meta.json)
+    hub_gates.npy int16  (H, H, G)  SALIK gates on each hub path, -1 padded
+
+Queries load everything with mmap (no parse, pages shared between worker
+processes). Places are resolved through the hub gazetteer first, then the
+geocode cache, then Mapbox geocoding if a token is set. Hub-to-hub pairs are
+a table lookup; any other pair runs A* on the CSR arrays with the chord
+distance as heuristic, and SALIK gates are detected on the path geometry
+with the same index as the Mapbox backend.
+"""
+from __future__ import annotations
+
+import argparse
+import bz2
+import csv
+import gzip
+import heapq
+import json
+import math
+import os
+import sys
+import threading
+import time
+import xml.etree.ElementTree as ET
+from functools import lru_cache
+from pathlib import Path
+from typing import Dict, IO, Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+ROOT = Path(__file__).resolve().parents[1]
+if str(ROOT) not in sys.path:  # ejecutado como script
+    sys.path.insert(0, str(ROOT))
+
+from src.metrics import stage
+from route_cache import GEOCODE_CACHE, normalize_query
+from route_features_mapbox import (EARTH_RADIUS_KM, SALIK_GATES, cached_geocode, features_dict,
+                                   salik_gates_on_route)
+
+ROUTING_GRAPH_DIR = Path(os.environ.get("ROUTING_GRAPH_DIR", ROOT / ".cache" / "road_graph"))
+GRAPH_FORMAT = 1
+EARTH_RADIUS_M = EARTH_RADIUS_KM * 1000.0
+SNAP_MAX_KM = 5.0  # más lejos que esto de cualquier carretera del grafo => no lo enrutamos
+
+DRIVABLE_HIGHWAYS = frozenset({
+    "motorway", "motorway_link", "trunk", "trunk_link", "primary", "primary_link",
+    "secondary", "secondary_link", "tertiary", "tertiary_link", "unclassified",
+    "residential", "living_street", "service", "road",
+})
+NO_ACCESS = frozenset({"no", "private"})
+
+
+# ——— build: OSM XML -> CSR ———
+def _open_osm(path: Path) -> IO[bytes]:
+    if path.suffix == ".pbf":
+        raise ValueError("PBF extracts need osmium: convert first with `osmium cat in.osm.pbf -o out.osm`")
+    if path.suffix == ".bz2":
+        return bz2.open(path, "rb")
+    if path.suffix == ".gz":
+        return gzip.open(path, "rb")
+    return open(path, "rb")
+
+
+def _iter_elements(path: Path, tag: str) -> Iterator[ET.Element]:
+    with _open_osm(path) as fh:
+        events = ET.iterparse(fh, events=("start", "end"))
+        _, root = next(events)
+        for event, elem in events:
+            if event != "end" or elem.tag not in ("node", "way", "relation"):
+                continue
+            if elem.tag == tag:
+                yield elem
+            # elem.clear() dejaría los elementos vacíos colgando de <osm>: se vacía la raíz
+            # (el extracto de los EAU no cabe entero en memoria como árbol)
+            root.clear()
+
+
+def _read_ways(path: Path) -> List[Tuple[List[int], int]]:
+    """Drivable ways as (node refs, direction): 0 both ways, 1 forward only, -1 backward only."""
+    ways = []
+    for way in _iter_elements(path, "way"):
+        tags = {t.get("k"): t.get("v") for t in way.iter("tag")}
+        if tags.get("highway") not in DRIVABLE_HIGHWAYS or tags.get("area") == "yes":
+            continue
+        if tags.get("access") in NO_ACCESS or tags.get("motor_vehicle") in NO_ACCESS:
+            continue
+        refs = [int(nd.get("ref")) for nd in way.iter("nd")]
+        if len(refs) < 2:
+            continue
+        oneway = tags.get("oneway", "")
+        if oneway in ("yes", "1", "true"):
+            direction = 1
+        elif oneway == "-1":
+            direction = -1
+        elif oneway == "no":
+            direction = 0
+        else:  # por defecto, autopistas y rotondas son de sentido único
+            direction = 1 if (tags.get("junction") == "roundabout" or tags["highway"] == "motorway") else 0
+        ways.append((refs, direction))
+    return ways
+
+
+def _read_nodes(path: Path, wanted: set) -> Dict[int, Tuple[float, float]]:
+    coords = {}
+    for node in _iter_elements(path, "node"):
+        osm_id = int(node.get("id"))
+        if osm_id in wanted:
+            coords[osm_id] = (float(node.get("lat")), float(node.get("lon")))
+    return coords
+
+
+def _unit_vectors(latlon: np.ndarray) -> np.ndarray:
+    lat, lon = np.radians(latlon[:, 0]), np.radians(latlon[:, 1])
+    return np.column_stack((np.cos(lat) * np.cos(lon), np.cos(lat) * np.sin(lon), np.sin(lat)))
+
+
+def _haversine_m(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    la1, lo1, la2, lo2 = map(np.radians, (a[:, 0], a[:, 1], b[:, 0], b[:, 1]))
+    h = np.sin((la2 - la1) / 2) ** 2 + np.cos(la1) * np.cos(la2) * np.sin((lo2 - lo1) / 2) ** 2
+    return 2 * EARTH_RADIUS_M * np.arcsin(np.sqrt(np.minimum(h, 1.0)))
+
+
+def build_graph(osm_path: Path) -> Dict[str, np.ndarray]:
+    """OSM XML -> CSR arrays of the largest strongly connected component."""
+    from scipy.sparse import coo_matrix
+    from scipy.sparse.csgraph import connected_components
+
+    ways = _read_ways(osm_path)
+    wanted = {ref for refs, _ in ways for ref in refs}
+    coords = _read_nodes(osm_path, wanted)
+
+    osm_ids = np.fromiter(sorted(coords), dtype=np.int64, count=len(coords))
+    index = {osm_id: i for i, osm_id in enumerate(osm_ids.tolist())}
+    latlon = np.array([coords[i] for i in osm_ids.tolist()], dtype=np.float64).reshape(-1, 2)
+
+    heads, tails = [], []
+    for refs, direction in ways:
+        # nodos fuera del extracto: la vía se parte ahí; sólo tramos entre refs consecutivas presentes
+        # (saltarse el hueco uniría sus dos orillas con una recta que no existe)
+        ids = [index.get(r, -1) for r in refs]
+        pairs = [(x, y) for x, y in zip(ids[:-1], ids[1:]) if x >= 0 and y >= 0]
+        a, b = [x for x, _ in pairs], [y for _, y in pairs]
+        if direction >= 0:
+            tails += a
+            heads += b
+        if direction <= 0:
+            tails += b
+            heads += a
+    u = np.asarray(tails, dtype=np.int64)
+    v = np.asarray(heads, dtype=np.int64)
+    keep = u != v
+    u, v = u[keep], v[keep]
+    w = _haversine_m(latlon[u], latlon[v])
+
+    # aristas repetidas (vías solapadas): nos quedamos con la más corta
+    order = np.lexsort((w, v, u))
+    u, v, w = u[order], v[order], w[order]
+    first = np.ones(len(u), dtype=bool)
+    first[1:] = (u[1:] != u[:-1]) | (v[1:] != v[:-1])
+    u, v, w = u[first], v[first], w[first]
+
+    n = len(latlon)
+    adj = coo_matrix((np.ones(len(u), dtype=np.int8), (u, v)), shape=(n, n)).tocsr()
+    _, labels = connected_components(adj, directed=True, connection="strong")
+    main = np.bincount(labels).argmax()
+    alive = labels == main
+    remap = np.full(n, -1, dtype=np.int64)
+    remap[alive] = np.arange(int(alive.sum()))
+    keep = alive[u] & alive[v]
+    u, v, w = remap[u[keep]], remap[v[keep]], w[keep]
+    latlon = latlon[alive]
+
+    indptr = np.zeros(len(latlon) + 1, dtype=np.int64)
+    np.cumsum(np.bincount(u, minlength=len(latlon)), out=indptr[1:])
+    return {
+        "indptr": indptr,
+        "indices": v.astype(np.int32),    # ya ordenadas por (u, v)
+        "weights": w.astype(np.float32),
+        "latlon": latlon,
+        "xyz": _unit_vectors(latlon),
+        "osm_ids": osm_ids[alive],
+    }
+
+
+def _read_hubs(path: Path) -> List[Dict]:
+    """CSV with name, lat, lon and an optional `aliases` column ("a|b|c")."""
+    with open(path, newline="", encoding="utf-8") as fh:
+        return [{"name": r["name"].strip(), "lat": float(r["lat"]), "lon": float(r["lon"]),
+                 "aliases": [a.strip() for a in (r.get("aliases") or "").split("|") if a.strip()]}
+                for r in csv.DictReader(fh)]
+
+
+def build_hub_tables(arrays: Dict[str, np.ndarray], hubs: List[Dict]) -> Dict[str, np.ndarray]:
+    """All-pairs hub distances (one Dijkstra per hub) and the SALIK gates on each path."""
+    from scipy.sparse import csr_matrix
+    from scipy.sparse.csgraph import dijkstra
+    from scipy.spatial import cKDTree
+
+    n = len(arrays["latlon"])
+    graph = csr_matrix((arrays["weights"].astype(np.float64), arrays["indices"], arrays["indptr"]), shape=(n, n))
+    _, nodes = cKDTree(arrays["xyz"]).query(_unit_vectors(np.array([[h["lat"], h["lon"]] for h in hubs])))
+    dist, pred = dijkstra(graph, directed=True, indices=nodes, return_predecessors=True)
+
+    H, G = len(hubs), len(SALIK_GATES)
+    hub_dist = dist[:, nodes].astype(np.float32)
+    hub_gates = np.full((H, H, G), -1, dtype=np.int16)  # int8 se desbordaría con ids de gate >127
+    for i in range(H):
+        for j in range(H):
+            if i == j or not np.isfinite(hub_dist[i, j]):
+                continue
+            path = [nodes[j]]
+            while path[-1] != nodes[i]:
+                path.append(pred[i, path[-1]])
+            crossed = salik_gates_on_route(arrays["latlon"][path[::-1]])
+            hub_gates[i, j, :len(crossed)] = crossed
+    return {"hub_nodes": nodes.astype(np.int64), "hub_dist": hub_dist, "hub_gates": hub_gates}
+
+
+def build(osm_path: Path, out_dir: Path, hubs_csv: Optional[Path] = None) -> Dict:
+    t0 = time.perf_counter()
+    arrays = build_graph(osm_path)
+    meta = {
+        "format": GRAPH_FORMAT,
+        "source": osm_path.name,
+        "built_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "nodes": int(len(arrays["latlon"])),
+        "edges": int(len(arrays["indices"])),
+        "salik_gates": [list(g) for g in SALIK_GATES],
+        "hubs": [],
+    }
+    if hubs_csv is not None:
+        hubs = _read_hubs(hubs_csv)
+        tables = build_hub_tables(arrays, hubs)
+        arrays.update(tables)
+        meta["hubs"] = [{**h, "node": int(n)} for h, n in zip(hubs, tables["hub_nodes"].tolist())]
+        del arrays["hub_nodes"]
+
+    out_dir.mkdir(parents=True, exist_ok=True)
+    for name, arr in arrays.items():
+        np.save(out_dir / f"{name}.npy", np.ascontiguousarray(arr))
+    meta["build_s"] = round(time.perf_counter() - t0, 2)
+    # meta.json al final: un directorio sin él es un build a medias
+    (out_dir / "meta.json").write_text(json.dumps(meta, indent=2) + "\n", encoding="utf-8")
+    return meta
+
+
+# ——— consultas ———
+class LocalRouter:
+    """Read-only queries on a graph directory written by build()."""
+
+    def __init__(self, graph_dir: Path):
+        self.graph_dir = Path(graph_dir)
+        meta_path = self.graph_dir / "meta.json"
+        if not meta_path.exists():
+            raise RuntimeError(f"No road graph at {self.graph_dir} (run: python app/local_routing.py build)")
+        self.meta = json.loads(meta_path.read_text(encoding="utf-8"))
+        if self.meta.get("format") != GRAPH_FORMAT:
+            raise RuntimeError(f"Road graph format {self.meta.get('format')} != {GRAPH_FORMAT}; rebuild it")
+
+        load = lambda name: np.load(self.graph_dir / f"{name}.npy", mmap_mode="r")
+        self.latlon = load("latlon")
+        self.xyz = load("xyz")
+        # el bucle de A* lee de memoryviews: indexar un memoryview devuelve float/int de Python
+        self._indptr = memoryview(load("indptr"))
+        self._indices = memoryview(load("indices"))
+        self._weights = memoryview(load("weights"))
+        self._x, self._y, self._z = (memoryview(np.ascontiguousarray(self.xyz[:, k])) for k in range(3))
+        self._tree = None
+        self._tree_lock = threading.Lock()
+
+        self.hubs: List[Dict] = self.meta.get("hubs", [])
+        self._hub_by_name: Dict[str, int] = {}
+        self._hub_by_node: Dict[int, int] = {}
+        for i, h in enumerate(self.hubs):
+            for name in (h["name"], *h.get("aliases", [])):
+                self._hub_by_name[normalize_query(name)] = i
+            self._hub_by_node.setdefault(h["node"], i)
+        # gates distintos a los del build => la tabla de gates no vale (las distancias sí)
+        self._hub_gates_valid = self.meta.get("salik_gates") == [list(g) for g in SALIK_GATES]
+        if self.hubs:
+            self.hub_dist = load("hub_dist")
+            self.hub_gates = load("hub_gates")
+        self._route_nodes = lru_cache(maxsize=4096)(self._route_nodes_uncached)
+
+    @property
+    def tree(self):
+        if self._tree is None:
+            with self._tree_lock:
+                if self._tree is None:
+                    from scipy.spatial import cKDTree
+                    self._tree = cKDTree(self.xyz)
+        return self._tree
+
+    # — lugares —
+    def resolve(self, text: str, online: bool = True) -> Dict[str, float]:
+        """Place text -> {"lat", "lon"}: hub gazetteer, geocode cache, then Mapbox if online and configured."""
+        key = normalize_query(text)
+        hub = self._hub_by_name.get(key)
+        if hub is not None:
+            return {"lat": self.hubs[hub]["lat"], "lon": self.hubs[hub]["lon"]}
+        cached = GEOCODE_CACHE.get(key)
+        if cached is not None:
+            return cached
+        token = os.environ.get("MAPBOX_TOKEN")
+        if token and online:
+            return cached_geocode(text, token)
+        raise ValueError(f"Unknown place for local routing (not a hub, not cached): {text!r}")
+
+    def snap(self, point: Dict[str, float]) -> int:
+        dist, node = self.tree.query(_unit_vectors(np.array([[point["lat"], point["lon"]]]))[0])
+        if 2 * math.asin(min(dist / 2, 1.0)) * EARTH_RADIUS_KM > SNAP_MAX_KM:
+            raise ValueError(f"No road within {SNAP_MAX_KM:g} km of ({point['lat']}, {point['lon']})")
+        return int(node)
+
+    # — rutas —
+    def astar(self, source: int, target: int) -> Tuple[float, List[int]]:
+        """Shortest path on the CSR graph; heuristic = chord length (never above the road distance)."""
+        if source == target:
+            return 0.0, [source]
+        indptr, indices, weights = self._indptr, self._indices, self._weights
+        X, Y, Z = self._x, self._y, self._z
+        tx, ty, tz = X[target], Y[target], Z[target]
+        # 1 - 1e-6: margen para el redondeo float32 de los pesos, así h sigue siendo consistente
+        scale = EARTH_RADIUS_M * (1 - 1e-6)
+        sqrt, push, pop = math.sqrt, heapq.heappush, heapq.heappop
+
+        g = {source: 0.0}
+        parent = {source: -1}
+        closed = set()
+        heap = [(0.0, source)]
+        while heap:
+            _, u = pop(heap)
+            if u == target:
+                break
+            if u in closed:
+                continue
+            closed.add(u)
+            gu = g[u]
+            for k in range(indptr[u], indptr[u + 1]):
+                v = indices[k]
+                gv = gu + weights[k]
+                if gv < g.get(v, math.inf):
+                    g[v] = gv
+                    parent[v] = u
+                    dx, dy, dz = X[v] - tx, Y[v] - ty, Z[v] - tz
+                    push(heap, (gv + scale * sqrt(dx * dx + dy * dy + dz * dz), v))
+        else:
+            raise ValueError("No route found")
+
+        path = [target]
+        while path[-1] != source:
+            path.append(parent[path[-1]])
+        return g[target], path[::-1]
+
+    def _route_nodes_uncached(self, source: int, target: int) -> Tuple[float, Tuple[int, ...], str]:
+        """(distance m, gates crossed, provider) between two graph nodes."""
+        i, j = self._hub_by_node.get(source), self._hub_by_node.get(target)
+        if i is not None and j is not None and self._hub_gates_valid:
+            gates = self.hub_gates[i, j]
+            return float(self.hub_dist[i, j]), tuple(int(x) for x in gates[gates >= 0]), "local:hub-table"
+        distance, path = self.astar(source, target)
+        with stage("salik"):
+            crossed = salik_gates_on_route(self.latlon[path])
+        return distance, tuple(crossed), "local:csr-astar"
+
+    def route(self, o: Dict[str, float], d: Dict[str, float]) -> Tuple[float, Tuple[int, ...], str]:
+        return self._route_nodes(self.snap(o), self.snap(d))
+
+    def route_features(self, origin_text: str, destination_text: str, online: bool = True) -> Dict:
+        with stage("geocode"):
+            o, d = self.resolve(origin_text, online), self.resolve(destination_text, online)
+        with stage("route"):
+            distance, crossed, provider = self.route(o, d)
+        return features_dict(o, d, distance, crossed, origin_text, destination_text, provider)
+
+
+_router: Optional[LocalRouter] = None
+_router_lock = threading.Lock()
+
+
+def get_router(graph_dir: Optional[Path] = None) -> LocalRouter:
+    """Process-wide router on ROUTING_GRAPH_DIR (or graph_dir, which replaces it)."""
+    global _router
+    with _router_lock:
+        if _router is None or (graph_dir is not None and Path(graph_dir) != _router.graph_dir):
+            _router = LocalRouter(graph_dir or ROUTING_GRAPH_DIR)
+        return _router
+
+
+def local_route_features(origin_text: str, destination_text: str, online: bool = True) -> Dict:
+    """online=False: Mapbox just failed, resolve places from the hubs and the geocode cache only."""
+    return get_router().route_features(origin_text, destination_text, online)
+
+
+# ——— CLI ———
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    ap = argparse.ArgumentParser(description="Build or query the local road graph.")
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    b = sub.add_parser("build", help="OSM XML extract -> CSR graph directory")
+    b.add_argument("osm", type=Path)
+    b.add_argument("out_dir", type=Path, nargs="?", default=ROUTING_GRAPH_DIR)
+    b.add_argument("--hubs", type=Path, help="CSV name,lat,lon[,aliases] for the hub distance table")
+    q = sub.add_parser("query", help="route features between two places")
+    q.add_argument("graph_dir", type=Path)
+    q.add_argument("origin")
+    q.add_argument("destination")
+    args = ap.parse_args(argv)
+
+    if args.cmd == "build":
+        meta = build(args.osm, args.out_dir, args.hubs)
+        print(json.dumps({k: v for k, v in meta.items() if k != "hubs"} | {"hubs": len(meta["hubs"])}, indent=2))
+    else:
+        router = get_router(args.graph_dir)
+        t0 = time.perf_counter()
+        result = router.route_features(args.origin, args.destination)
+        print(json.dumps({**result, "elapsed_ms": round(1000 * (time.perf_counter() - t0), 3)}, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -52,9 +52,14 @@ def postprocess_rate(raw_rate: float, vehicle_type: str, rules: dict) -> dict:
     return steps
 
 
-import json, os
+import hashlib, json, logging, os, threading, time
 from pathlib import Path
-from typing import Any, Dict, Optional
+from types import MappingProxyType
+from typing import Any, Dict, Mapping, Optional, Sequence, Tuple, Union
+
+import numpy as np
+
+from src.metrics import stage
 
 # Defaults (por si falta algún campo en el JSON del cliente)
 DEFAULT_RULES: Dict[str, Any] = {
@@ -64,7 +69,10 @@ DEFAULT_RULES: Dict[str, Any] = {
 
 CLIENTS_DIR = Path(os.environ.get("CLIENTS_DIR", Path(__file__).resolve().parents[1] / "clients"))
 
-_cache: Dict[str, Dict[str, Any]] = {}  # client_id -> {"rules": dict, "mtime": float}
+RULES_FILENAME = "pricing_rules.json"
+RULES_POLL_INTERVAL_S = float(os.environ.get("RULES_POLL_INTERVAL_S", 2.0))  # 0 = sin watcher
+
+log = logging.getLogger(__name__)
 
 def _safe_merge(base: Dict[str, Any], inc: Dict[str, Any]) -> Dict[str, Any]:
     out = base.copy()
@@ -75,22 +83,188 @@ def _safe_merge(base: Dict[str, Any], inc: Dict[str, Any]) -> Dict[str, Any]:
             out[k] = v
     return out
 
+
+class RulesValidationError(ValueError):
+    """pricing_rules.json is not valid; the previous version stays live."""
+
+
+def _number(value: Any, where: str, minimum: float = 0.0) -> float:
+    if isinstance(value, bool) or not isinstance(value, (int, float)):
+        raise RulesValidationError(f"{where} must be a number, got {value!r}")
+    if not (value >= minimum) or value != value or value in (float("inf"), float("-inf")):
+        raise RulesValidationError(f"{where} must be a finite number >= {minimum}, got {value!r}")
+    return float(value)
+
+def validate_rules(data: Any) -> Dict[str, Any]:
+    """Checks a client's JSON (before merging defaults); returns it unchanged."""
+    if not isinstance(data, dict):
+        raise RulesValidationError("rules must be a JSON object")
+    g = data.get("global", {})
+    if not isinstance(g, dict):
+        raise RulesValidationError("'global' must be an object")
+    if "round_to" in g:
+        _number(g["round_to"], "global.round_to", minimum=1)
+    for key in ("fixed_charges_aed", "gate_in_out_aed"):
+        if key in g:
+            _number(g[key], f"global.{key}")
+    mins = data.get("vehicle_minimums", {})
+    if not isinstance(mins, dict):
+        raise RulesValidationError("'vehicle_minimums' must be an object")
+    for vehicle, value in mins.items():
+        _number(value, f"vehicle_minimums.{vehicle}")
+    return data
+
+
+class ClientRules:
+    """Merged, validated and read-only rule set for one client."""
+    __slots__ = ("client_id", "round_to", "fixed_charges_aed", "gate_in_out_aed",
+                 "vehicle_minimums", "minimums_index", "minimums_table", "version", "_merged")
+
+    def __init__(self, client_id: str, merged: Dict[str, Any]):
+        g = merged.get("global", {})
+        mins = {str(k): float(v) for k, v in merged.get("vehicle_minimums", {}).items()}
+        canonical = json.dumps(merged, sort_keys=True, separators=(",", ":"))
+        values = {
+            "client_id": client_id,
+            "round_to": int(g.get("round_to", 5)),
+            "fixed_charges_aed": float(g.get("fixed_charges_aed", 0.0)),
+            "gate_in_out_aed": float(g.get("gate_in_out_aed", 0.0)),
+            "vehicle_minimums": MappingProxyType(mins),
+            # lookup precompilado para postprocess_rates (último hueco = vehículo desconocido)
+            "minimums_index": MappingProxyType({v: i for i, v in enumerate(mins)}),
+            "minimums_table": np.array(list(mins.values()) + [0.0], dtype=np.float64),
+            "version": hashlib.sha1(canonical.encode("utf-8")).hexdigest()[:12],
+            "_merged": canonical,
+        }
+        values["minimums_table"].setflags(write=False)
+        for name, value in values.items():
+            object.__setattr__(self, name, value)
+
+    def __setattr__(self, name: str, value: Any) -> None:
+        raise AttributeError("ClientRules is read-only")
+
+    def __repr__(self) -> str:
+        return f"ClientRules({self.client_id!r}, version={self.version!r})"
+
+    def minimum_for(self, vehicle_type: str) -> float:
+        return self.vehicle_minimums.get(vehicle_type, 0.0)
+
+    def as_dict(self) -> Dict[str, Any]:
+        """Fresh nested dict (safe for callers to mutate or serialize)."""
+        return json.loads(self._merged)
+
+
+class RulesStore:
+    """
+    All clients/*/pricing_rules.json loaded once, validated and frozen.
+
+    Lookups are a dict read: no exists()/stat() per quote. A polling
+    watcher thread re-stats the directory every `poll_interval` seconds,
+    rebuilds changed clients off to the side and swaps the whole mapping in
+    one assignment. Invalid files are rejected and the last good version
+    (or the defaults) stays live.
+    """
+
+    def __init__(self, clients_dir: Path, poll_interval: float = RULES_POLL_INTERVAL_S):
+        self.clients_dir = Path(clients_dir)
+        self.poll_interval = poll_interval
+        self.default = ClientRules("__default__", DEFAULT_RULES)
+        self._rules: Mapping[str, ClientRules] = MappingProxyType({})
+        self._stamps: Dict[str, Tuple[int, int]] = {}
+        self._lock = threading.Lock()
+        self._watcher: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+        self.errors: Dict[str, str] = {}
+        self.counters = {"reloads": 0, "rejected": 0, "lookups": 0, "lookup_ns": 0}
+        self.refresh()
+
+    def _scan(self) -> Dict[str, Tuple[Path, Tuple[int, int]]]:
+        found = {}
+        if self.clients_dir.is_dir():
+            for path in self.clients_dir.glob(f"*/{RULES_FILENAME}"):
+                try:
+                    st = path.stat()
+                except OSError:
+                    continue
+                found[path.parent.name] = (path, (st.st_mtime_ns, st.st_size))
+        return found
+
+    def refresh(self) -> int:
+        """Reloads changed/new/removed files; returns the number of clients swapped."""
+        with self._lock:
+            found = self._scan()
+            current = dict(self._rules)
+            changed = 0
+            for client_id in set(current) - set(found):
+                del current[client_id]
+                self._stamps.pop(client_id, None)
+                changed += 1
+            for client_id, (path, stamp) in found.items():
+                if self._stamps.get(client_id) == stamp:
+                    continue
+                self._stamps[client_id] = stamp
+                try:
+                    data = validate_rules(json.loads(path.read_text(encoding="utf-8")))
+                except (OSError, ValueError) as e:  # JSONDecodeError y RulesValidationError son ValueError
+                    self.counters["rejected"] += 1
+                    self.errors[client_id] = f"{path}: {e}"
+                    log.error("Rejected pricing rules for %s: %s", client_id, e)
+                    continue
+                current[client_id] = ClientRules(client_id, _safe_merge(DEFAULT_RULES, data))
+                self.errors.pop(client_id, None)
+                changed += 1
+            if changed:
+                self._rules = MappingProxyType(current)  # swap atómico
+                self.counters["reloads"] += changed
+            return changed
+
+    def get(self, client_id: str) -> ClientRules:
+        t0 = time.perf_counter_ns()
+        rules = self._rules.get(client_id, self.default)
+        self.counters["lookups"] += 1
+        self.counters["lookup_ns"] += time.perf_counter_ns() - t0
+        return rules
+
+    def start_watcher(self) -> None:
+        if self.poll_interval <= 0 or (self._watcher is not None and self._watcher.is_alive()):
+            return
+        self._stop.clear()
+
+        def run() -> None:
+            while not self._stop.wait(self.poll_interval):
+                try:
+                    self.refresh()
+                except Exception:
+                    log.exception("Pricing rules refresh failed")
+
+        self._watcher = threading.Thread(target=run, name="rules-watcher", daemon=True)
+        self._watcher.start()
+
+    def stop_watcher(self) -> None:
+        self._stop.set()
+        if self._watcher is not None:
+            self._watcher.join(timeout=5)
+            self._watcher = None
+
+    def stats(self) -> Dict[str, Any]:
+        c = dict(self.counters)
+        c["avg_lookup_ns"] = round(c["lookup_ns"] / c["lookups"], 1) if c["lookups"] else 0.0
+        c["clients"] = {k: v.version for k, v in self._rules.items()}
+        c["errors"] = dict(self.errors)
+        return c
+
+
+# El watcher lo arranca quien sirve tráfico (lifespan de la API, get_rules_store del
+# portal): importar el módulo (tests, scripts, workers de reprice) no crea hilos.
+RULES_STORE = RulesStore(CLIENTS_DIR)
+
+def get_client_rules(client_id: str) -> ClientRules:
+    """Frozen rules for a client (defaults if it has no valid pricing_rules.json)."""
+    return RULES_STORE.get(client_id)
+
 def get_rules_for_client(client_id: str) -> Dict[str, Any]:
-    """Lee clients/<client_id>/pricing_rules.json con caché y mezcla defaults."""
-    rules_path = CLIENTS_DIR / client_id / "pricing_rules.json"
-    if not rules_path.exists():
-        # Fallback: si no existe, usa defaults (o levanta error en app.py si prefieres)
-        return DEFAULT_RULES
-
-    mtime = rules_path.stat().st_mtime
-    cached = _cache.get(client_id)
-    if cached and cached.get("mtime") == mtime:
-        return cached["rules"]
-
-    data = json.loads(rules_path.read_text(encoding="utf-8"))
-    merged = _safe_merge(DEFAULT_RULES, data)
-    _cache[client_id] = {"rules": merged, "mtime": mtime}
-    return merged
+    """Reglas de clients/<client_id>/pricing_rules.json mezcladas con defaults (copia propia)."""
+    return RULES_STORE.get(client_id).as_dict()
 
 # ——— utilidades de postprocesado (igual que ya tenías) ———
 def apply_minimum(rate: float, vehicle_type: str, rules: Dict[str, Any]) -> float:
@@ -103,11 +277,24 @@ def add_fixed_charges(rate: float, rules: Dict[str, Any]) -> float:
 def round_to_multiple(value: float, multiple: int) -> float:
     return round(value / multiple) * multiple  # si quieres “ceil”, cámbialo
 
-def postprocess_rate(raw_rate: float, vehicle_type: str, rules: Dict[str, Any]) -> Dict[str, Any]:
+RulesLike = Union["ClientRules", Dict[str, Any]]
+
+def _rule_values(rules: RulesLike, vehicle_type: str) -> Tuple[float, float, float, int]:
+    """(vehicle minimum, doc fee, gate in/out, round_to) from frozen or dict rules."""
+    if isinstance(rules, ClientRules):
+        return (rules.vehicle_minimums.get(vehicle_type, 0.0), rules.fixed_charges_aed,
+                rules.gate_in_out_aed, rules.round_to)
+    g = rules.get("global", {})
+    return (float(rules.get("vehicle_minimums", {}).get(vehicle_type, 0.0)),
+            float(g.get("fixed_charges_aed", 0.0)), float(g.get("gate_in_out_aed", 0.0)),
+            int(g.get("round_to", 5)))
+
+@stage("postprocess")
+def postprocess_rate(raw_rate: float, vehicle_type: str, rules: RulesLike) -> Dict[str, Any]:
+    vehicle_min, doc_fee, gate, multiple = _rule_values(rules, vehicle_type)
     r = float(round(raw_rate, 2))
-    after_min = apply_minimum(r, vehicle_type, rules)
-    after_fixed = add_fixed_charges(after_min, rules)
-    multiple = int(rules.get("global", {}).get("round_to", 5))
+    after_min = max(r, vehicle_min)
+    after_fixed = after_min + doc_fee + gate
     final = round_to_multiple(after_fixed, multiple)
     return {
         "raw_rate": round(r, 2),
@@ -116,8 +303,79 @@ def postprocess_rate(raw_rate: float, vehicle_type: str, rules: Dict[str, Any])
         "final_rate": round(final, 2),
         "rounded_multiple": multiple,
         "fixed_charges": {
-            "doc_fee": float(rules.get("global", {}).get("fixed_charges_aed", 0.0)),
-            "gate_in_out": float(rules.get("global", {}).get("gate_in_out_aed", 0.0)),
+            "doc_fee": doc_fee,
+            "gate_in_out": gate,
         },
-        "vehicle_minimum_applied": float(rules.get("vehicle_minimums", {}).get(vehicle_type, 0.0)),
-    }
\ No newline at end of file
+        "vehicle_minimum_applied": vehicle_min,
+    }
+
+
+# ——— versión columnar (repricing masivo) ———
+def _round2(values: np.ndarray) -> np.ndarray:
+    """
+    Elementwise Python round(x, 2). np.round(x, 2) computes rint(x*100)/100,
+    which equals Python's correctly-rounded result except when x*100 lands
+    next to a .5 tie (or overflows); those few rows are redone with round().
+    """
+    out = np.round(values, 2)
+    scaled = values * 100.0
+    near_tie = np.abs(scaled - np.floor(scaled) - 0.5) <= np.abs(scaled) * 1e-12 + 1e-9
+    suspect = (near_tie | ~(np.abs(values) < 1e15)) & ~np.isnan(values)
+    if suspect.any():
+        out[suspect] = [round(v, 2) for v in values[suspect].tolist()]
+    return out
+
+def compile_vehicle_minimums(rules: RulesLike) -> Tuple[Mapping[str, int], np.ndarray]:
+    """vehicle_type -> index into a float64 minimums array (last slot = unknown -> 0.0)."""
+    if isinstance(rules, ClientRules):
+        return rules.minimums_index, rules.minimums_table
+    mins = rules.get("vehicle_minimums", {})
+    index = {v: i for i, v in enumerate(mins)}
+    table = np.array([float(m) for m in mins.values()] + [0.0], dtype=np.float64)
+    return index, table
+
+@stage("postprocess_batch")
+def postprocess_rates(raw_rates: Sequence[float], vehicle_types: Sequence[str],
+                      client_id: Optional[str] = None, rules: Optional[RulesLike] = None):
+    """
+    Columnar postprocess_rate: same steps and same rounding, one NumPy pass.
+
+    Returns a DataFrame with raw_rate, after_minimum, after_fixed_charges,
+    final_rate, rounded_multiple, doc_fee, gate_in_out and
+    vehicle_minimum_applied. NaN raw rates (failed predictions) stay NaN.
+    """
+    import pandas as pd
+
+    if rules is None:
+        if client_id is None:
+            raise ValueError("Pass client_id or rules")
+        rules = get_client_rules(client_id)
+    raw = np.asarray(raw_rates, dtype=np.float64)
+    vehicles = np.asarray(vehicle_types, dtype=object)
+    if raw.shape != vehicles.shape:
+        raise ValueError("raw_rates and vehicle_types must have the same length")
+
+    index, table = compile_vehicle_minimums(rules)
+    unknown = len(table) - 1
+    inverse, uniq = pd.factorize(vehicles, use_na_sentinel=False)  # hash, sin ordenar strings
+    codes = np.array([index.get(v, unknown) for v in uniq.tolist()], dtype=np.intp)[inverse]
+    vehicle_min = table[codes]
+
+    _, doc_fee, gate, multiple = _rule_values(rules, "")
+
+    r = _round2(raw)
+    after_min = np.maximum(r, vehicle_min)
+    after_fixed = after_min + doc_fee + gate
+    final = np.rint(after_fixed / multiple) * multiple  # rint = round-half-even, como round()
+
+    n = len(raw)
+    return pd.DataFrame({
+        "raw_rate": r,
+        "after_minimum": _round2(after_min),
+        "after_fixed_charges": _round2(after_fixed),
+        "final_rate": final,
+        "rounded_multiple": np.full(n, multiple, dtype=np.int64),
+        "doc_fee": np.full(n, doc_fee),
+        "gate_in_out": np.full(n, gate),
+        "vehicle_minimum_applied": vehicle_min,
+    })
@@ -0,0 +1,106 @@
+import hashlib
+import json
+import os
+import sys
+import threading
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+ROOT = Path(__file__).resolve().parents[1]
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+
+from cachetools import TTLCache
+
+from route_cache import SqliteStore
+from src.inference import FEATURE_COLUMNS, NUMERIC_FEATURES
+
+# Caché de cotizaciones completas (modelo + reglas + postprocesado).
+# La clave incluye la versión del modelo (sha del .joblib) y la de las reglas
+# del cliente (hash de contenido), así que un modelo reentrenado o un
+# pricing_rules.json nuevo invalidan solos las entradas viejas.
+QUOTE_CACHE_TTL_S = float(os.environ.get("QUOTE_CACHE_TTL_S", 600))
+QUOTE_CACHE_SIZE = int(os.environ.get("QUOTE_CACHE_SIZE", 4096))
+QUOTE_CACHE_DB = os.environ.get("QUOTE_CACHE_DB")  # SQLite compartido entre workers (opcional)
+
+_NUMERIC = frozenset(NUMERIC_FEATURES)
+
+
+def canonical_payload(payload: Dict[str, Any]) -> Optional[str]:
+    """
+    Stable JSON of the 18 model fields exactly as the model sees them; None
+    if incomplete or not cacheable. Strings are not stripped and numbers are
+    not parsed from text: " Jebel Ali Port" is another category for the
+    model, so it must be another key. Only int vs float is folded (the model
+    scores 30 and 30.0 the same).
+    """
+    out = []
+    for col in FEATURE_COLUMNS:
+        v = payload.get(col)
+        if v is None:
+            return None
+        if col in _NUMERIC:
+            if isinstance(v, bool) or not isinstance(v, (int, float)):
+                return None  # texto/bool: que lo valide el modelo, sin caché
+            v = float(v)
+        elif not isinstance(v, str):
+            return None
+        out.append(v)
+    return json.dumps(out, separators=(",", ":"), ensure_ascii=False)
+
+
+def quote_key(payload: Dict[str, Any], client_id: str, model_version: str, rules_version: str) -> Optional[str]:
+    canon = canonical_payload(payload)
+    if canon is None:
+        return None
+    raw = f"{client_id}|{model_version}|{rules_version}|{canon}"
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+class QuoteCache:
+    """LRU + TTL in memory, optionally backed by a SQLite file shared by workers."""
+
+    def __init__(self, maxsize: int = QUOTE_CACHE_SIZE, ttl: float = QUOTE_CACHE_TTL_S,
+                 shared_path: Optional[str] = QUOTE_CACHE_DB):
+        self.ttl = ttl
+        self._mem: TTLCache = TTLCache(maxsize=maxsize, ttl=ttl)
+        self._lock = threading.Lock()
+        self._shared = SqliteStore(Path(shared_path)) if shared_path else None
+        self.counters = {"hits": 0, "shared_hits": 0, "misses": 0}
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            value = self._mem.get(key)
+        if value is not None:
+            self.counters["hits"] += 1
+            return value
+        if self._shared is not None:
+            found = self._shared.get("quote", key)
+            if found is not None:
+                with self._lock:
+                    self._mem[key] = found[0]
+                self.counters["shared_hits"] += 1
+                return found[0]
+        self.counters["misses"] += 1
+        return None
+
+    def set(self, key: str, value: Dict[str, Any]) -> None:
+        with self._lock:
+            self._mem[key] = value
+        if self._shared is not None:
+            self._shared.set("quote", key, value, self.ttl)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._mem.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        c = dict(self.counters)
+        lookups = c["hits"] + c["shared_hits"] + c["misses"]
+        c["hit_ratio"] = round((c["hits"] + c["shared_hits"]) / lookups, 4) if lookups else 0.0
+        c["size"] = len(self._mem)
+        c["shared"] = self._shared is not None
+        return c
+
+
+QUOTE_CACHE = QuoteCache()
@@ -0,0 +1,80 @@
+import copy
+import sys
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+ROOT = Path(__file__).resolve().parents[1]
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+
+from src.inference import get_model_entry, predict_many, predict_one_fast
+from src.metrics import profile_if_slow, stage
+from pricing_rules import get_client_rules, postprocess_rate, postprocess_rates
+from quote_cache import QUOTE_CACHE, quote_key
+from rate_cards import RATE_CARDS
+
+# Cadena completa de cotización: modelo -> reglas del cliente -> postprocesado.
+# La usan la API (app/api.py) y el portal para no duplicar el orden de pasos.
+
+
+def cache_lookup(payload: Dict[str, Any], client_id: str) -> Tuple[Optional[str], Optional[Dict[str, Any]]]:
+    """(cache key, cached quote or None). The key is None for payloads that can't be cached."""
+    card = RATE_CARDS.lookup(payload, client_id)  # tarifa de contrato precalculada: dict nuevo, nada que guardar
+    if card is not None:
+        return None, card
+    key = quote_key(payload, client_id, get_model_entry(client_id=client_id).version,
+                    get_client_rules(client_id).version)
+    hit = QUOTE_CACHE.get(key) if key is not None else None
+    # copia: que nadie pueda modificar la entrada compartida
+    return key, (copy.deepcopy(hit) if hit is not None else None)
+
+
+def cache_store(key: Optional[str], result: Dict[str, Any]) -> None:
+    if key is not None:
+        QUOTE_CACHE.set(key, copy.deepcopy(result))
+
+
+def quote(payload: Dict[str, Any], client_id: str, use_cache: bool = True) -> Dict[str, Any]:
+    """Contract rate card first (app/rate_cards.py), else cached on (payload, model version, rules version)."""
+    with profile_if_slow("quote"):
+        key = None
+        if use_cache:
+            with stage("quote_cache"):
+                key, hit = cache_lookup(payload, client_id)
+            if hit is not None:
+                return hit
+        result = finish_quote(predict_one_fast(payload, client_id=client_id), payload, client_id)
+        cache_store(key, result)
+        return result
+
+
+def finish_quote(raw: float, payload: Dict[str, Any], client_id: str) -> Dict[str, Any]:
+    """Rules + postprocessing for a raw model rate (e.g. from the micro-batcher)."""
+    rules = get_client_rules(client_id)
+    pp = postprocess_rate(raw, payload["vehicle_type"], rules)
+    return {
+        "client_id": client_id,
+        "raw_rate": pp["raw_rate"],
+        "final_rate": pp["final_rate"],
+        "breakdown": pp,
+        "model_version": get_model_entry(client_id=client_id).version,
+        "rules_version": rules.version,
+    }
+
+
+def quote_many(payloads: Sequence[Dict[str, Any]], client_id: str) -> List[Dict[str, Any]]:
+    """One vectorized predict for the batch; failed rows carry `error` instead of rates."""
+    raw_rates, errors = predict_many(payloads, return_errors=True, client_id=client_id)
+    by_row: Dict[int, str] = dict(errors)
+    vehicles = [p.get("vehicle_type") if isinstance(p, dict) else None for p in payloads]
+    pp = postprocess_rates(raw_rates, vehicles, rules=get_client_rules(client_id))
+    raw_col = pp["raw_rate"].tolist()
+    final_col = pp["final_rate"].tolist()
+    out: List[Dict[str, Any]] = []
+    for i in range(len(payloads)):
+        err: Optional[str] = by_row.get(i)
+        if err is None:
+            out.append({"index": i, "raw_rate": raw_col[i], "final_rate": final_col[i], "error": None})
+        else:
+            out.append({"index": i, "raw_rate": None, "final_rate": None, "error": err})
+    return out
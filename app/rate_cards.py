@@ -0,0 +1,388 @@
+"""
+Precomputed rate cards for contract clients.
+
+    python app/rate_cards.py build acme        # score the grid and write the card
+    python app/rate_cards.py show acme         # versions, rows and freshness
+
+clients/<id>/rate_card.json lists the client's standard lanes and the
+vehicle types, load types and months the contract covers:
+
+    {"defaults": {"client_type": "retailer", "load_weight_tons": 3.2, ...},
+     "lanes": [{"origin": "Jebel Ali Port", "destination": "Al Quoz",
+                "distance_km": 30.0, "salik_gates": 2, ...}],
+     "vehicle_types": ["van", "7t_truck"], "load_types": ["dry"],
+     "months": [1, 2, ..., 12], "calendar": {"7": {"weather": "hot"}}}
+
+(full example: benchmarks/fixtures/rate_card_example.json). Clients
+without that file have no card and are always quoted live.
+
+Every (lane, vehicle, load_type, month) row is a full contract payload
+(lane fields over `defaults`, season by month unless `calendar` says
+otherwise). The grid is scored in one predict_many + postprocess_rates
+pass and stored as Parquet under RATE_CARD_DIR, with a uint64 hash of
+the canonical payload (quote_cache.canonical_payload) per row. Loading a
+card turns that column into a dict, so a quote is served by one hash and
+one dict read. Only payloads that equal a card row field by field hit;
+anything else (another fuel price, a lane not in the card) goes live.
+
+The card records the model, rules and spec versions it was built with.
+A lookup that finds any of them changed ignores the card and rebuilds it
+in a background thread (RATE_CARD_AUTOBUILD=0: only cards built with the
+CLI are served, and never stale ones).
+"""
+import argparse
+import hashlib
+import itertools
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+ROOT = Path(__file__).resolve().parents[1]
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+
+from src.inference import FEATURE_COLUMNS, get_model_entry, predict_many
+from src.metrics import stage
+from pricing_rules import CLIENTS_DIR, get_client_rules, postprocess_rates
+from quote_cache import canonical_payload
+
+RATE_CARD_DIR = Path(os.environ.get("RATE_CARD_DIR", ROOT / ".cache" / "rate_cards"))
+RATE_CARD_AUTOBUILD = os.environ.get("RATE_CARD_AUTOBUILD", "1") != "0"
+RATE_CARD_CHECK_S = float(os.environ.get("RATE_CARD_CHECK_S", 2.0))  # re-stat del spec como mucho cada N s
+SPEC_FILENAME = "rate_card.json"
+
+GRID_FIELDS = ("origin", "destination", "vehicle_type", "load_type", "month")
+RATE_COLUMNS = ("raw_rate", "after_minimum", "after_fixed_charges", "final_rate", "vehicle_minimum_applied")
+DEFAULT_SEASONS = {12: "winter", 1: "winter", 2: "winter", 3: "spring", 4: "spring", 5: "spring",
+                   6: "summer", 7: "summer", 8: "summer", 9: "autumn", 10: "autumn", 11: "autumn"}
+
+log = logging.getLogger(__name__)
+
+
+class RateCardSpecError(ValueError):
+    """clients/<id>/rate_card.json is missing fields or malformed."""
+
+
+def payload_key(canonical: str) -> int:
+    """uint64 hash of a canonical payload (index of the card)."""
+    return int.from_bytes(hashlib.blake2b(canonical.encode("utf-8"), digest_size=8).digest(), "little")
+
+
+# ——— spec ———
+def spec_path(client_id: str) -> Path:
+    return CLIENTS_DIR / client_id / SPEC_FILENAME
+
+
+def load_spec(client_id: str) -> Tuple[Dict[str, Any], str]:
+    """(validated spec, version = content hash)."""
+    path = spec_path(client_id)
+    try:
+        raw = path.read_text(encoding="utf-8")
+        spec = json.loads(raw)
+    except ValueError as e:
+        raise RateCardSpecError(f"{path}: {e}") from e
+    if not isinstance(spec, dict):
+        raise RateCardSpecError(f"{path}: must be a JSON object")
+    for key in ("lanes", "vehicle_types", "load_types"):
+        if not isinstance(spec.get(key), list) or not spec[key]:
+            raise RateCardSpecError(f"{path}: '{key}' must be a non-empty list")
+    months = spec.setdefault("months", list(range(1, 13)))
+    if not isinstance(months, list) or not all(isinstance(m, int) and 1 <= m <= 12 for m in months):
+        raise RateCardSpecError(f"{path}: 'months' must be a list of 1..12")
+    for i, lane in enumerate(spec["lanes"]):
+        if not isinstance(lane, dict) or not lane.get("origin") or not lane.get("destination"):
+            raise RateCardSpecError(f"{path}: lane {i} needs origin and destination")
+    return spec, hashlib.sha1(raw.encode("utf-8")).hexdigest()[:12]
+
+
+def card_payloads(spec: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """One contract payload per (lane, vehicle, load_type, month), in that order."""
+    defaults = spec.get("defaults", {})
+    calendar = {int(m): v for m, v in spec.get("calendar", {}).items()}
+    rows = []
+    for lane, vehicle, load, month in itertools.product(
+            spec["lanes"], spec["vehicle_types"], spec["load_types"], spec["months"]):
+        row = {**defaults, **lane, "vehicle_type": vehicle, "load_type": load, "month": month,
+               "season": DEFAULT_SEASONS[month]}
+        row.update(calendar.get(month, {}))
+        row["contract_type"] = "contract"
+        missing = [c for c in FEATURE_COLUMNS if row.get(c) is None]
+        if missing:
+            raise RateCardSpecError(f"Lane {lane['origin']} -> {lane['destination']} is missing: "
+                                    f"{', '.join(missing)} (set them in the lane or in 'defaults')")
+        rows.append({c: row[c] for c in FEATURE_COLUMNS})
+    return rows
+
+
+# ——— build ———
+def card_path(client_id: str) -> Path:
+    return RATE_CARD_DIR / f"{client_id}.parquet"
+
+
+def build_card(client_id: str, out: Optional[Path] = None) -> "RateCard":
+    """Scores the client's grid and writes the card atomically; rows the model rejects are left out."""
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    spec, spec_version = load_spec(client_id)
+    # versiones antes de puntuar: si cambian a mitad, la tarjeta nace vieja y se reconstruye
+    entry = get_model_entry(client_id=client_id)
+    rules = get_client_rules(client_id)
+    t0 = time.perf_counter()
+    payloads = card_payloads(spec)
+    with stage("rate_card_build"):
+        raw, errors = predict_many(payloads, model_path=str(entry.path), return_errors=True, client_id=client_id)
+        pp = postprocess_rates(raw, [p["vehicle_type"] for p in payloads], rules=rules)
+    ok = np.ones(len(payloads), dtype=bool)
+    ok[[i for i, _ in errors]] = False
+    for i, msg in errors[:5]:
+        log.warning("Rate card %s: row %d left out (%s)", client_id, i, msg)
+
+    kept = [p for p, keep in zip(payloads, ok.tolist()) if keep]
+    columns = {"key": pa.array([payload_key(canonical_payload(p)) for p in kept], type=pa.uint64())}
+    for col in GRID_FIELDS:
+        values = [p[col] for p in kept]
+        columns[col] = pa.array(values, type=pa.int8()) if col == "month" else pa.array(values).dictionary_encode()
+    for col in RATE_COLUMNS:
+        columns[col] = pa.array(pp[col].to_numpy()[ok])
+    meta = {
+        "client_id": client_id, "model_version": entry.version, "rules_version": rules.version,
+        "spec_version": spec_version, "built_at": time.time(), "build_s": round(time.perf_counter() - t0, 3),
+        "rounded_multiple": rules.round_to, "doc_fee": rules.fixed_charges_aed,
+        "gate_in_out": rules.gate_in_out_aed, "rows": len(kept), "left_out": len(errors),
+    }
+    table = pa.table(columns).replace_schema_metadata({"rate_card": json.dumps(meta)})
+
+    path = Path(out) if out else card_path(client_id)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_suffix(f".tmp{os.getpid()}")
+    pq.write_table(table, tmp, compression="zstd")
+    os.replace(tmp, path)  # los lectores ven la tarjeta vieja o la nueva, nunca media
+    return RateCard(table, meta)
+
+
+# ——— lookup ———
+class RateCard:
+    """One client's card in memory: payload hash -> row, rate columns as Python lists."""
+    __slots__ = ("meta", "index", "columns", "versions")
+
+    def __init__(self, table, meta: Dict[str, Any]):
+        self.meta = meta
+        self.versions = (meta["model_version"], meta["rules_version"], meta["spec_version"])
+        keys = table.column("key").to_numpy()
+        self.index: Dict[int, int] = dict(zip(keys.tolist(), range(len(keys))))
+        self.columns = {c: table.column(c).to_pylist() for c in RATE_COLUMNS}
+
+    @classmethod
+    def load(cls, path: Path) -> "RateCard":
+        import pyarrow.parquet as pq
+
+        table = pq.read_table(path)
+        return cls(table, json.loads(table.schema.metadata[b"rate_card"]))
+
+    def __len__(self) -> int:
+        return len(self.index)
+
+    def quote(self, row: int) -> Dict[str, Any]:
+        """Same shape as quoting.finish_quote (fresh dicts on every call)."""
+        c, m = self.columns, self.meta
+        return {
+            "client_id": m["client_id"],
+            "raw_rate": c["raw_rate"][row],
+            "final_rate": c["final_rate"][row],
+            "breakdown": {
+                "raw_rate": c["raw_rate"][row],
+                "after_minimum": c["after_minimum"][row],
+                "after_fixed_charges": c["after_fixed_charges"][row],
+                "final_rate": c["final_rate"][row],
+                "rounded_multiple": m["rounded_multiple"],
+                "fixed_charges": {"doc_fee": m["doc_fee"], "gate_in_out": m["gate_in_out"]},
+                "vehicle_minimum_applied": c["vehicle_minimum_applied"][row],
+            },
+            "model_version": m["model_version"],
+            "rules_version": m["rules_version"],
+        }
+
+
+class RateCardStore:
+    """
+    Cards per client, loaded from disk on first use. A card is only served
+    while its model/rules/spec versions match the live ones; otherwise it is
+    rebuilt off to the side (one build per client at a time) and swapped in.
+    """
+
+    def __init__(self, card_dir: Path = RATE_CARD_DIR, autobuild: bool = RATE_CARD_AUTOBUILD,
+                 check_interval: float = RATE_CARD_CHECK_S):
+        self.card_dir = Path(card_dir)
+        self.autobuild = autobuild
+        self.check_interval = check_interval
+        self._cards: Dict[str, RateCard] = {}
+        # cliente -> (cuándo se miró, stamp del spec, (versión del modelo, del spec) o None si no hay spec)
+        self._checked: Dict[str, Tuple[float, Optional[Tuple[int, int]], Optional[Tuple[str, str]]]] = {}
+        self._lock = threading.Lock()
+        self._building: set = set()
+        # cliente -> (versiones, stamp del fichero) ya intentados: no releer el disco ni reconstruir en bucle
+        self._tried: Dict[str, Tuple[Tuple[str, str, str], Optional[Tuple[int, int]]]] = {}
+        self.errors: Dict[str, str] = {}
+        self.counters = {"hits": 0, "misses": 0, "stale": 0, "builds": 0, "build_errors": 0}
+
+    def _file_versions(self, client_id: str) -> Optional[Tuple[str, str]]:
+        """(model version, spec version), re-checked at most every check_interval; None without a valid spec."""
+        now = time.monotonic()
+        cached = self._checked.get(client_id)
+        if cached is not None and now - cached[0] < self.check_interval:
+            return cached[2]
+        try:
+            st = spec_path(client_id).stat()
+            stamp = (st.st_mtime_ns, st.st_size)
+        except OSError:
+            stamp = None
+        if stamp is None:
+            spec_version = None
+        elif cached is not None and cached[1] == stamp:
+            spec_version = cached[2][1] if cached[2] else None
+        else:
+            try:
+                spec_version = load_spec(client_id)[1]
+                self.errors.pop(client_id, None)
+            except (OSError, RateCardSpecError) as e:
+                self.errors[client_id] = str(e)
+                spec_version = None
+        # el registro resuelve rutas y hace stat: caro para cada cotización, barato cada pocos segundos
+        versions = (get_model_entry(client_id=client_id).version, spec_version) if spec_version else None
+        self._checked[client_id] = (now, stamp, versions)
+        return versions
+
+    def _current(self, client_id: str) -> Optional[Tuple[str, str, str]]:
+        """(model, rules, spec) versions the card must have been built with."""
+        files = self._file_versions(client_id)
+        if files is None:
+            return None
+        return (files[0], get_client_rules(client_id).version, files[1])  # reglas: lectura de un dict
+
+    def _card_stamp(self, client_id: str) -> Optional[Tuple[int, int]]:
+        try:
+            st = (self.card_dir / f"{client_id}.parquet").stat()
+        except OSError:
+            return None
+        return (st.st_mtime_ns, st.st_size)
+
+    def _from_disk(self, client_id: str, versions: Tuple[str, str, str]) -> Optional[RateCard]:
+        try:
+            card = RateCard.load(self.card_dir / f"{client_id}.parquet")
+        except (OSError, KeyError, ValueError):
+            return None
+        return card if card.versions == versions else None
+
+    def _rebuild_async(self, client_id: str, versions: Tuple[str, str, str]) -> None:
+        with self._lock:
+            if client_id in self._building:
+                return
+            self._building.add(client_id)
+
+        def run() -> None:
+            try:
+                card = build_card(client_id, self.card_dir / f"{client_id}.parquet")
+                with self._lock:
+                    self._cards[client_id] = card  # swap atómico
+                self.counters["builds"] += 1
+                self.errors.pop(client_id, None)
+                log.info("Rate card for %s: %d rows in %.2fs", client_id, len(card), card.meta["build_s"])
+            except Exception as e:
+                self.counters["build_errors"] += 1
+                self.errors[client_id] = f"build failed: {e}"
+                log.exception("Rate card build failed for %s", client_id)
+            finally:
+                with self._lock:
+                    self._tried[client_id] = (versions, self._card_stamp(client_id))
+                    self._building.discard(client_id)
+
+        threading.Thread(target=run, name=f"rate-card:{client_id}", daemon=True).start()
+
+    def card(self, client_id: str) -> Optional[RateCard]:
+        """The client's card if it is current; schedules a rebuild if it is missing or stale."""
+        versions = self._current(client_id)
+        if versions is None:
+            return None
+        card = self._cards.get(client_id)
+        if card is not None and card.versions == versions:
+            return card
+        if client_id not in self._building:
+            stamp = self._card_stamp(client_id)
+            # ya probado con estas versiones (p.ej. build fallido): nada que hacer hasta que algo cambie
+            if self._tried.get(client_id) != (versions, stamp):
+                card = self._from_disk(client_id, versions) if stamp is not None else None
+                if card is not None:
+                    with self._lock:
+                        self._cards[client_id] = card
+                    return card
+                self._tried[client_id] = (versions, stamp)
+                if self.autobuild:
+                    self._rebuild_async(client_id, versions)
+        self.counters["stale"] += 1
+        return None
+
+    def lookup(self, payload: Dict[str, Any], client_id: str) -> Optional[Dict[str, Any]]:
+        """Quote from the card, or None (not a contract payload, no card, stale card or not in the card)."""
+        if payload.get("contract_type") != "contract":
+            return None
+        card = self.card(client_id)
+        if card is None:
+            return None
+        canonical = canonical_payload(payload)
+        row = card.index.get(payload_key(canonical)) if canonical is not None else None
+        if row is None:
+            self.counters["misses"] += 1
+            return None
+        self.counters["hits"] += 1
+        return card.quote(row)
+
+    def stats(self) -> Dict[str, Any]:
+        c: Dict[str, Any] = dict(self.counters)
+        lookups = c["hits"] + c["misses"]
+        c["hit_ratio"] = round(c["hits"] / lookups, 4) if lookups else 0.0
+        c["cards"] = {k: {"rows": len(v), "model_version": v.versions[0], "rules_version": v.versions[1],
+                          "spec_version": v.versions[2], "built_at": v.meta["built_at"]}
+                      for k, v in self._cards.items()}
+        c["building"] = sorted(self._building)
+        c["errors"] = dict(self.errors)
+        return c
+
+
+RATE_CARDS = RateCardStore()
+
+
+def main() -> int:
+    ap = argparse.ArgumentParser(description="Build or inspect per-client rate cards")
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    b = sub.add_parser("build", help="Score the client's rate_card.json grid and write the card")
+    b.add_argument("client_id")
+    b.add_argument("--out", type=Path, help=f"Output file (default {RATE_CARD_DIR}/<client>.parquet)")
+    s = sub.add_parser("show", help="Card versions vs the live model/rules/spec")
+    s.add_argument("client_id")
+    args = ap.parse_args()
+
+    if args.cmd == "build":
+        card = build_card(args.client_id, args.out)
+        print(json.dumps(card.meta, indent=2))
+        return 0
+
+    path = card_path(args.client_id)
+    if not path.exists():
+        print(f"No rate card at {path}", file=sys.stderr)
+        return 1
+    card = RateCard.load(path)
+    current = RATE_CARDS._current(args.client_id)
+    print(json.dumps({**card.meta, "fresh": card.versions == current}, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
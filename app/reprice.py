@@ -0,0 +1,252 @@
+"""
+Bulk repricing of historical shipment files (CSV or Parquet).
+
+    python app/reprice.py shipments.parquet repriced/ --client acme
+    python app/reprice.py shipments.csv repriced/ --workers 4
+
+The input is streamed in Arrow record batches of --batch-rows rows, so
+memory stays flat whatever the file size. Each batch gets one vectorized
+predict plus the client's postprocessing and is written as
+<out>/part-NNNNNN.parquet (the directory reads back as one Parquet dataset
+with pandas/pyarrow). Without --client the input needs a `client_id` column.
+
+<out>/_checkpoint.json records finished batches; rerunning the same
+command after a crash skips them. --restart discards previous output.
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from pathlib import Path
+from typing import Any, Dict, Iterator, Optional, Tuple
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.csv as pacsv
+import pyarrow.parquet as pq
+
+ROOT = Path(__file__).resolve().parents[1]
+APP_DIR = ROOT / "app"
+for p in (ROOT, APP_DIR):
+    if str(p) not in sys.path:
+        sys.path.insert(0, str(p))
+
+from src.inference import CATEGORICAL_FEATURES, NUMERIC_FEATURES, get_model_entry, predict_many
+from pricing_rules import get_client_rules, postprocess_rates
+
+CHECKPOINT = "_checkpoint.json"
+DEFAULT_BATCH_ROWS = 65536
+CSV_BLOCK_BYTES = 16 << 20
+
+
+# ——— lectura por lotes ———
+def open_csv(path: Path) -> pacsv.CSVStreamingReader:
+    """Streaming CSV reader with fixed column types.
+
+    The streaming reader infers types from the first block only, so a later
+    block with e.g. a "N/A" in a column that looked numeric (or an origin
+    that looks like a number) would abort the run. Numeric features are read
+    as float64, categoricals, client_id and any other column as strings.
+    """
+    read_options = pacsv.ReadOptions(block_size=CSV_BLOCK_BYTES)
+    with pacsv.open_csv(path, read_options=read_options) as head:
+        names = head.schema.names
+    types = {c: pa.string() for c in names}
+    types.update({c: pa.float64() for c in NUMERIC_FEATURES})
+    types.update({c: pa.string() for c in CATEGORICAL_FEATURES + ["client_id"]})
+    return pacsv.open_csv(path, read_options=read_options,
+                          convert_options=pacsv.ConvertOptions(column_types=types))
+
+
+def iter_batches(path: Path, batch_rows: int) -> Iterator[pa.Table]:
+    """Tables of exactly `batch_rows` rows (the last one may be shorter)."""
+    if path.suffix.lower() in (".parquet", ".pq"):
+        source = pq.ParquetFile(path).iter_batches(batch_size=batch_rows)
+    else:
+        source = open_csv(path)
+
+    # los bloques CSV no tienen tamaño fijo: re-trocear para que el índice de lote
+    # sea estable entre ejecuciones (lo necesita el checkpoint)
+    pending, n = [], 0
+    for rb in source:
+        pending.append(rb)
+        n += rb.num_rows
+        while n >= batch_rows:
+            table = pa.Table.from_batches(pending)
+            yield table.slice(0, batch_rows)
+            rest = table.slice(batch_rows)
+            pending, n = rest.to_batches(), rest.num_rows
+    if n:
+        yield pa.Table.from_batches(pending)
+
+
+# ——— un lote ———
+def reprice_table(table: pa.Table, client_id: Optional[str]) -> pa.Table:
+    """Input columns plus raw_rate, final_rate, error, model_version and rules_version."""
+    df = table.to_pandas()
+    n = len(df)
+    raw = np.full(n, np.nan)
+    final = np.full(n, np.nan)
+    error = np.full(n, None, dtype=object)
+    model_version = np.full(n, None, dtype=object)
+    rules_version = np.full(n, None, dtype=object)
+
+    if client_id is not None:
+        groups = {client_id: np.arange(n)}
+    else:
+        codes, clients = df["client_id"].astype(str).factorize()
+        groups = {c: np.flatnonzero(codes == k) for k, c in enumerate(clients)}
+
+    for cid, rows in groups.items():
+        sub = df.iloc[rows]
+        try:
+            rules = get_client_rules(cid)
+            r, errors = predict_many(sub, return_errors=True, client_id=cid)
+        except Exception as e:  # p.ej. modelo del cliente ilegible: falla su grupo, no el lote
+            error[rows] = str(e)
+            continue
+        vehicles = sub["vehicle_type"] if "vehicle_type" in sub else [None] * len(sub)
+        raw[rows] = r
+        final[rows] = postprocess_rates(r, vehicles, rules=rules)["final_rate"].to_numpy()
+        for i, msg in errors:
+            error[rows[i]] = msg
+        model_version[rows] = get_model_entry(client_id=cid).version
+        rules_version[rows] = rules.version
+
+    return (table
+            .append_column("raw_rate", pa.array(raw))
+            .append_column("final_rate", pa.array(final))
+            .append_column("error", pa.array(error, type=pa.string()))
+            .append_column("model_version", pa.array(model_version, type=pa.string()).dictionary_encode())
+            .append_column("rules_version", pa.array(rules_version, type=pa.string()).dictionary_encode()))
+
+
+def process_batch(index: int, table: pa.Table, client_id: Optional[str], out_dir: str) -> Dict[str, int]:
+    result = reprice_table(table, client_id)
+    part = Path(out_dir) / f"part-{index:06d}.parquet"
+    tmp = part.with_suffix(".tmp")
+    pq.write_table(result, tmp)
+    os.replace(tmp, part)  # un part existe completo o no existe
+    return {"index": index, "rows": result.num_rows, "failed": result.num_rows - result["error"].null_count}
+
+
+def _worker_init() -> None:
+    # carga el modelo por defecto al arrancar: con mmap_mode="r" los arrays son
+    # páginas del fichero compartidas por todos los procesos vía page cache
+    try:
+        get_model_entry()
+    except FileNotFoundError:
+        pass
+
+
+# ——— checkpoint ———
+def _fingerprint(path: Path, batch_rows: int, client_id: Optional[str]) -> Dict[str, Any]:
+    st = path.stat()
+    return {"input": str(path.resolve()), "size": st.st_size, "mtime_ns": st.st_mtime_ns,
+            "batch_rows": batch_rows, "client_id": client_id}
+
+
+class Checkpoint:
+    def __init__(self, out_dir: Path, fingerprint: Dict[str, Any], restart: bool = False):
+        self.path = out_dir / CHECKPOINT
+        self.fingerprint = fingerprint
+        self.done: Dict[int, Tuple[int, int]] = {}  # lote -> (filas, fallidas)
+        if self.path.exists() and not restart:
+            state = json.loads(self.path.read_text(encoding="utf-8"))
+            if state.get("fingerprint") != fingerprint:
+                raise SystemExit(f"{self.path} belongs to a different input/options; use --restart")
+            self.done = {int(i): tuple(v) for i, v in state["done"].items()}
+        elif restart:
+            # primero el checkpoint: si morimos a medio borrar, no apunta a parts que ya no existen
+            self.path.unlink(missing_ok=True)
+            for old in out_dir.glob("part-*.parquet"):
+                old.unlink()
+
+    @property
+    def rows(self) -> int:
+        return sum(r for r, _ in self.done.values())
+
+    @property
+    def failed(self) -> int:
+        return sum(f for _, f in self.done.values())
+
+    def mark(self, res: Dict[str, int]) -> None:
+        self.done[res["index"]] = (res["rows"], res["failed"])
+        tmp = self.path.with_suffix(".tmp")
+        tmp.write_text(json.dumps({"fingerprint": self.fingerprint, "done": self.done}), encoding="utf-8")
+        os.replace(tmp, self.path)
+
+
+class Progress:
+    def __init__(self, every_s: float = 2.0):
+        self.t0 = self.last = time.perf_counter()
+        self.every_s = every_s
+        self.rows = 0
+
+    def update(self, rows: int, force: bool = False) -> None:
+        self.rows += rows
+        now = time.perf_counter()
+        if force or now - self.last >= self.every_s:
+            self.last = now
+            rate = self.rows / max(now - self.t0, 1e-9)
+            print(f"{self.rows:,} rows  {rate:,.0f} rows/s", file=sys.stderr, flush=True)
+
+
+def main() -> int:
+    ap = argparse.ArgumentParser(description="Reprice a CSV/Parquet shipment file in streaming batches")
+    ap.add_argument("input", type=Path, help="CSV or Parquet with the 18 model features")
+    ap.add_argument("out_dir", type=Path, help="Output directory (Parquet part files + checkpoint)")
+    ap.add_argument("--client", help="Price every row for this client (default: `client_id` column)")
+    ap.add_argument("--batch-rows", type=int, default=DEFAULT_BATCH_ROWS)
+    ap.add_argument("--workers", type=int, default=1, help="Processes (model shared via mmap)")
+    ap.add_argument("--restart", action="store_true", help="Ignore the checkpoint and start over")
+    args = ap.parse_args()
+
+    if args.batch_rows < 1 or args.workers < 1:
+        ap.error("--batch-rows and --workers must be >= 1")
+    if args.client is None:
+        names = (pq.ParquetFile(args.input).schema_arrow.names
+                 if args.input.suffix.lower() in (".parquet", ".pq")
+                 else pacsv.open_csv(args.input).schema.names)
+        if "client_id" not in names:
+            ap.error("input has no client_id column; pass --client")
+
+    args.out_dir.mkdir(parents=True, exist_ok=True)
+    ckpt = Checkpoint(args.out_dir, _fingerprint(args.input, args.batch_rows, args.client), args.restart)
+    if ckpt.done:
+        print(f"Resuming: {len(ckpt.done)} batches ({ckpt.rows:,} rows) already done", file=sys.stderr)
+
+    progress = Progress()
+    todo = ((i, t) for i, t in enumerate(iter_batches(args.input, args.batch_rows)) if i not in ckpt.done)
+    if args.workers == 1:
+        _worker_init()
+        for i, table in todo:
+            res = process_batch(i, table, args.client, str(args.out_dir))
+            ckpt.mark(res)
+            progress.update(res["rows"])
+    else:
+        # como mucho 2 lotes en vuelo por worker: memoria acotada
+        with ProcessPoolExecutor(args.workers, initializer=_worker_init) as pool:
+            inflight = set()
+            for i, table in todo:
+                inflight.add(pool.submit(process_batch, i, table, args.client, str(args.out_dir)))
+                if len(inflight) >= 2 * args.workers:
+                    finished, inflight = wait(inflight, return_when=FIRST_COMPLETED)
+                    for f in finished:
+                        res = f.result()
+                        ckpt.mark(res)
+                        progress.update(res["rows"])
+            for f in wait(inflight).done:
+                res = f.result()
+                ckpt.mark(res)
+                progress.update(res["rows"])
+    progress.update(0, force=True)
+
+    print(f"Repriced {ckpt.rows:,} rows ({ckpt.failed:,} failed) into {args.out_dir}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
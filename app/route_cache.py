@@ -0,0 +1,178 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+from cachetools import TTLCache
+
+from route_geometry import pack_route, unpack_route
+
+# Caché de dos niveles para Mapbox: L1 LRU+TTL en proceso, L2 SQLite en disco
+# (sobrevive reinicios y se comparte entre workers del mismo host).
+CACHE_DB = Path(os.environ.get("ROUTE_CACHE_DB", Path(__file__).resolve().parents[1] / ".cache" / "route_cache.sqlite"))
+GEOCODE_TTL_S = float(os.environ.get("GEOCODE_CACHE_TTL_S", 30 * 24 * 3600))
+ROUTE_TTL_S = float(os.environ.get("ROUTE_CACHE_TTL_S", 7 * 24 * 3600))
+ROUTE_KEY_DIGITS = 4  # ~11 m: misma calle/terminal => misma clave
+
+
+def normalize_query(q: str) -> str:
+    return " ".join(q.strip().lower().split())
+
+
+def route_key(origin: Dict[str, float], destination: Dict[str, float], ndigits: int = ROUTE_KEY_DIGITS) -> str:
+    return (f"{origin['lat']:.{ndigits}f},{origin['lon']:.{ndigits}f};"
+            f"{destination['lat']:.{ndigits}f},{destination['lon']:.{ndigits}f}")
+
+
+class SqliteStore:
+    """key/value table per namespace with absolute expiry; JSON values, bytes stored as BLOBs."""
+
+    def __init__(self, path: Path):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(path), check_same_thread=False, timeout=5.0)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS kv ("
+            " ns TEXT NOT NULL, key TEXT NOT NULL, value TEXT NOT NULL, expires_at REAL NOT NULL,"
+            " PRIMARY KEY (ns, key))"
+        )
+        self._conn.commit()
+
+    def get(self, ns: str, key: str) -> Optional[Tuple[Any, float]]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value, expires_at FROM kv WHERE ns = ? AND key = ?", (ns, key)
+            ).fetchone()
+        if row is None or row[1] < time.time():
+            return None
+        value = row[0] if isinstance(row[0], bytes) else json.loads(row[0])
+        return value, row[1]
+
+    def set(self, ns: str, key: str, value: Any, ttl: float) -> None:
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO kv (ns, key, value, expires_at) VALUES (?, ?, ?, ?)",
+                (ns, key, value if isinstance(value, bytes) else json.dumps(value, separators=(",", ":")),
+                 time.time() + ttl),
+            )
+            self._conn.commit()
+
+    def purge_expired(self) -> int:
+        with self._lock:
+            cur = self._conn.execute("DELETE FROM kv WHERE expires_at < ?", (time.time(),))
+            self._conn.commit()
+            return cur.rowcount
+
+
+class TwoLevelCache:
+    """
+    L1 TTLCache (LRU) in front of a shared SQLite store, with counters.
+    `codec` = (dumps, loads) stores values as bytes on disk instead of JSON.
+    """
+
+    def __init__(self, namespace: str, ttl: float, maxsize: int = 4096, store: Optional[SqliteStore] = None,
+                 codec: Optional[Tuple[Callable[[Any], bytes], Callable[[bytes], Any]]] = None):
+        self.namespace = namespace
+        self.ttl = ttl
+        self.codec = codec
+        self._mem: TTLCache = TTLCache(maxsize=maxsize, ttl=ttl)
+        self._mem_lock = threading.Lock()
+        self._store = store
+        self.counters = {"mem_hits": 0, "disk_hits": 0, "misses": 0, "errors": 0,
+                         "miss_latency_s": 0.0, "hit_latency_s": 0.0}
+
+    def get(self, key: str) -> Optional[Any]:
+        with self._mem_lock:
+            value = self._mem.get(key)
+        if value is not None:
+            self.counters["mem_hits"] += 1
+            return value
+        if self._store is not None:
+            found = self._store.get(self.namespace, key)
+            if found is not None:
+                value = self.codec[1](found[0]) if self.codec else found[0]
+                with self._mem_lock:
+                    self._mem[key] = value
+                self.counters["disk_hits"] += 1
+                return value
+        return None
+
+    def set(self, key: str, value: Any) -> None:
+        with self._mem_lock:
+            self._mem[key] = value
+        if self._store is not None:
+            self._store.set(self.namespace, key, self.codec[0](value) if self.codec else value, self.ttl)
+
+    def get_or_compute(self, key: str, compute: Callable[[], Any]) -> Any:
+        t0 = time.perf_counter()
+        value = self.get(key)
+        if value is not None:
+            self.counters["hit_latency_s"] += time.perf_counter() - t0
+            return value
+        self.counters["misses"] += 1
+        try:
+            value = compute()
+        except Exception:
+            self.counters["errors"] += 1
+            raise
+        self.set(key, value)
+        self.counters["miss_latency_s"] += time.perf_counter() - t0
+        return value
+
+    async def aget_or_compute(self, key: str, compute: Callable[[], Awaitable[Any]]) -> Any:
+        """Async version of get_or_compute (lookups stay sync: L1 dict / local SQLite)."""
+        t0 = time.perf_counter()
+        value = self.get(key)
+        if value is not None:
+            self.counters["hit_latency_s"] += time.perf_counter() - t0
+            return value
+        self.counters["misses"] += 1
+        try:
+            value = await compute()
+        except Exception:
+            self.counters["errors"] += 1
+            raise
+        self.set(key, value)
+        self.counters["miss_latency_s"] += time.perf_counter() - t0
+        return value
+
+    def stats(self) -> Dict[str, Any]:
+        c = dict(self.counters)
+        hits = c["mem_hits"] + c["disk_hits"]
+        lookups = hits + c["misses"]
+        c["hit_ratio"] = round(hits / lookups, 4) if lookups else 0.0
+        c["avg_hit_latency_ms"] = round(1000 * c["hit_latency_s"] / hits, 3) if hits else 0.0
+        c["avg_miss_latency_ms"] = round(1000 * c["miss_latency_s"] / c["misses"], 3) if c["misses"] else 0.0
+        c["mem_size"] = len(self._mem)
+        return c
+
+    def clear_memory(self) -> None:
+        with self._mem_lock:
+            self._mem.clear()
+
+
+def _open_store() -> Optional[SqliteStore]:
+    if os.environ.get("ROUTE_CACHE_DISABLE_DISK") == "1":
+        return None
+    try:
+        return SqliteStore(CACHE_DB)
+    except sqlite3.Error:
+        return None  # disco de solo lectura, etc.: nos quedamos con L1
+
+
+_store = _open_store()
+GEOCODE_CACHE = TwoLevelCache("geocode", ttl=GEOCODE_TTL_S, store=_store)
+# rutas: geometría simplificada en blob binario (route_geometry.pack_route), no JSON
+ROUTE_CACHE = TwoLevelCache("route_v2", ttl=ROUTE_TTL_S, store=_store, codec=(pack_route, unpack_route))
+MATRIX_CACHE = TwoLevelCache("matrix", ttl=ROUTE_TTL_S, maxsize=65536, store=_store)  # distancia (m) por par
+
+
+def cache_stats() -> Dict[str, Any]:
+    return {"geocode": GEOCODE_CACHE.stats(), "route": ROUTE_CACHE.stats(), "matrix": MATRIX_CACHE.stats(),
+            "disk": str(CACHE_DB) if _store is not None else None}
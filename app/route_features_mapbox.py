@@ -1,7 +1,20 @@
 import os
 import math
+import asyncio
+import concurrent.futures
+import time
+import threading
+import weakref
+import httpx
+import numpy as np
 import requests
-from typing import Dict, Tuple, List
+from scipy.spatial import cKDTree
+from tenacity import AsyncRetrying, retry_if_exception, stop_after_attempt, wait_random_exponential
+from typing import Any, AsyncIterator, Awaitable, Callable, Coroutine, Dict, Iterator, Tuple, List, Optional, Sequence
+
+from src.metrics import METRICS, bind_trace, current_trace, stage
+from route_geometry import SIMPLIFY_KEEP_KM, SIMPLIFY_TOLERANCE_KM, decode_polyline6, douglas_peucker
+from route_cache import GEOCODE_CACHE, MATRIX_CACHE, ROUTE_CACHE, normalize_query, route_key
 
 # --- Simple SALIK model (placeholder) ---
 # TODO: Replace with accurate geofences for each gate
@@ -11,9 +24,12 @@ SALIK_GATES = [
     (25.2430, 55.3426),  # Al Maktoum Bridge
     (25.2521, 55.3400),  # Airport Tunnel
 ]
+SALIK_GATE_NAMES = ["Al Barsha", "Al Garhoud", "Al Maktoum Bridge", "Airport Tunnel"]
+
+EARTH_RADIUS_KM = 6371.0
 
 def haversine_km(a: Tuple[float, float], b: Tuple[float, float]) -> float:
-    R = 6371.0
+    R = EARTH_RADIUS_KM
     lat1, lon1 = a
     lat2, lon2 = b
     dlat = math.radians(lat2 - lat1)
@@ -22,17 +38,122 @@ def haversine_km(a: Tuple[float, float], b: Tuple[float, float]) -> float:
     x = math.sin(dlat/2)**2 + math.cos(lat1)*math.cos(lat2)*math.sin(dlon/2)**2
     return 2 * R * math.asin(math.sqrt(x))
 
+class SalikGateIndex:
+    """
+    KD-tree over gates projected to a local equirectangular plane (km).
+    At UAE scale the projection error is ~1-2%, far below the gate radius.
+    """
+
+    def __init__(self, gates: Sequence[Tuple[float, float]], ref_lat: float = 25.2):
+        self.gates = np.asarray(gates, dtype=np.float64).reshape(-1, 2)
+        self._kx = EARTH_RADIUS_KM * math.radians(1.0) * math.cos(math.radians(ref_lat))
+        self._ky = EARTH_RADIUS_KM * math.radians(1.0)
+        self.xy = self.project(self.gates)
+        self.tree = cKDTree(self.xy) if len(self.xy) else None
+
+    def project(self, latlon: np.ndarray) -> np.ndarray:
+        latlon = np.asarray(latlon, dtype=np.float64).reshape(-1, 2)
+        return np.column_stack((latlon[:, 1] * self._kx, latlon[:, 0] * self._ky))
+
+    def _hits(self, P: np.ndarray, threshold_km: float) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """(segment, gate, t along segment) for every segment/gate pair within threshold_km."""
+        empty = np.empty(0, dtype=np.int64)
+        if self.tree is None or len(P) == 0:
+            return empty, empty, np.empty(0)
+        if len(P) == 1:
+            P = np.vstack((P, P))
+        A, B = P[:-1], P[1:]
+        AB = B - A
+        half = 0.5 * np.hypot(AB[:, 0], AB[:, 1])
+        # candidatos: gates dentro del círculo que envuelve cada segmento (+ umbral)
+        cand = self.tree.query_ball_point(0.5 * (A + B), r=half + threshold_km, return_sorted=False)
+        seg_idx = [i for i, c in enumerate(cand) if c]
+        if not seg_idx:
+            return empty, empty, np.empty(0)
+        lens = np.fromiter((len(cand[i]) for i in seg_idx), dtype=np.int64, count=len(seg_idx))
+        seg = np.repeat(np.asarray(seg_idx, dtype=np.int64), lens)
+        gate = np.fromiter((g for i in seg_idx for g in cand[i]), dtype=np.int64, count=int(lens.sum()))
+
+        # distancia exacta punto-segmento para los pares candidatos
+        a, ab, g = A[seg], AB[seg], self.xy[gate]
+        denom = np.einsum("ij,ij->i", ab, ab)
+        t = np.where(denom > 0, np.einsum("ij,ij->i", g - a, ab) / np.where(denom > 0, denom, 1.0), 0.0)
+        t = np.clip(t, 0.0, 1.0)
+        closest = a + t[:, None] * ab
+        dist = np.hypot(closest[:, 0] - g[:, 0], closest[:, 1] - g[:, 1])
+        hit = dist <= threshold_km
+        return seg[hit], gate[hit], t[hit]
+
+    def crossings(self, polyline_latlon, threshold_km: float = 0.25) -> List[int]:
+        """Gate indices within threshold_km of the polyline, in travel order."""
+        seg, gate, t = self._hits(self.project(polyline_latlon), threshold_km)
+        if not len(seg):
+            return []
+
+        # orden de paso: primera posición (segmento + t) en la que se toca cada gate
+        pos = seg + t
+        first: Dict[int, float] = {}
+        for gi, p in zip(gate.tolist(), pos.tolist()):
+            if gi not in first or p < first[gi]:
+                first[gi] = p
+        return sorted(first, key=first.__getitem__)
+
+    def near_vertices(self, polyline_latlon, radius_km: float) -> np.ndarray:
+        """Mask of vertices bounding a segment that passes within radius_km of any gate."""
+        P = self.project(polyline_latlon)
+        mask = np.zeros(len(P), dtype=bool)
+        seg, _, _ = self._hits(P, radius_km)
+        if len(seg) and len(P) > 1:
+            mask[seg] = True
+            mask[seg + 1] = True
+        elif len(seg):
+            mask[:] = True
+        return mask
+
+_GATE_INDEX = SalikGateIndex(SALIK_GATES)
+
+def rebuild_gate_index(gates: Sequence[Tuple[float, float]] | None = None) -> SalikGateIndex:
+    """Call after replacing SALIK_GATES (e.g. loading real geofences)."""
+    global _GATE_INDEX
+    _GATE_INDEX = SalikGateIndex(SALIK_GATES if gates is None else gates)
+    return _GATE_INDEX
+
+def salik_gates_on_route(polyline_latlon, threshold_km: float = 0.25) -> List[int]:
+    """Indices into SALIK_GATES crossed by the route, in the order they are passed."""
+    return _GATE_INDEX.crossings(polyline_latlon, threshold_km)
+
 def count_salik_on_route(polyline_latlon: List[Tuple[float, float]], threshold_km: float = 0.25) -> int:
-    count = 0
-    for gate in SALIK_GATES:
-        near = any(haversine_km((lat, lon), gate) <= threshold_km for lat, lon in polyline_latlon)
-        if near:
-            count += 1
-    return count
+    return len(salik_gates_on_route(polyline_latlon, threshold_km))
+
+def simplify_route(latlon: np.ndarray, tolerance_km: float = SIMPLIFY_TOLERANCE_KM,
+                   keep_km: float = SIMPLIFY_KEEP_KM) -> np.ndarray:
+    """
+    Douglas-Peucker that leaves every stretch within keep_km of a gate
+    untouched. The rest moves at most tolerance_km, so as long as
+    keep_km >= threshold_km + tolerance_km the SALIK crossings (and their
+    order) are exactly those of the full geometry. Routes cached before a
+    rebuild_gate_index() with new gates should be purged.
+    """
+    latlon = np.asarray(latlon, dtype=np.float64).reshape(-1, 2)
+    keep = _GATE_INDEX.near_vertices(latlon, keep_km)
+    return latlon[douglas_peucker(latlon, tolerance_km, keep)]
+
+# Override for proxies / local stub servers (tests, offline dev)
+MAPBOX_API_URL = os.environ.get("MAPBOX_API_URL", "https://api.mapbox.com").rstrip("/")
+
+# polyline6: ~5x menos bytes que GeoJSON y se decodifica directo a NumPy
+ROUTE_GEOMETRIES = os.environ.get("MAPBOX_GEOMETRIES", "polyline6")  # o "geojson"
+
+ROUTE_PARAMS = {
+    "overview": "full",
+    "geometries": ROUTE_GEOMETRIES,
+    "alternatives": "false",
+    "language": "en",
+}
 
 def mapbox_geocode(q: str, token: str) -> Dict[str, float]:
     # Forward geocoding
-    url = f"https://api.mapbox.com/geocoding/v5/mapbox.places/{requests.utils.quote(q)}.json"
+    url = f"{MAPBOX_API_URL}/geocoding/v5/mapbox.places/{requests.utils.quote(q)}.json"
     params = {"access_token": token, "limit": 1, "language": "en"}
     r = requests.get(url, params=params, timeout=15)
     r.raise_for_status()
@@ -46,15 +167,9 @@ def mapbox_geocode(q: str, token: str) -> Dict[str, float]:
 def mapbox_route(origin: Dict[str, float], destination: Dict[str, float], token: str) -> Dict:
     # Driving route with full geometry
     # Docs: https://docs.mapbox.com/api/navigation/directions/
-    base = "https://api.mapbox.com/directions/v5/mapbox/driving"
+    base = f"{MAPBOX_API_URL}/directions/v5/mapbox/driving"
     coords = f"{origin['lon']},{origin['lat']};{destination['lon']},{destination['lat']}"
-    params = {
-        "access_token": token,
-        "overview": "full",
-        "geometries": "geojson",
-        "alternatives": "false",
-        "language": "en",
-    }
+    params = {"access_token": token, **ROUTE_PARAMS}
     r = requests.get(f"{base}/{coords}", params=params, timeout=20)
     r.raise_for_status()
     data = r.json()
@@ -62,25 +177,389 @@ def mapbox_route(origin: Dict[str, float], destination: Dict[str, float], token:
         raise ValueError("No route found")
     return data["routes"][0]
 
-def compute_route_features(origin_text: str, destination_text: str) -> Dict:
+def route_latlon(geometry: Any) -> np.ndarray:
+    """Directions geometry (polyline6 string or GeoJSON LineString) -> (N, 2) float64 (lat, lon)."""
+    if isinstance(geometry, str):
+        return decode_polyline6(geometry)
+    return np.asarray(geometry["coordinates"], dtype=np.float64).reshape(-1, 2)[:, ::-1]
+
+def _compact_route(route: Dict) -> Dict:
+    # Solo guardamos lo que usamos (legs/weights no hacen falta), con la geometría simplificada
+    return {"distance": route["distance"], "duration": route.get("duration"),
+            "latlon": simplify_route(route_latlon(route["geometry"]))}
+
+def cached_geocode(q: str, token: str) -> Dict[str, float]:
+    return GEOCODE_CACHE.get_or_compute(normalize_query(q), lambda: mapbox_geocode(q, token))
+
+def cached_route(origin: Dict[str, float], destination: Dict[str, float], token: str) -> Dict:
+    return ROUTE_CACHE.get_or_compute(
+        route_key(origin, destination), lambda: _compact_route(mapbox_route(origin, destination, token))
+    )
+
+
+# --- Async client: one pooled connection, retries with jitter, in-flight dedup ---
+def _is_retryable(exc: BaseException) -> bool:
+    if isinstance(exc, httpx.HTTPStatusError):
+        return exc.response.status_code == 429 or exc.response.status_code >= 500
+    return isinstance(exc, httpx.TransportError)
+
+class MapboxClient:
+    """
+    Async Mapbox client bound to the event loop it is first used on.
+
+    Identical concurrent lookups (same geocode query / same rounded route)
+    share one upstream call; results go through the two-level route cache.
+    """
+
+    def __init__(self, token: str, base_url: str | None = None, timeout: float = 20.0,
+                 max_connections: int = 20, max_attempts: int = 4, use_cache: bool = True):
+        self.token = token
+        self.base_url = (base_url or MAPBOX_API_URL).rstrip("/")
+        self.timeout = timeout
+        self.max_connections = max_connections
+        self.max_attempts = max_attempts
+        self.use_cache = use_cache
+        self._client: httpx.AsyncClient | None = None
+        self._inflight: Dict[Tuple[str, str], asyncio.Future] = {}
+        self.upstream_calls = 0
+
+    def _http(self) -> httpx.AsyncClient:
+        if self._client is None:
+            self._client = httpx.AsyncClient(
+                base_url=self.base_url,
+                timeout=self.timeout,
+                limits=httpx.Limits(max_connections=self.max_connections,
+                                    max_keepalive_connections=self.max_connections),
+            )
+        return self._client
+
+    async def _get_json(self, path: str, params: Dict[str, Any]) -> Dict:
+        async for attempt in AsyncRetrying(
+            stop=stop_after_attempt(self.max_attempts),
+            wait=wait_random_exponential(multiplier=0.2, max=5.0),
+            retry=retry_if_exception(_is_retryable),
+            reraise=True,
+        ):
+            with attempt:
+                self.upstream_calls += 1
+                endpoint = path.split("/")[1]  # geocoding / directions / directions-matrix
+                METRICS.inc("mapbox_requests_total", endpoint=endpoint)
+                t0 = time.perf_counter()
+                try:
+                    r = await self._http().get(path, params={"access_token": self.token, **params})
+                    r.raise_for_status()
+                except httpx.TimeoutException:
+                    METRICS.inc("mapbox_timeouts_total", endpoint=endpoint)
+                    raise
+                except httpx.HTTPStatusError as e:
+                    METRICS.inc("mapbox_errors_total", endpoint=endpoint, status=e.response.status_code)
+                    raise
+                except httpx.HTTPError:
+                    METRICS.inc("mapbox_errors_total", endpoint=endpoint, status="transport")
+                    raise
+                finally:
+                    METRICS.observe("mapbox_http_seconds", time.perf_counter() - t0, endpoint=endpoint)
+                return r.json()
+        raise AssertionError("unreachable")
+
+    async def _dedup(self, key: Tuple[str, str], fetch: Callable[[], Awaitable[Any]]) -> Any:
+        fut = self._inflight.get(key)
+        if fut is None:
+            fut = asyncio.ensure_future(fetch())
+            self._inflight[key] = fut
+            fut.add_done_callback(lambda _: self._inflight.pop(key, None))
+        # shield: si un llamador se cancela, los demás siguen esperando el mismo resultado
+        return await asyncio.shield(fut)
+
+    async def _fetch_geocode(self, q: str) -> Dict[str, float]:
+        data = await self._get_json(
+            f"/geocoding/v5/mapbox.places/{requests.utils.quote(q)}.json",
+            {"limit": 1, "language": "en"},
+        )
+        if not data.get("features"):
+            raise ValueError(f"Address not found: {q}")
+        lon, lat = data["features"][0]["center"]
+        return {"lat": float(lat), "lon": float(lon)}
+
+    async def _fetch_route(self, origin: Dict[str, float], destination: Dict[str, float]) -> Dict:
+        coords = f"{origin['lon']},{origin['lat']};{destination['lon']},{destination['lat']}"
+        data = await self._get_json(f"/directions/v5/mapbox/driving/{coords}", dict(ROUTE_PARAMS))
+        if not data.get("routes"):
+            raise ValueError("No route found")
+        return _compact_route(data["routes"][0])
+
+    async def geocode(self, q: str) -> Dict[str, float]:
+        key = normalize_query(q)
+        fetch = lambda: self._dedup(("geocode", key), lambda: self._fetch_geocode(q))
+        if self.use_cache:
+            return await GEOCODE_CACHE.aget_or_compute(key, fetch)
+        return await fetch()
+
+    async def route(self, origin: Dict[str, float], destination: Dict[str, float]) -> Dict:
+        key = route_key(origin, destination)
+        fetch = lambda: self._dedup(("route", key), lambda: self._fetch_route(origin, destination))
+        if self.use_cache:
+            return await ROUTE_CACHE.aget_or_compute(key, fetch)
+        return await fetch()
+
+    async def matrix_distances(self, sources: List[Dict[str, float]],
+                               destinations: List[Dict[str, float]]) -> List[List[Optional[float]]]:
+        """Driving distances (m) for one sources x destinations block (<= MATRIX_MAX_COORDS)."""
+        coords = ";".join(f"{p['lon']},{p['lat']}" for p in [*sources, *destinations])
+        n = len(sources)
+        data = await self._get_json(f"/directions-matrix/v1/mapbox/driving/{coords}", {
+            "sources": ";".join(str(i) for i in range(n)),
+            "destinations": ";".join(str(n + j) for j in range(len(destinations))),
+            "annotations": "distance",
+        })
+        if data.get("code", "Ok") != "Ok" or "distances" not in data:
+            raise ValueError(f"Matrix request failed: {data.get('code')}")
+        return data["distances"]
+
+    async def route_features(self, origin_text: str, destination_text: str) -> Dict:
+        with stage("geocode"):
+            o, d = await asyncio.gather(self.geocode(origin_text), self.geocode(destination_text))
+        with stage("route"):
+            route = await self.route(o, d)
+        return _route_features(o, d, route, origin_text, destination_text)
+
+    async def aclose(self) -> None:
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+
+# Sync callers (Streamlit, scripts) share one background event loop, so the
+# connection pool and dedup map outlive each call. Clients are per (loop,
+# token): an AsyncClient and its in-flight futures belong to one event loop
+# (the API's uvicorn loop and the run_sync loop each get their own).
+_loop: asyncio.AbstractEventLoop | None = None
+_loop_lock = threading.Lock()
+_clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, Dict[str, MapboxClient]]" = weakref.WeakKeyDictionary()
+_clients_lock = threading.Lock()
+
+def _background_loop() -> asyncio.AbstractEventLoop:
+    global _loop
+    with _loop_lock:
+        if _loop is None:
+            _loop = asyncio.new_event_loop()
+            threading.Thread(target=_loop.run_forever, name="mapbox-client", daemon=True).start()
+        return _loop
+
+def run_sync(coro: Awaitable[Any], timeout: float | None = 60.0) -> Any:
+    """Runs `coro` on the shared background loop and waits for the result."""
+    spans = current_trace()
+
+    async def traced() -> Any:
+        bind_trace(spans)  # las etapas del loop de fondo cuentan en la traza del llamador
+        return await coro
+
+    future = asyncio.run_coroutine_threadsafe(traced(), _background_loop())
+    try:
+        return future.result(timeout)
+    except concurrent.futures.TimeoutError:
+        future.cancel()  # que la corrutina no siga ocupando el loop (y un semáforo) sin nadie esperándola
+        raise
+
+def get_client(token: str, loop: asyncio.AbstractEventLoop | None = None) -> MapboxClient:
+    """Client for `token` on `loop` (default: the running loop, else the run_sync background loop)."""
+    if loop is None:
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            loop = _background_loop()
+    with _clients_lock:
+        per_loop = _clients.setdefault(loop, {})
+        client = per_loop.get(token)
+        if client is None:
+            client = per_loop[token] = MapboxClient(token)
+        return client
+
+def _mapbox_token() -> str:
     token = os.environ.get("MAPBOX_TOKEN")
     if not token:
         raise RuntimeError("MAPBOX_TOKEN is not set in environment variables")
+    return token
+
+# --- Bulk lane matrix: N origins x M destinations ---
+MATRIX_MAX_COORDS = 25      # límite de la Matrix API (perfil driving)
+SALIK_BUFFER_KM = 8.0       # si la recta o-d pasa a < 8 km de un gate, pedimos la geometría
+
+def _needs_salik_check(o: Dict[str, float], d: Dict[str, float], buffer_km: float = SALIK_BUFFER_KM) -> bool:
+    return bool(_GATE_INDEX.crossings([(o["lat"], o["lon"]), (d["lat"], d["lon"])], threshold_km=buffer_km))
+
+def _matrix_row(origin: str, destination: str, distance_m: Optional[float], crossed: Optional[List[int]],
+                error: Optional[str] = None) -> Dict:
+    gates = len(crossed) if crossed is not None else 0
+    return {
+        "origin": origin,
+        "destination": destination,
+        "distance_km": round(distance_m / 1000.0, 2) if distance_m is not None else float("nan"),
+        "salik_gates": gates,
+        "salik_charges_aed": round(gates * 4.0, 2),
+        "salik_checked": crossed is not None,
+        "error": error,
+    }
+
+async def iter_route_matrix(origins: Sequence[str], destinations: Sequence[str], salik: str = "auto",
+                            max_concurrency: int = 8, client: MapboxClient | None = None) -> AsyncIterator[Dict]:
+    """
+    Streams one row per (origin, destination) pair as soon as it is known.
+
+    Each unique place is geocoded once; distances come from the Matrix API
+    in <=25-coordinate blocks. Full geometries are fetched (bounded by
+    max_concurrency) only for pairs that need SALIK detection:
+    salik="auto" -> straight line within SALIK_BUFFER_KM of a gate,
+    "all" -> every pair, "none" -> never.
+    """
+    if salik not in ("auto", "all", "none"):
+        raise ValueError("salik must be 'auto', 'all' or 'none'")
+    client = client or get_client(_mapbox_token())
+    sem = asyncio.Semaphore(max_concurrency)
+
+    async def bounded(coro: Coroutine[Any, Any, Any]) -> Any:
+        try:
+            async with sem:
+                return await coro
+        finally:
+            coro.close()  # cancelada antes de entrar al semáforo: sin "never awaited"
+
+    # 1) geocodificar cada lugar una sola vez
+    places = list(dict.fromkeys([*origins, *destinations]))
+    results = await asyncio.gather(*(bounded(client.geocode(p)) for p in places), return_exceptions=True)
+    geo = dict(zip(places, results))
+
+    pairs = [(o, d) for o in dict.fromkeys(origins) for d in dict.fromkeys(destinations)]
+    ok_pairs = []
+    for o, d in pairs:
+        bad = next((p for p in (o, d) if isinstance(geo[p], BaseException)), None)
+        if bad is not None:
+            yield _matrix_row(o, d, None, None, error=f"geocode failed for {bad!r}: {geo[bad]}")
+        else:
+            ok_pairs.append((o, d))
 
-    # 1) Geocode
-    o = mapbox_geocode(origin_text, token)
-    d = mapbox_geocode(destination_text, token)
+    def wants_route(o: str, d: str) -> bool:
+        if o == d or salik == "none":
+            return False
+        return salik == "all" or _needs_salik_check(geo[o], geo[d])
 
-    # 2) Route
-    route = mapbox_route(o, d, token)
-    distance_km = float(route["distance"]) / 1000.0
+    route_pairs = [(o, d) for o, d in ok_pairs if wants_route(o, d)]
+    matrix_pairs = [(o, d) for o, d in ok_pairs if not wants_route(o, d)]
 
-    # 3) Polyline coords to (lat, lon)
-    coords = route["geometry"]["coordinates"]  # [ [lon,lat], ... ]
-    poly_latlon = [(lat, lon) for lon, lat in coords]
+    async def full_route(o: str, d: str) -> Dict:
+        try:
+            route = await bounded(client.route(geo[o], geo[d]))
+        except Exception as e:
+            return _matrix_row(o, d, None, None, error=f"route failed: {e}")
+        return _matrix_row(o, d, float(route["distance"]), salik_gates_on_route(route["latlon"], threshold_km=0.25))
 
-    # 4) SALIK heuristic
-    salik_gates = count_salik_on_route(poly_latlon, threshold_km=0.25)
+    async def matrix_block(srcs: List[str], dsts: List[str], wanted: set) -> List[Dict]:
+        keys = {(o, d): route_key(geo[o], geo[d]) for o in srcs for d in dsts if (o, d) in wanted}
+        cached = {pair: MATRIX_CACHE.get(k) for pair, k in keys.items()}
+        if any(v is None for v in cached.values()):
+            try:
+                dist = await bounded(client.matrix_distances([geo[o] for o in srcs], [geo[d] for d in dsts]))
+            except Exception as e:
+                return [_matrix_row(o, d, None, None, error=f"matrix failed: {e}") for o, d in keys]
+            for i, o in enumerate(srcs):
+                for j, d in enumerate(dsts):
+                    if (o, d) in keys and dist[i][j] is not None:
+                        cached[(o, d)] = float(dist[i][j])
+                        MATRIX_CACHE.set(keys[(o, d)], float(dist[i][j]))
+        return [_matrix_row(o, d, 0.0 if o == d else cached[(o, d)], [] if o == d else None,
+                            error=None if o == d or cached[(o, d)] is not None else "no route")
+                for o, d in keys]
+
+    tasks = [asyncio.ensure_future(full_route(o, d)) for o, d in route_pairs]
+    if matrix_pairs:
+        wanted = set(matrix_pairs)
+        srcs = list(dict.fromkeys(o for o, _ in matrix_pairs))
+        dsts = list(dict.fromkeys(d for _, d in matrix_pairs))
+        n_src = max(1, min(len(srcs), MATRIX_MAX_COORDS // 2))
+        n_dst = MATRIX_MAX_COORDS - n_src
+        for i in range(0, len(srcs), n_src):
+            for j in range(0, len(dsts), n_dst):
+                block_s, block_d = srcs[i:i + n_src], dsts[j:j + n_dst]
+                if any((o, d) in wanted for o in block_s for d in block_d):
+                    tasks.append(asyncio.ensure_future(matrix_block(block_s, block_d, wanted)))
+
+    try:
+        for done in asyncio.as_completed(tasks):
+            result = await done
+            for row in (result if isinstance(result, list) else [result]):
+                yield row
+    finally:
+        for t in tasks:
+            t.cancel()
+
+def iter_route_matrix_sync(origins: Sequence[str], destinations: Sequence[str], **kwargs) -> Iterator[Dict]:
+    """Sync bridge over iter_route_matrix: yields rows as the background loop produces them."""
+    import queue
+
+    q: "queue.Queue[Any]" = queue.Queue()
+    done = object()
+
+    async def pump() -> None:
+        try:
+            async for row in iter_route_matrix(origins, destinations, **kwargs):
+                q.put(row)
+        except BaseException as e:
+            q.put(e)
+        finally:
+            q.put(done)
+
+    future = asyncio.run_coroutine_threadsafe(pump(), _background_loop())
+    try:
+        while True:
+            item = q.get()
+            if item is done:
+                return
+            if isinstance(item, BaseException):
+                raise item
+            yield item
+    finally:
+        # el consumidor paró antes (break, excepción, close()): cancelar las peticiones pendientes
+        future.cancel()
+
+def compute_route_matrix(origins: Sequence[str], destinations: Sequence[str],
+                         out_path: str | None = None, **kwargs):
+    """
+    DataFrame with origin, destination, distance_km, salik_gates,
+    salik_charges_aed (+ salik_checked, error), ready to merge into
+    predict_many payloads. Writes Parquet/CSV when out_path is given.
+    """
+    import pandas as pd
+
+    df = pd.DataFrame(list(iter_route_matrix_sync(origins, destinations, **kwargs)),
+                      columns=["origin", "destination", "distance_km", "salik_gates",
+                               "salik_charges_aed", "salik_checked", "error"])
+    # filas en orden origins x destinations (llegan en orden de finalización)
+    rank = {o: i for i, o in enumerate(dict.fromkeys(origins))}
+    rank_d = {d: j for j, d in enumerate(dict.fromkeys(destinations))}
+    df = df.sort_values(["origin", "destination"], key=lambda c: c.map(rank if c.name == "origin" else rank_d))
+    df = df.reset_index(drop=True)
+    if out_path:
+        if str(out_path).endswith(".parquet"):
+            df.to_parquet(out_path, index=False)
+        else:
+            df.to_csv(out_path, index=False)
+    return df
+
+def _route_features(o: Dict[str, float], d: Dict[str, float], route: Dict,
+                    origin_text: str, destination_text: str) -> Dict:
+    poly_latlon = route["latlon"]  # (N, 2) lat, lon (ver _compact_route)
+
+    # SALIK heuristic
+    with stage("salik"):
+        crossed = salik_gates_on_route(poly_latlon, threshold_km=0.25)
+    return features_dict(o, d, float(route["distance"]), crossed, origin_text, destination_text,
+                         "mapbox:geocoding+directions")
+
+def features_dict(o: Dict[str, float], d: Dict[str, float], distance_m: float, crossed: Sequence[int],
+                  origin_text: str, destination_text: str, provider: str) -> Dict:
+    """Response shape shared by every routing backend (see app/local_routing.py)."""
+    distance_km = distance_m / 1000.0
+    salik_gates = len(crossed)
     salik_charges_aed = round(salik_gates * 4.0, 2)  # simple assumption: 4 AED/gate
 
     return {
@@ -89,5 +568,42 @@ def compute_route_features(origin_text: str, destination_text: str) -> Dict:
         "distance_km": round(distance_km, 2),
         "salik_gates": int(salik_gates),
         "salik_charges_aed": salik_charges_aed,
-        "provider": "mapbox:geocoding+directions",
-    }
\ No newline at end of file
+        "salik_gates_crossed": [SALIK_GATE_NAMES[i] if i < len(SALIK_GATE_NAMES) else f"gate_{i}" for i in crossed],
+        "provider": provider,
+    }
+
+# --- Routing backend: Mapbox, local road graph (app/local_routing.py) or Mapbox with local fallback ---
+ROUTING_BACKEND = os.environ.get("ROUTING_BACKEND", "mapbox")  # mapbox | local | fallback
+
+def _mapbox_unavailable(exc: BaseException) -> bool:
+    """Failures the local graph can stand in for (not "no such place" / "no route")."""
+    return isinstance(exc, (RuntimeError, TimeoutError, asyncio.TimeoutError)) or _is_retryable(exc)
+
+def _local_route_features(origin_text: str, destination_text: str, online: bool = True) -> Dict:
+    from local_routing import local_route_features  # importa este módulo: import diferido
+    return local_route_features(origin_text, destination_text, online)
+
+async def compute_route_features_async(origin_text: str, destination_text: str) -> Dict:
+    """For callers already inside an event loop (e.g. the API service)."""
+    if ROUTING_BACKEND == "local":
+        return await asyncio.to_thread(_local_route_features, origin_text, destination_text)
+    try:
+        return await get_client(_mapbox_token()).route_features(origin_text, destination_text)
+    except Exception as exc:
+        if ROUTING_BACKEND != "fallback" or not _mapbox_unavailable(exc):
+            raise
+        METRICS.inc("routing_fallbacks_total", reason=type(exc).__name__)
+        return await asyncio.to_thread(_local_route_features, origin_text, destination_text, False)
+
+def compute_route_features(origin_text: str, destination_text: str) -> Dict:
+    # Geocodes run concurrently on the shared async client; routes/geocodes are cached
+    if ROUTING_BACKEND == "local":
+        return _local_route_features(origin_text, destination_text)
+    try:
+        client = get_client(_mapbox_token(), _background_loop())
+        return run_sync(client.route_features(origin_text, destination_text))
+    except Exception as exc:
+        if ROUTING_BACKEND != "fallback" or not _mapbox_unavailable(exc):
+            raise
+        METRICS.inc("routing_fallbacks_total", reason=type(exc).__name__)
+        return _local_route_features(origin_text, destination_text, online=False)
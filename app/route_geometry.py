@@ -0,0 +1,124 @@
+"""
+Route geometry helpers: polyline6 decoding, SALIK-safe simplification and
+the compact binary form used by the route cache.
+
+Geometries are (N, 2) float64 arrays of (lat, lon). Mapbox sends
+polyline6 (1e-6 degree precision), which is also the precision of the
+cache blobs, so decode -> blob -> decode is lossless.
+"""
+import math
+import struct
+import zlib
+from typing import Dict, Optional
+
+import numpy as np
+
+EARTH_RADIUS_KM = 6371.0
+POLYLINE6_SCALE = 1e6
+
+SIMPLIFY_TOLERANCE_KM = 0.01   # 10 m: por debajo del error de la geometría de Mapbox
+SIMPLIFY_KEEP_KM = 1.0         # tramos a < 1 km de un gate se guardan sin simplificar
+
+
+# ——— polyline6 ———
+def decode_polyline6(encoded: str) -> np.ndarray:
+    """Google/Mapbox encoded polyline (precision 6) -> (N, 2) float64 (lat, lon), vectorized."""
+    if not encoded:
+        return np.empty((0, 2), dtype=np.float64)
+    chunks = np.frombuffer(encoded.encode("ascii"), dtype=np.uint8).astype(np.int64) - 63
+    last = (chunks & 0x20) == 0                        # último chunk de 5 bits de cada valor
+    value_id = np.concatenate(([0], np.cumsum(last)[:-1]))
+    starts = np.flatnonzero(np.concatenate(([True], last[:-1])))
+    shift = 5 * (np.arange(len(chunks)) - starts[value_id])
+    raw = np.add.reduceat((chunks & 0x1F) << shift, starts)
+    deltas = np.where(raw & 1, ~(raw >> 1), raw >> 1)  # zigzag
+    if len(deltas) % 2:
+        raise ValueError("Malformed polyline: odd number of values")
+    return np.cumsum(deltas.reshape(-1, 2), axis=0) / POLYLINE6_SCALE
+
+
+def encode_polyline6(latlon: np.ndarray) -> str:
+    """Inverse of decode_polyline6 (used by fixtures and tests of the decoder)."""
+    ints = np.rint(np.asarray(latlon, dtype=np.float64).reshape(-1, 2) * POLYLINE6_SCALE).astype(np.int64)
+    deltas = np.diff(ints, axis=0, prepend=np.zeros((1, 2), dtype=np.int64)).ravel()
+    out = []
+    for v in ((deltas << 1) ^ (deltas >> 63)).tolist():  # zigzag
+        while v >= 0x20:
+            out.append(chr((0x20 | (v & 0x1F)) + 63))
+            v >>= 5
+        out.append(chr(v + 63))
+    return "".join(out)
+
+
+# ——— simplificación ———
+def _project_km(latlon: np.ndarray, ref_lat: float) -> np.ndarray:
+    kx = EARTH_RADIUS_KM * math.radians(1.0) * math.cos(math.radians(ref_lat))
+    ky = EARTH_RADIUS_KM * math.radians(1.0)
+    return np.column_stack((latlon[:, 1] * kx, latlon[:, 0] * ky))
+
+
+def douglas_peucker(latlon: np.ndarray, tolerance_km: float = SIMPLIFY_TOLERANCE_KM,
+                    keep: Optional[np.ndarray] = None) -> np.ndarray:
+    """
+    Boolean mask of the vertices kept by Douglas-Peucker at `tolerance_km`.
+
+    Vertices flagged in `keep` are always kept: the polyline is split at
+    them and each stretch is simplified on its own. Every dropped vertex is
+    within tolerance_km of the simplified line (and vice versa).
+    """
+    latlon = np.asarray(latlon, dtype=np.float64).reshape(-1, 2)
+    n = len(latlon)
+    mask = np.zeros(n, dtype=bool)
+    if n <= 2:
+        mask[:] = True
+        return mask
+    P = _project_km(latlon, float(latlon[:, 0].mean()))
+    mask[[0, n - 1]] = True
+    if keep is not None:
+        mask |= keep
+
+    anchors = np.flatnonzero(mask)
+    stack = [(int(a), int(b)) for a, b in zip(anchors[:-1], anchors[1:]) if b - a > 1]
+    while stack:
+        a, b = stack.pop()
+        seg = P[b] - P[a]
+        pts = P[a + 1:b] - P[a]
+        norm = math.hypot(seg[0], seg[1])
+        if norm > 0:
+            d = np.abs(seg[0] * pts[:, 1] - seg[1] * pts[:, 0]) / norm
+        else:
+            d = np.hypot(pts[:, 0], pts[:, 1])
+        i = int(np.argmax(d))
+        if d[i] > tolerance_km:
+            k = a + 1 + i
+            mask[k] = True
+            if k - a > 1:
+                stack.append((a, k))
+            if b - k > 1:
+                stack.append((k, b))
+    return mask
+
+
+# ——— blob binario para la caché ———
+_BLOB_MAGIC = b"RT1"
+_BLOB_HEADER = struct.Struct("<3sddI")  # magic, distance (m), duration (s, NaN si falta), puntos
+
+
+def pack_route(route: Dict) -> bytes:
+    """{"distance", "duration", "latlon"} -> header + zlib(int32 micro-degree deltas)."""
+    latlon = np.asarray(route["latlon"], dtype=np.float64).reshape(-1, 2)
+    ints = np.rint(latlon * POLYLINE6_SCALE).astype(np.int64)
+    deltas = np.diff(ints, axis=0, prepend=np.zeros((1, 2), dtype=np.int64)).astype(np.int32)
+    duration = route.get("duration")
+    header = _BLOB_HEADER.pack(_BLOB_MAGIC, float(route["distance"]),
+                               float("nan") if duration is None else float(duration), len(latlon))
+    return header + zlib.compress(deltas.tobytes(), 6)
+
+
+def unpack_route(blob: bytes) -> Dict:
+    magic, distance, duration, n = _BLOB_HEADER.unpack_from(blob)
+    if magic != _BLOB_MAGIC:
+        raise ValueError("Not a packed route")
+    deltas = np.frombuffer(zlib.decompress(blob[_BLOB_HEADER.size:]), dtype=np.int32).reshape(n, 2)
+    latlon = np.cumsum(deltas, axis=0, dtype=np.int64) / POLYLINE6_SCALE
+    return {"distance": distance, "duration": None if math.isnan(duration) else duration, "latlon": latlon}
@@ -0,0 +1,146 @@
+"""
+What-if sweeps: one base quote with one or two fields varied over a grid.
+
+    sweep(payload, [{"field": "fuel_price_aed_per_litre", "start": 2.5, "stop": 4.0, "steps": 16},
+                    {"field": "month", "values": [1, 4, 7, 10]}], "acme")
+
+The Cartesian grid (at most SWEEP_MAX_POINTS rows) is built column-wise,
+scored with predict_many in SWEEP_CHUNK_ROWS chunks and post-processed with
+the client's rules in one postprocess_rates pass, so a 10k-point sweep
+costs about the same as a 10k-row batch. Fields that are not swept keep
+the base payload's value (sweeping `month` does not change `season`).
+"""
+import math
+import os
+import sys
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence
+
+import numpy as np
+
+ROOT = Path(__file__).resolve().parents[1]
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+
+from src.inference import CATEGORICAL_FEATURES, FEATURE_COLUMNS, NUMERIC_FEATURES, get_model_entry, predict_many
+from src.metrics import profile_if_slow, stage
+from pricing_rules import get_client_rules, postprocess_rates
+
+SWEEP_MAX_POINTS = int(os.environ.get("SWEEP_MAX_POINTS", 10_000))
+SWEEP_CHUNK_ROWS = int(os.environ.get("SWEEP_CHUNK_ROWS", 4096))
+SWEEP_MAX_AXES = 2
+INTEGER_FEATURES = ("salik_gates", "backhaul_available", "month")
+
+
+class SweepTooLarge(ValueError):
+    """The requested grid has more than SWEEP_MAX_POINTS points."""
+
+
+def axis_values(spec: Dict[str, Any], max_points: int = SWEEP_MAX_POINTS) -> List[Any]:
+    """
+    {"field", "values": [...]} or, for numeric fields, {"field", "start",
+    "stop", "steps"} (inclusive, evenly spaced; integer fields are rounded
+    and de-duplicated).
+    """
+    field = spec.get("field")
+    if field not in FEATURE_COLUMNS:
+        raise ValueError(f"Unknown sweep field {field!r}")
+    if spec.get("values") is not None:
+        values = list(dict.fromkeys(spec["values"]))  # sin repetidos, en orden
+    else:
+        if field in CATEGORICAL_FEATURES:
+            raise ValueError(f"'{field}' is categorical: pass explicit values")
+        if any(spec.get(k) is None for k in ("start", "stop", "steps")):
+            raise ValueError(f"Sweep on '{field}' needs either values or start/stop/steps")
+        steps = int(spec["steps"])
+        if steps < 1:
+            raise ValueError("steps must be >= 1")
+        if steps > max_points:
+            raise SweepTooLarge(f"At most {max_points} points per sweep")
+        grid = np.linspace(float(spec["start"]), float(spec["stop"]), steps)
+        if field in INTEGER_FEATURES:
+            values = list(dict.fromkeys(int(v) for v in np.rint(grid).tolist()))
+        else:
+            values = [round(v, 6) for v in grid.tolist()]
+    if not values:
+        raise ValueError(f"Sweep on '{field}' has no values")
+    return values
+
+
+def build_grid(base: Dict[str, Any], fields: Sequence[str], values: Sequence[Sequence[Any]]):
+    """DataFrame with one row per grid point; the last field varies fastest."""
+    import pandas as pd
+
+    shape = [len(v) for v in values]
+    n = math.prod(shape)
+    columns: Dict[str, Any] = {}
+    for col in FEATURE_COLUMNS:
+        if col in fields:
+            continue
+        dtype = np.float64 if col in NUMERIC_FEATURES else object
+        columns[col] = np.full(n, base[col], dtype=dtype)
+    for k, (field, vals) in enumerate(zip(fields, values)):
+        inner = math.prod(shape[k + 1:])
+        outer = n // (len(vals) * inner)
+        arr = np.asarray(vals, dtype=np.float64 if field in NUMERIC_FEATURES else object)
+        columns[field] = np.tile(np.repeat(arr, inner), outer)
+    return pd.DataFrame(columns, columns=FEATURE_COLUMNS)
+
+
+def _nested(col: np.ndarray, shape: Sequence[int]) -> List[Any]:
+    """Flat column -> nested lists in grid shape, NaN (failed rows) -> None."""
+    values = [None if math.isnan(v) else v for v in col.tolist()]
+    if len(shape) == 1:
+        return values
+    width = shape[1]
+    return [values[i:i + width] for i in range(0, len(values), width)]
+
+
+def sweep(base: Dict[str, Any], axes: Sequence[Dict[str, Any]], client_id: str,
+          max_points: int = SWEEP_MAX_POINTS, chunk_size: int = SWEEP_CHUNK_ROWS) -> Dict[str, Any]:
+    """
+    Raw and final rates over the grid of `axes` around `base`. Rates come
+    back as nested lists indexed [i][j] like `values` (a flat list for one
+    axis); rows the model could not score are None and listed in `errors`.
+    """
+    with profile_if_slow("sweep"):
+        if not 1 <= len(axes) <= SWEEP_MAX_AXES:
+            raise ValueError(f"A sweep takes 1 to {SWEEP_MAX_AXES} axes")
+        fields = [a.get("field") for a in axes]
+        if len(set(fields)) != len(fields):
+            raise ValueError("Each field can only be swept once")
+        missing = [c for c in FEATURE_COLUMNS if c not in fields and base.get(c) is None]
+        if missing:
+            raise ValueError(f"Base payload is missing: {', '.join(missing)}")
+        values = [axis_values(a, max_points) for a in axes]
+        shape = [len(v) for v in values]
+        if math.prod(shape) > max_points:
+            raise SweepTooLarge(f"{' x '.join(map(str, shape))} = {math.prod(shape)} points; "
+                                f"at most {max_points} per sweep")
+
+        with stage("sweep_grid"):
+            grid = build_grid(base, fields, values)
+        raw, errors = predict_many(grid, chunk_size=chunk_size, return_errors=True, client_id=client_id)
+        rules = get_client_rules(client_id)
+        pp = postprocess_rates(raw, grid["vehicle_type"].to_numpy(), rules=rules)
+        return {
+            "client_id": client_id,
+            "fields": fields,
+            "values": values,
+            "shape": shape,
+            "raw_rate": _nested(pp["raw_rate"].to_numpy(), shape),
+            "final_rate": _nested(pp["final_rate"].to_numpy(), shape),
+            "errors": [{"index": i, "error": msg} for i, msg in errors],
+            "model_version": get_model_entry(client_id=client_id).version,
+            "rules_version": rules.version,
+        }
+
+
+def sweep_rows(result: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """Long format of a sweep() result: one {field: value, ..., raw_rate, final_rate} per point."""
+    fields, values = result["fields"], result["values"]
+    raw, final = result["raw_rate"], result["final_rate"]
+    if len(fields) == 1:
+        return [{fields[0]: v, "raw_rate": r, "final_rate": f} for v, r, f in zip(values[0], raw, final)]
+    return [{fields[0]: a, fields[1]: b, "raw_rate": raw[i][j], "final_rate": final[i][j]}
+            for i, a in enumerate(values[0]) for j, b in enumerate(values[1])]
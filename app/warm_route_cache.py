@@ -0,0 +1,49 @@
+"""
+Preload the geocode/route cache from a list of known lanes.
+
+    python app/warm_route_cache.py lanes.csv
+
+lanes.csv needs `origin` and `destination` columns (one lane per row).
+Requires MAPBOX_TOKEN; lanes already cached cost no API calls.
+"""
+import argparse
+import csv
+import json
+import sys
+import time
+from pathlib import Path
+
+APP_DIR = Path(__file__).resolve().parent
+for p in (APP_DIR.parent, APP_DIR):
+    if str(p) not in sys.path:
+        sys.path.insert(0, str(p))
+
+from route_cache import cache_stats
+from route_features_mapbox import compute_route_features
+
+
+def main() -> int:
+    ap = argparse.ArgumentParser(description="Warm the Mapbox geocode/route cache")
+    ap.add_argument("lanes", type=Path, help="CSV with origin,destination columns")
+    args = ap.parse_args()
+
+    with args.lanes.open(newline="", encoding="utf-8") as f:
+        lanes = {(r["origin"].strip(), r["destination"].strip()) for r in csv.DictReader(f)}
+
+    failed = 0
+    t0 = time.perf_counter()
+    for origin, destination in sorted(lanes):
+        try:
+            compute_route_features(origin, destination)
+        except Exception as e:
+            failed += 1
+            print(f"FAILED {origin} -> {destination}: {e}", file=sys.stderr)
+    elapsed = time.perf_counter() - t0
+
+    print(f"Warmed {len(lanes) - failed}/{len(lanes)} lanes in {elapsed:.1f}s")
+    print(json.dumps(cache_stats(), indent=2))
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,104 @@
+"""
+Shared helpers for the benchmarks (no network, no real model needed).
+
+If freight_rate_pipeline.joblib is missing, a small synthetic pipeline with
+the same 18-feature contract is trained and cached under benchmarks/.cache/.
+"""
+from __future__ import annotations
+
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+if str(ROOT / "app") not in sys.path:
+    sys.path.insert(0, str(ROOT / "app"))
+
+import numpy as np
+
+CACHE_DIR = Path(__file__).resolve().parent / ".cache"
+
+BASE_PAYLOAD = {
+    "client_type": "retailer", "origin": "Jebel Ali Port", "destination": "Al Quoz",
+    "distance_km": 30.0, "load_type": "dry", "load_weight_tons": 3.2, "vehicle_type": "7t_truck",
+    "fuel_price_aed_per_litre": 3.1, "salik_gates": 2, "salik_charges_aed": 8.0,
+    "customs_fees_aed": 60.0, "waiting_time_hours": 1.5, "contract_type": "spot",
+    "backhaul_available": 0, "month": 8, "season": "summer", "weather": "hot",
+    "peak_demand_factor": 1.06,
+}
+
+CHOICES = {
+    "client_type": ["retailer", "manufacturer", "distributor", "freight_forwarder", "3pl_partner"],
+    "origin": ["Jebel Ali Port", "Dubai South", "Al Quoz", "Sharjah", "Abu Dhabi"],
+    "destination": ["Al Quoz", "Abu Dhabi", "Sharjah", "Dubai South", "Ajman"],
+    "load_type": ["dry", "reefer", "hazardous", "oversized"],
+    "vehicle_type": ["van", "3t_truck", "7t_truck", "flatbed", "reefer_truck"],
+    "contract_type": ["spot", "contract"],
+    "season": ["winter", "spring", "summer", "autumn"],
+    "weather": ["clear", "hot", "sandstorm", "rain"],
+}
+
+
+def random_payloads(n: int, seed: int = 0) -> list[dict]:
+    rng = np.random.default_rng(seed)
+    cols = {k: rng.choice(v, n).tolist() for k, v in CHOICES.items()}
+    cols.update({
+        "distance_km": rng.uniform(5, 300, n).round(1).tolist(),
+        "load_weight_tons": rng.uniform(0.5, 20, n).round(1).tolist(),
+        "fuel_price_aed_per_litre": rng.uniform(2.5, 3.5, n).round(2).tolist(),
+        "salik_gates": rng.integers(0, 6, n).tolist(),
+        "salik_charges_aed": rng.uniform(0, 24, n).round(1).tolist(),
+        "customs_fees_aed": rng.uniform(0, 100, n).round(0).tolist(),
+        "waiting_time_hours": rng.uniform(0, 4, n).round(2).tolist(),
+        "backhaul_available": rng.integers(0, 2, n).tolist(),
+        "month": rng.integers(1, 13, n).tolist(),
+        "peak_demand_factor": rng.uniform(0.9, 1.2, n).round(2).tolist(),
+    })
+    return [{k: cols[k][i] for k in BASE_PAYLOAD} for i in range(n)]
+
+
+def model_path(kind: str = "rf") -> Path:
+    """Real model if present, else a cached synthetic one of `kind` (rf|gb|ridge)."""
+    real = ROOT / "freight_rate_pipeline.joblib"
+    if real.exists():
+        return real
+    path = CACHE_DIR / f"synthetic_{kind}.joblib"
+    if not path.exists():
+        _train_synthetic(path, kind)
+    return path
+
+
+def _train_synthetic(path: Path, kind: str) -> None:
+    import joblib
+    import pandas as pd
+    from sklearn.compose import ColumnTransformer
+    from sklearn.ensemble import GradientBoostingRegressor, RandomForestRegressor
+    from sklearn.linear_model import Ridge
+    from sklearn.pipeline import Pipeline
+    from sklearn.preprocessing import OneHotEncoder, StandardScaler
+
+    from src.inference import CATEGORICAL_FEATURES, NUMERIC_FEATURES
+
+    df = pd.DataFrame(random_payloads(3000, seed=42))
+    rng = np.random.default_rng(42)
+    y = (120 + 2.8 * df["distance_km"] + 9.5 * df["load_weight_tons"]
+         + 4.0 * df["salik_gates"] + 25 * df["waiting_time_hours"] + rng.normal(0, 10, len(df)))
+    est = {
+        "rf": RandomForestRegressor(n_estimators=100, max_depth=10, random_state=0, n_jobs=1),
+        "gb": GradientBoostingRegressor(n_estimators=200, random_state=0),
+        "ridge": Ridge(),
+    }[kind]
+    pre = ColumnTransformer([
+        ("cat", OneHotEncoder(handle_unknown="ignore"), CATEGORICAL_FEATURES),
+        ("num", StandardScaler(), NUMERIC_FEATURES),
+    ])
+    pipe = Pipeline([("pre", pre), ("model", est)]).fit(df, y)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    joblib.dump(pipe, path)
+
+
+def percentiles(samples_s: list[float]) -> dict:
+    us = np.asarray(samples_s) * 1e6
+    return {"p50_us": float(np.percentile(us, 50)), "p99_us": float(np.percentile(us, 99)),
+            "mean_us": float(us.mean()), "n": int(len(us))}
@@ -0,0 +1,83 @@
+"""
+Load generator: per-row predict_one vs MicroBatcher under concurrency.
+
+    python benchmarks/bench_batching.py [--concurrency 1 4 16 64] [--seconds 3]
+
+Each level runs N closed-loop client threads for a fixed time and reports
+throughput and p50/p99 latency, i.e. the throughput/latency curve for both
+strategies.
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import threading
+import time
+
+from _fixtures import model_path, percentiles, random_payloads
+
+from src import inference
+from src.batching import MicroBatcher
+
+
+def _load(call, concurrency: int, seconds: float, payloads) -> dict:
+    latencies: list[list[float]] = [[] for _ in range(concurrency)]
+    stop = time.perf_counter() + seconds
+
+    def client(k: int) -> None:
+        i = k
+        while time.perf_counter() < stop:
+            t0 = time.perf_counter()
+            call(payloads[i % len(payloads)])
+            latencies[k].append(time.perf_counter() - t0)
+            i += concurrency
+
+    threads = [threading.Thread(target=client, args=(k,)) for k in range(concurrency)]
+    t0 = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - t0
+    flat = [x for lat in latencies for x in lat]
+    return {"throughput_rps": round(len(flat) / elapsed, 1), **percentiles(flat)}
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    ap.add_argument("--concurrency", type=int, nargs="+", default=[1, 4, 16, 64])
+    ap.add_argument("--seconds", type=float, default=3.0)
+    ap.add_argument("--max-wait-ms", type=float, default=3.0)
+    ap.add_argument("--max-batch", type=int, default=64)
+    ap.add_argument("--model", default="rf", choices=["rf", "gb", "ridge"])
+    args = ap.parse_args()
+
+    path = str(model_path(args.model))
+    payloads = random_payloads(512, seed=3)
+    inference.predict_one(payloads[0], path)  # warm-up
+
+    def per_row(p):
+        return inference.predict_one(p, path)
+
+    curve = []
+    for c in args.concurrency:
+        batcher = MicroBatcher(max_batch_size=args.max_batch, max_wait_ms=args.max_wait_ms,
+                               predict_fn=lambda rows, _cid: inference.predict_many(rows, path, return_errors=True))
+        row = {
+            "concurrency": c,
+            "per_row": _load(per_row, c, args.seconds, payloads),
+            "micro_batched": _load(batcher.predict, c, args.seconds, payloads),
+        }
+        row["batcher"] = batcher.metrics()
+        batcher.close()
+        row["throughput_gain"] = round(
+            row["micro_batched"]["throughput_rps"] / max(row["per_row"]["throughput_rps"], 1e-9), 2)
+        curve.append(row)
+        print(f"c={c:>3}  per-row {row['per_row']['throughput_rps']:>8} rps p99 {row['per_row']['p99_us']/1e3:7.2f} ms"
+              f" | batched {row['micro_batched']['throughput_rps']:>8} rps p99 {row['micro_batched']['p99_us']/1e3:7.2f} ms"
+              f"  (avg batch {row['batcher']['avg_batch_size']})", flush=True)
+    print(json.dumps(curve, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+"""
+Batch scoring throughput: in-process threads vs the inference process pool, 1..N workers.
+
+    python benchmarks/bench_inference_pool.py [--workers 1 2 4] [--batch 256] [--seconds 5]
+
+For each worker count W, W caller threads score --batch-row batches back
+to back for --seconds (what W concurrent API requests do with
+INFERENCE_BACKEND=pool). The "threads" row runs the same callers on the
+in-process predict_many, which the GIL keeps near one core. Also checks
+that pool and local predictions are identical. Speedup is bounded by the
+physical cores available (reported as cpu_count).
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import threading
+import time
+
+import numpy as np
+
+from _fixtures import model_path, random_payloads
+from src import inference
+from src.inference_pool import InferencePool
+
+
+def _throughput(predict, batches, callers: int, seconds: float) -> float:
+    rows = [0] * callers
+    stop = time.perf_counter() + seconds
+
+    def run(k: int) -> None:
+        i = k
+        while time.perf_counter() < stop:
+            predict(batches[i % len(batches)])
+            rows[k] += len(batches[i % len(batches)])
+            i += callers
+
+    threads = [threading.Thread(target=run, args=(k,)) for k in range(callers)]
+    t0 = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return sum(rows) / (time.perf_counter() - t0)
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    ap.add_argument("--workers", type=int, nargs="+", default=sorted({1, 2, os.cpu_count() or 1}))
+    ap.add_argument("--batch", type=int, default=256)
+    ap.add_argument("--seconds", type=float, default=5.0)
+    ap.add_argument("--model", default="rf", help="rf|gb|ridge (synthetic if no real model) or a .joblib path")
+    args = ap.parse_args()
+
+    path = args.model if args.model.endswith(".joblib") else str(model_path(args.model))
+    batches = [random_payloads(args.batch, seed=s) for s in range(16)]
+    reference = inference.predict_many(batches[0], path)
+
+    report = {"cpu_count": os.cpu_count(), "batch_rows": args.batch, "model": os.path.basename(path), "runs": []}
+    for w in args.workers:
+        local = _throughput(lambda b: inference.predict_many(b, path), batches, w, args.seconds)
+        pool = InferencePool(w, min_rows_per_worker=args.batch)  # un lote = un worker: escalan los llamadores
+        try:
+            pool.predict_many(batches[0], path)  # carga del modelo en cada worker
+            same = bool(np.array_equal(pool.predict_many(batches[0], path), reference, equal_nan=True))
+            pooled = _throughput(lambda b: pool.predict_many(b, path), batches, w, args.seconds)
+        finally:
+            pool.close()
+        report["runs"].append({"workers": w, "threads_rows_s": round(local), "pool_rows_s": round(pooled),
+                               "parity": same})
+    base = report["runs"][0]["pool_rows_s"]
+    for r in report["runs"]:
+        r["pool_speedup_vs_1"] = round(r["pool_rows_s"] / base, 2) if base else None
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+"""
+Local routing backend: graph build, hub-table lookups and A* queries.
+
+    python benchmarks/bench_local_routing.py [--osm extract.osm --hubs hubs.csv] [--pairs 200]
+
+Defaults to the tiny bundled graph (fixtures/tiny_uae.osm, a coastal
+motorway through the SALIK gates plus an inland road that avoids them).
+Reports build time, load time (mmap), hub-pair latency through the full
+route_features path, uncached A* latency on random node pairs, and
+whether every A* distance equals scipy's Dijkstra on the same CSR arrays.
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import statistics
+import tempfile
+import time
+from pathlib import Path
+
+os.environ.setdefault("ROUTE_CACHE_DISABLE_DISK", "1")
+
+import numpy as np
+
+import _fixtures  # noqa: F401  (sys.path)
+from local_routing import LocalRouter, build
+
+FIXTURES = Path(__file__).resolve().parent / "fixtures"
+
+
+def _us(samples) -> dict:
+    return {"median_us": round(statistics.median(samples) * 1e6, 1), "min_us": round(min(samples) * 1e6, 1),
+            "max_us": round(max(samples) * 1e6, 1)}
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    ap.add_argument("--osm", type=Path, default=FIXTURES / "tiny_uae.osm")
+    ap.add_argument("--hubs", type=Path, default=FIXTURES / "tiny_uae_hubs.csv")
+    ap.add_argument("--pairs", type=int, default=200)
+    args = ap.parse_args()
+
+    from scipy.sparse import csr_matrix
+    from scipy.sparse.csgraph import dijkstra
+
+    with tempfile.TemporaryDirectory(prefix="road-graph-") as tmp:
+        meta = build(args.osm, Path(tmp), args.hubs)
+        t0 = time.perf_counter()
+        router = LocalRouter(Path(tmp))
+        load_s = time.perf_counter() - t0
+
+        names = [h["name"] for h in router.hubs]
+        router.route_features(names[0], names[-1])  # KD-tree de snapping
+        hub_samples = []
+        for o in names:
+            for d in names:
+                for _ in range(50):
+                    t0 = time.perf_counter()
+                    router.route_features(o, d)
+                    hub_samples.append(time.perf_counter() - t0)
+
+        n = len(router.latlon)
+        rng = np.random.default_rng(0)
+        pairs = rng.integers(0, n, size=(args.pairs, 2))
+        astar_samples, dist = [], []
+        for s, t in pairs.tolist():
+            t0 = time.perf_counter()
+            dist.append(router.astar(s, t)[0])
+            astar_samples.append(time.perf_counter() - t0)
+
+        graph = csr_matrix((np.asarray(router._weights, dtype=np.float64), np.asarray(router._indices),
+                            np.asarray(router._indptr)), shape=(n, n))
+        ref = dijkstra(graph, indices=np.unique(pairs[:, 0]))
+        row = {s: i for i, s in enumerate(np.unique(pairs[:, 0]).tolist())}
+        exact = all(abs(d - ref[row[s], t]) < 1e-3 for d, (s, t) in zip(dist, pairs.tolist()))
+
+        print(json.dumps({
+            "graph": {k: meta[k] for k in ("source", "nodes", "edges", "build_s")} | {"hubs": len(names)},
+            "load_ms": round(load_s * 1e3, 3),
+            "hub_pair_route_features": _us(hub_samples),
+            "astar_uncached": _us(astar_samples),
+            "astar_matches_dijkstra": exact,
+        }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+"""
+Portal start-up times: first paint, first authenticated paint, first quote, warm rerun.
+
+    python benchmarks/bench_portal_startup.py [--runs 5]
+
+Each run starts a fresh interpreter (cold imports, empty st.cache_resource)
+and drives streamlit_app/app.py headless with streamlit.testing's AppTest:
+
+- first_paint_s: login page rendered (what every visitor waits for)
+- first_auth_paint_s: page after login, model preload started in background
+- first_quote_s: Predict clicked on that page until the result is rendered
+- warm_rerun_s: another widget interaction once everything is cached
+
+Uses the synthetic model from _fixtures when there is no real model.
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+from pathlib import Path
+
+from _fixtures import ROOT, model_path
+
+APP = ROOT / "streamlit_app" / "app.py"
+
+SECRETS = {
+    "auth": {"cookie_name": "bench", "cookie_key": "bench-key", "cookie_expiry_days": 1},
+    "users": [{"username": "bench", "name": "Bench", "password": "x", "client_id": "acme", "role": "admin"}],
+    "api": {"url": "http://127.0.0.1:9", "key": "bench"},
+}
+
+# se ejecuta en un intérprete nuevo por run
+_CHILD = r"""
+import json, sys, time
+t0 = time.perf_counter()
+from streamlit.testing.v1 import AppTest
+
+secrets = json.loads(sys.argv[2])
+at = AppTest.from_file(sys.argv[1], default_timeout=120)
+for k, v in secrets.items():
+    at.secrets[k] = v
+at.run()
+first_paint = time.perf_counter() - t0
+
+at.session_state["authentication_status"] = True
+at.session_state["username"] = "bench"
+at.session_state["name"] = "Bench"
+t1 = time.perf_counter()
+at.run()
+first_auth_paint = time.perf_counter() - t1
+
+t2 = time.perf_counter()
+next(b for b in at.button if b.label == "Predict").click().run()
+first_quote = time.perf_counter() - t2
+ok = any("Prediction complete" in s.value for s in at.success)
+errors = [e.value for e in at.error]
+
+t3 = time.perf_counter()
+at.selectbox(key="weather").set_value("clear").run()
+warm_rerun = time.perf_counter() - t3
+
+print(json.dumps({"first_paint_s": first_paint, "first_auth_paint_s": first_auth_paint,
+                  "first_quote_s": first_quote, "warm_rerun_s": warm_rerun,
+                  "quote_ok": ok, "errors": errors}))
+"""
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    ap.add_argument("--runs", type=int, default=5)
+    args = ap.parse_args()
+
+    env = dict(os.environ, ROUTE_CACHE_DISABLE_DISK="1", PYTHONPATH=str(ROOT))
+    real = ROOT / "freight_rate_pipeline.joblib"
+    if not real.exists():
+        # el portal carga el modelo por defecto de la raíz: le pasamos el sintético vía override de cliente
+        clients = Path(__file__).resolve().parent / ".cache" / "clients"
+        (clients / "acme").mkdir(parents=True, exist_ok=True)
+        target = clients / "acme" / real.name
+        if not target.exists():
+            target.symlink_to(model_path("rf"))
+        env["CLIENTS_DIR"] = str(clients)
+
+    runs = []
+    for _ in range(args.runs):
+        out = subprocess.run([sys.executable, "-c", _CHILD, str(APP), json.dumps(SECRETS)],
+                             env=env, capture_output=True, text=True, check=True)
+        runs.append(json.loads(out.stdout.strip().splitlines()[-1]))
+
+    keys = ["first_paint_s", "first_auth_paint_s", "first_quote_s", "warm_rerun_s"]
+    report = {k: {"median": round(statistics.median(r[k] for r in runs), 4),
+                  "min": round(min(r[k] for r in runs), 4)} for k in keys}
+    report["quote_ok"] = all(r["quote_ok"] for r in runs)
+    report["errors"] = sorted({e for r in runs for e in r["errors"]})
+    report["runs"] = args.runs
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+"""
+Route geometry footprint: GeoJSON lists vs polyline6 + simplified NumPy + binary cache blob.
+
+    python benchmarks/bench_route_storage.py [--points 1000 10000 50000]
+
+Routes are synthetic road-like polylines (dense points along mostly straight
+stretches with a few bends, like Mapbox overview=full) running past the
+SALIK gates. For each size it reports bytes on the wire, bytes stored in the
+SQLite route cache, Python heap held in memory per cached route, decode
+time, and whether SALIK detection on the simplified geometry matches the
+full one.
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import time
+import tracemalloc
+
+import numpy as np
+
+import _fixtures  # noqa: F401  (sys.path)
+from route_features_mapbox import SALIK_GATES, _compact_route, route_latlon, salik_gates_on_route
+from route_geometry import decode_polyline6, encode_polyline6, pack_route
+
+
+def road_like_route(n_points: int, seed: int = 0) -> np.ndarray:
+    """Jebel Ali -> Sharjah through the gates, densified to n_points with gentle bends."""
+    rng = np.random.default_rng(seed)
+    waypoints = np.array([(24.98, 55.05), *SALIK_GATES, (25.35, 55.45)])
+    waypoints[1:-1] += rng.normal(0, 5e-4, waypoints[1:-1].shape)  # pasa cerca, no encima
+    seg_len = np.hypot(*np.diff(waypoints, axis=0).T)
+    t = np.linspace(0, seg_len.sum(), n_points)
+    cum = np.concatenate(([0], np.cumsum(seg_len)))
+    lat = np.interp(t, cum, waypoints[:, 0])
+    lon = np.interp(t, cum, waypoints[:, 1])
+    bend = 2e-3 * np.sin(t / seg_len.sum() * 40 * np.pi)  # curvas suaves (~200 m)
+    return np.round(np.column_stack((lat + bend, lon)), 6)
+
+
+def _heap_bytes(fn) -> tuple[object, int]:
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    obj = fn()
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return obj, after - before
+
+
+def _best_ms(fn, repeat: int = 5) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - t0)
+    return round(best * 1e3, 3)
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    ap.add_argument("--points", type=int, nargs="+", default=[1000, 10000, 50000])
+    args = ap.parse_args()
+
+    results = []
+    for n in args.points:
+        latlon = road_like_route(n)
+        geojson = {"type": "LineString", "coordinates": latlon[:, ::-1].tolist()}
+        geojson_text = json.dumps({"distance": 58000.0, "duration": 3100.0, "geometry": geojson},
+                                  separators=(",", ":"))
+        polyline = encode_polyline6(latlon)
+
+        # antes: JSON en disco, listas de listas en memoria
+        old_route, old_heap = _heap_bytes(lambda: json.loads(geojson_text))
+        # ahora: polyline6 -> NumPy -> simplificado -> blob
+        new_route, new_heap = _heap_bytes(
+            lambda: _compact_route({"distance": 58000.0, "duration": 3100.0, "geometry": polyline}))
+        blob = pack_route(new_route)
+
+        full = route_latlon(old_route["geometry"])
+        results.append({
+            "points": n,
+            "points_simplified": len(new_route["latlon"]),
+            "wire_geojson_bytes": len(json.dumps({"geometry": geojson}, separators=(",", ":"))),
+            "wire_polyline6_bytes": len(polyline),
+            "disk_json_bytes": len(geojson_text),
+            "disk_blob_bytes": len(blob),
+            "disk_reduction": round(len(geojson_text) / len(blob), 1),
+            "heap_lists_bytes": old_heap,
+            "heap_numpy_bytes": new_heap,
+            "memory_reduction": round(old_heap / max(new_heap, 1), 1),
+            "decode_geojson_ms": _best_ms(lambda: route_latlon(json.loads(geojson_text)["geometry"])),
+            "decode_polyline6_ms": _best_ms(lambda: decode_polyline6(polyline)),
+            "salik_full": salik_gates_on_route(full),
+            "salik_simplified": salik_gates_on_route(new_route["latlon"]),
+        })
+        results[-1]["salik_match"] = results[-1]["salik_full"] == results[-1]["salik_simplified"]
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+"""
+SALIK detection: legacy gates x points haversine scan vs SalikGateIndex.
+
+    python benchmarks/bench_salik.py [--points 10000 20000] [--gates 4 100 400]
+
+Routes are synthetic random walks across Dubai; gates are scattered along
+them so both detectors have real work to do. The legacy scan only checks
+vertices, so it can report fewer gates on sparse polylines.
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import time
+
+import numpy as np
+
+import _fixtures  # noqa: F401  (sys.path)
+from route_features_mapbox import SalikGateIndex, haversine_km
+
+
+def synthetic_route(n_points: int, seed: int = 0) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    start = np.array([24.98, 55.05])       # Jebel Ali
+    end = np.array([25.35, 55.45])         # Sharjah border
+    t = np.linspace(0.0, 1.0, n_points)[:, None]
+    wiggle = np.cumsum(rng.normal(0, 2e-4, (n_points, 2)), axis=0)
+    return start + t * (end - start) + wiggle
+
+
+def synthetic_gates(route: np.ndarray, n_gates: int, seed: int = 1) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    on_route = route[rng.integers(0, len(route), n_gates // 2)] + rng.normal(0, 1e-3, (n_gates // 2, 2))
+    lo, hi = route.min(axis=0), route.max(axis=0)
+    off_route = rng.uniform(lo, hi, (n_gates - n_gates // 2, 2))
+    return np.vstack((on_route, off_route))
+
+
+def legacy_count(route, gates, threshold_km=0.25) -> int:
+    pts = [tuple(p) for p in route.tolist()]
+    return sum(any(haversine_km(p, tuple(g)) <= threshold_km for p in pts) for g in gates.tolist())
+
+
+def _best_of(fn, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - t0)
+    return best
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    ap.add_argument("--points", type=int, nargs="+", default=[1000, 10000, 20000])
+    ap.add_argument("--gates", type=int, nargs="+", default=[4, 100, 400])
+    ap.add_argument("--skip-legacy-above", type=int, default=2_000_000,
+                    help="skip the legacy scan when points*gates exceeds this")
+    args = ap.parse_args()
+
+    results = []
+    for n_points in args.points:
+        route = synthetic_route(n_points)
+        for n_gates in args.gates:
+            gates = synthetic_gates(route, n_gates)
+            t0 = time.perf_counter()
+            index = SalikGateIndex([tuple(g) for g in gates])
+            build_s = time.perf_counter() - t0
+            crossed = index.crossings(route)
+            row = {
+                "points": n_points, "gates": n_gates,
+                "index_build_ms": round(build_s * 1e3, 3),
+                "indexed_ms": round(_best_of(lambda: index.crossings(route), 5) * 1e3, 3),
+                "indexed_gates": len(crossed),
+            }
+            if n_points * n_gates <= args.skip_legacy_above:
+                row["legacy_ms"] = round(_best_of(lambda: legacy_count(route, gates), 1) * 1e3, 3)
+                row["legacy_gates"] = legacy_count(route, gates)
+                row["speedup"] = round(row["legacy_ms"] / max(row["indexed_ms"], 1e-6), 1)
+            results.append(row)
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,57 @@
+"""
+p50/p99 latency of one quote: sklearn predict_one vs compiled predict_one_fast.
+
+    python benchmarks/bench_single_quote.py [--model rf|gb|ridge] [-n 2000]
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import time
+
+from _fixtures import BASE_PAYLOAD, model_path, percentiles, random_payloads
+
+from src import inference
+
+
+def _measure(fn, payloads, n: int) -> list[float]:
+    samples = []
+    for i in range(n):
+        p = payloads[i % len(payloads)]
+        t0 = time.perf_counter()
+        fn(p)
+        samples.append(time.perf_counter() - t0)
+    return samples
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    ap.add_argument("--model", default="rf", choices=["rf", "gb", "ridge"])
+    ap.add_argument("-n", type=int, default=2000)
+    args = ap.parse_args()
+
+    path = str(model_path(args.model))
+    model = inference.load_model(path)
+    compiled = inference.get_compiled(model)
+    if compiled is None:
+        raise SystemExit("Pipeline is not compilable; nothing to compare")
+
+    payloads = random_payloads(256, seed=7)
+    parity = compiled.check_parity(payloads)
+
+    # warm-up
+    inference.predict_one(BASE_PAYLOAD, path)
+    inference.predict_one_fast(BASE_PAYLOAD, path)
+
+    report = {
+        "model": path,
+        "parity": parity,
+        "sklearn": percentiles(_measure(lambda p: inference.predict_one(p, path), payloads, args.n)),
+        "compiled": percentiles(_measure(lambda p: inference.predict_one_fast(p, path), payloads, args.n)),
+    }
+    report["speedup_p50"] = report["sklearn"]["p50_us"] / report["compiled"]["p50_us"]
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
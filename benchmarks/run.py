@@ -0,0 +1,333 @@
+"""
+Benchmark suite for the quoting hot paths, with regression check.
+
+    python benchmarks/run.py                       # run all, compare with baseline.json
+    python benchmarks/run.py -k predict salik      # only cases whose name contains these
+    python benchmarks/run.py --save-baseline       # run and store as the new baseline
+    python benchmarks/run.py --out results.json --threshold 1.3
+
+No network: Mapbox is replayed from fixtures/mapbox_recorded.json through
+an in-process httpx transport, the disk route cache and the rules watcher
+are disabled, and a synthetic model is used when freight_rate_pipeline.joblib
+is missing (see _fixtures.model_path).
+
+Each case is timed asv-style: the loop count is calibrated so one sample
+takes >= --min-sample-ms, then --repeat samples are taken. The best
+sample per call (as timeit recommends: the least noisy estimate on a busy
+machine) is compared with the baseline; cases slower than --threshold x
+baseline are reported as regressions (exit code 1). Medians and IQR are
+kept in the report to judge noise.
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import platform
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Tuple
+
+# antes de importar app/: nada de disco, red ni hilos de fondo
+_CLIENTS_TMP = Path(tempfile.mkdtemp(prefix="bench-clients-"))
+os.environ["ROUTE_CACHE_DISABLE_DISK"] = "1"
+os.environ["RULES_POLL_INTERVAL_S"] = "0"
+os.environ["CLIENTS_DIR"] = str(_CLIENTS_TMP)
+os.environ["RATE_CARD_DIR"] = str(_CLIENTS_TMP / "_rate_cards")
+os.environ.setdefault("MAPBOX_TOKEN", "bench")
+
+import httpx
+import numpy as np
+
+from _fixtures import BASE_PAYLOAD, ROOT, model_path, random_payloads
+from bench_salik import synthetic_route
+
+BENCH_DIR = Path(__file__).resolve().parent
+BASELINE = BENCH_DIR / "baseline.json"
+RECORDING = BENCH_DIR / "fixtures" / "mapbox_recorded.json"
+BENCH_CLIENT = "bench"
+
+# (nombre, setup); setup() prepara datos y devuelve la función a medir (sin argumentos)
+Case = Tuple[str, Callable[[], Callable[[], object]]]
+CASES: List[Case] = []
+
+
+def case(name: str):
+    def register(setup):
+        CASES.append((name, setup))
+        return setup
+    return register
+
+
+# ——— entorno compartido ———
+def _prepare_clients() -> None:
+    dst = _CLIENTS_TMP / BENCH_CLIENT
+    dst.mkdir(parents=True, exist_ok=True)
+    shutil.copy(ROOT / "clients" / "acme" / "pricing_rules.json", dst / "pricing_rules.json")
+    shutil.copy(BENCH_DIR / "fixtures" / "rate_card_example.json", dst / "rate_card.json")
+
+
+def _bench_client_model() -> None:
+    """Symlinks the bench model as the bench client's override (paths that resolve the model by client)."""
+    from src.model_registry import MODEL_FILENAME
+    override = _CLIENTS_TMP / BENCH_CLIENT / MODEL_FILENAME
+    if not override.exists():
+        override.symlink_to(Path(MODEL_PATH).resolve())
+
+
+def _recorded_transport() -> httpx.MockTransport:
+    rec = json.loads(RECORDING.read_text(encoding="utf-8"))
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        path = request.url.path
+        if path.startswith("/geocoding/"):
+            query = path.rsplit("/", 1)[-1].removesuffix(".json")  # url.path ya viene sin %-escapes
+            body = rec["geocoding"].get(query.lower(), {"features": []})
+        elif path.startswith("/directions/"):
+            body = rec["directions"]
+        else:
+            return httpx.Response(404, json={"message": "not recorded"})
+        return httpx.Response(200, json=body)
+
+    return httpx.MockTransport(handler)
+
+
+MODEL_PATH: Optional[str] = None
+
+
+# ——— casos ———
+@case("predict_one_cold")
+def _predict_one_cold():
+    from src import inference
+
+    def run():
+        inference.registry.clear()       # fuerza joblib.load (mmap) + primer predict
+        inference.predict_one(BASE_PAYLOAD, MODEL_PATH)
+    return run
+
+
+@case("predict_one_warm")
+def _predict_one_warm():
+    from src import inference
+    inference.predict_one(BASE_PAYLOAD, MODEL_PATH)
+    return lambda: inference.predict_one(BASE_PAYLOAD, MODEL_PATH)
+
+
+@case("predict_one_fast_warm")
+def _predict_one_fast_warm():
+    from src import inference
+    inference.predict_one_fast(BASE_PAYLOAD, MODEL_PATH)
+    return lambda: inference.predict_one_fast(BASE_PAYLOAD, MODEL_PATH)
+
+
+def _batch_case(n: int):
+    def setup():
+        from src import inference
+        payloads = random_payloads(n, seed=11)
+        inference.predict_many(payloads[:1], MODEL_PATH)
+        return lambda: inference.predict_many(payloads, MODEL_PATH)
+    return setup
+
+
+for _n in (1, 100, 10_000):
+    case(f"predict_many_{_n}")(_batch_case(_n))
+
+
+def _salik_case(n_points: int):
+    def setup():
+        from route_features_mapbox import count_salik_on_route
+        route = synthetic_route(n_points)
+        return lambda: count_salik_on_route(route)
+    return setup
+
+
+for _n in (100, 1_000, 10_000, 100_000):
+    case(f"count_salik_on_route_{_n}")(_salik_case(_n))
+
+
+@case("postprocess_rate")
+def _postprocess_rate():
+    from pricing_rules import get_client_rules, postprocess_rate
+    rules = get_client_rules(BENCH_CLIENT)
+    return lambda: postprocess_rate(1234.567, "7t_truck", rules)
+
+
+@case("postprocess_rates_10000")
+def _postprocess_rates():
+    from pricing_rules import get_client_rules, postprocess_rates
+    rng = np.random.default_rng(5)
+    raw = rng.uniform(100, 5000, 10_000)
+    vehicles = [p["vehicle_type"] for p in random_payloads(10_000, seed=5)]
+    rules = get_client_rules(BENCH_CLIENT)
+    return lambda: postprocess_rates(raw, vehicles, rules=rules)
+
+
+@case("sweep_10000")
+def _sweep():
+    # 100 x 100 what-if grid: construcción + predict por chunks + reglas
+    from sweep import sweep
+    _bench_client_model()
+    axes = [{"field": "fuel_price_aed_per_litre", "start": 2.0, "stop": 4.5, "steps": 100},
+            {"field": "waiting_time_hours", "start": 0.0, "stop": 8.0, "steps": 100}]
+    sweep(BASE_PAYLOAD, axes[:1], BENCH_CLIENT)
+    return lambda: sweep(BASE_PAYLOAD, axes, BENCH_CLIENT)
+
+
+@case("rate_card_lookup")
+def _rate_card_lookup():
+    # tarifa de contrato servida desde la tarjeta: versiones + hash del payload + dict
+    from rate_cards import RATE_CARDS, build_card, card_payloads, load_spec
+    _bench_client_model()
+    build_card(BENCH_CLIENT)
+    payload = card_payloads(load_spec(BENCH_CLIENT)[0])[7]
+    assert RATE_CARDS.lookup(payload, BENCH_CLIENT) is not None
+    return lambda: RATE_CARDS.lookup(payload, BENCH_CLIENT)
+
+
+@case("get_rules_for_client_hit")
+def _rules_hit():
+    from pricing_rules import get_rules_for_client
+    get_rules_for_client(BENCH_CLIENT)
+    return lambda: get_rules_for_client(BENCH_CLIENT)
+
+
+@case("get_rules_for_client_miss")
+def _rules_miss():
+    # store nuevo por llamada: scan + lectura + validación + congelado del JSON
+    from pricing_rules import RulesStore
+    return lambda: RulesStore(_CLIENTS_TMP, poll_interval=0).get(BENCH_CLIENT).as_dict()
+
+
+def _route_features_case(cached: bool):
+    def setup():
+        import route_features_mapbox as rf
+        from route_cache import GEOCODE_CACHE, ROUTE_CACHE
+
+        client = rf.MapboxClient("bench", base_url="https://api.mapbox.test")
+        client._client = httpx.AsyncClient(base_url=client.base_url, transport=_recorded_transport())
+
+        def run():
+            if not cached:
+                GEOCODE_CACHE.clear_memory()
+                ROUTE_CACHE.clear_memory()
+            return rf.run_sync(client.route_features("Jebel Ali Port", "Sharjah"))
+
+        run()
+        return run
+    return setup
+
+
+case("compute_route_features_miss")(_route_features_case(cached=False))
+case("compute_route_features_hit")(_route_features_case(cached=True))
+
+
+# ——— medición ———
+def _time_case(fn: Callable[[], object], repeat: int, min_sample_s: float) -> Dict[str, float]:
+    number = 1
+    while True:
+        t0 = time.perf_counter()
+        for _ in range(number):
+            fn()
+        elapsed = time.perf_counter() - t0
+        if elapsed >= min_sample_s or number >= 1 << 20:
+            break
+        number *= max(2, min(10, int(min_sample_s / max(elapsed, 1e-9)) + 1))
+
+    samples = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        for _ in range(number):
+            fn()
+        samples.append((time.perf_counter() - t0) / number)
+    q1, _, q3 = statistics.quantiles(samples, n=4) if len(samples) > 1 else (samples[0],) * 3
+    return {
+        "median_us": round(statistics.median(samples) * 1e6, 3),
+        "min_us": round(min(samples) * 1e6, 3),
+        "iqr_us": round((q3 - q1) * 1e6, 3),
+        "number": number,
+        "repeat": repeat,
+    }
+
+
+def _environment() -> Dict[str, object]:
+    from src import inference
+    entry = inference.get_model_entry(MODEL_PATH)
+    import sklearn
+    return {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "numpy": np.__version__,
+        "sklearn": sklearn.__version__,
+        "model": Path(entry.path).name,
+        "model_version": entry.version,
+    }
+
+
+def compare(results: Dict[str, Dict], baseline: Dict[str, Dict], threshold: float) -> List[Dict]:
+    rows = []
+    for name, r in results.items():
+        base = baseline.get(name)
+        ratio = r["min_us"] / base["min_us"] if base and base["min_us"] > 0 else None
+        status = "new" if ratio is None else "REGRESSION" if ratio > threshold else (
+            "improved" if ratio < 1 / threshold else "ok")
+        rows.append({"case": name, "min_us": r["min_us"],
+                     "baseline_us": base["min_us"] if base else None,
+                     "ratio": round(ratio, 3) if ratio is not None else None, "status": status})
+    return rows
+
+
+def main() -> int:
+    global MODEL_PATH
+    ap = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    ap.add_argument("-k", nargs="*", default=[], help="run only cases containing any of these substrings")
+    ap.add_argument("--model", default="rf", help="rf|gb|ridge (synthetic if no real model) or a .joblib path")
+    ap.add_argument("--repeat", type=int, default=7)
+    ap.add_argument("--min-sample-ms", type=float, default=50.0)
+    ap.add_argument("--threshold", type=float, default=1.25, help="slowdown ratio flagged as regression")
+    ap.add_argument("--baseline", type=Path, default=BASELINE)
+    ap.add_argument("--out", type=Path, help="write the JSON report here as well")
+    ap.add_argument("--save-baseline", action="store_true")
+    args = ap.parse_args()
+
+    _prepare_clients()
+    MODEL_PATH = args.model if args.model.endswith(".joblib") else str(model_path(args.model))
+
+    results: Dict[str, Dict] = {}
+    try:
+        for name, setup in CASES:
+            if args.k and not any(s in name for s in args.k):
+                continue
+            results[name] = _time_case(setup(), args.repeat, args.min_sample_ms / 1000.0)
+            print(f"{name:32s} {results[name]['min_us']:>14,.1f} us", file=sys.stderr, flush=True)
+    finally:
+        shutil.rmtree(_CLIENTS_TMP, ignore_errors=True)
+
+    report: Dict[str, object] = {"environment": _environment(), "results": results}
+    if args.save_baseline:
+        previous = json.loads(args.baseline.read_text()) if args.baseline.exists() else {"results": {}}
+        report["results"] = {**previous["results"], **results}  # -k actualiza sólo esos casos
+        args.baseline.write_text(json.dumps(report, indent=2) + "\n")
+        print(f"Baseline saved to {args.baseline}", file=sys.stderr)
+        return 0
+
+    regressions = 0
+    if args.baseline.exists():
+        baseline = json.loads(args.baseline.read_text())
+        if baseline["environment"].get("model_version") != report["environment"]["model_version"]:
+            print("warning: baseline was recorded with a different model; predict_* ratios are not comparable",
+                  file=sys.stderr)
+        report["comparison"] = compare(results, baseline["results"], args.threshold)
+        regressions = sum(r["status"] == "REGRESSION" for r in report["comparison"])
+    print(json.dumps(report, indent=2))
+    if args.out:
+        args.out.write_text(json.dumps(report, indent=2) + "\n")
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,188 @@
+"""
+Dynamic micro-batching in front of the model.
+
+Concurrent single-quote callers submit payloads; one worker thread drains
+the queue into batches of up to `max_batch_size` rows or `max_wait_ms`
+since the first queued row, runs one vectorized predict_many per client
+model, and resolves each caller's future.
+
+Backpressure: the queue is bounded; submit() raises BatcherOverloaded
+when it is full so the API can answer 503 instead of queueing forever.
+close() never blocks on a full queue: requests still waiting fail with
+BatcherClosed (a BatcherOverloaded, so callers retry them the same way).
+"""
+from __future__ import annotations
+
+import asyncio
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Optional, Sequence
+
+from .inference import predict_many
+
+
+class BatcherOverloaded(RuntimeError):
+    """The request queue is full."""
+
+
+class BatcherClosed(BatcherOverloaded):
+    """The batcher shut down before the request reached the model."""
+
+
+@dataclass
+class _Request:
+    payload: Dict[str, Any]
+    client_id: Optional[str]
+    future: Future
+    enqueued: float = field(default_factory=time.perf_counter)
+
+
+def _default_predict(payloads: Sequence[Dict[str, Any]], client_id: Optional[str]):
+    return predict_many(payloads, return_errors=True, client_id=client_id)
+
+
+class MicroBatcher:
+    def __init__(
+        self,
+        max_batch_size: int = 64,
+        max_wait_ms: float = 3.0,
+        max_queue: int = 2048,
+        predict_fn: Callable[[Sequence[Dict[str, Any]], Optional[str]], Any] = _default_predict,
+    ):
+        if max_batch_size < 1:
+            raise ValueError("max_batch_size must be >= 1")
+        self.max_batch_size = max_batch_size
+        self.max_wait_s = max_wait_ms / 1000.0
+        self.max_queue = max_queue
+        self._predict = predict_fn
+        self._queue: "queue.Queue[Optional[_Request]]" = queue.Queue(maxsize=max_queue)
+        self._closed = False
+        self._stats_lock = threading.Lock()
+        self._stats = {"submitted": 0, "rejected": 0, "completed": 0, "failed": 0, "aborted": 0,
+                       "batches": 0, "rows": 0, "max_batch": 0,
+                       "queue_wait_s": 0.0, "predict_s": 0.0}
+        self._thread = threading.Thread(target=self._run, name="micro-batcher", daemon=True)
+        self._thread.start()
+
+    # ——— API para llamadores ———
+    def submit(self, payload: Dict[str, Any], client_id: Optional[str] = None) -> Future:
+        if self._closed:
+            raise BatcherClosed("MicroBatcher is closed")
+        req = _Request(payload, client_id, Future())
+        try:
+            self._queue.put_nowait(req)
+        except queue.Full:
+            with self._stats_lock:
+                self._stats["rejected"] += 1
+            raise BatcherOverloaded(f"Inference queue full ({self.max_queue} pending)") from None
+        with self._stats_lock:
+            self._stats["submitted"] += 1
+        return req.future
+
+    def predict(self, payload: Dict[str, Any], client_id: Optional[str] = None,
+                timeout: Optional[float] = None) -> float:
+        return self.submit(payload, client_id).result(timeout)
+
+    async def apredict(self, payload: Dict[str, Any], client_id: Optional[str] = None) -> float:
+        return await asyncio.wrap_future(self.submit(payload, client_id))
+
+    def metrics(self) -> Dict[str, Any]:
+        with self._stats_lock:
+            s = dict(self._stats)
+        s["queue_depth"] = self._queue.qsize()
+        s["max_queue"] = self.max_queue
+        s["avg_batch_size"] = round(s["rows"] / s["batches"], 2) if s["batches"] else 0.0
+        s["avg_queue_wait_ms"] = round(1000 * s["queue_wait_s"] / s["rows"], 3) if s["rows"] else 0.0
+        s["avg_predict_ms"] = round(1000 * s["predict_s"] / s["batches"], 3) if s["batches"] else 0.0
+        return s
+
+    def close(self, timeout: float = 5.0) -> None:
+        self._closed = True
+        self._abort_pending()
+        while True:  # put() bloquearía con la cola llena: vaciar y reintentar
+            try:
+                self._queue.put_nowait(None)
+                break
+            except queue.Full:
+                self._abort_pending()
+        self._thread.join(timeout)
+        if not self._thread.is_alive():
+            self._abort_pending()  # submits que se colaron en carrera con close()
+
+    def _abort_pending(self) -> None:
+        """Fails every request still in the queue with BatcherClosed."""
+        aborted = 0
+        while True:
+            try:
+                req = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if req is not None and req.future.set_running_or_notify_cancel():
+                req.future.set_exception(BatcherClosed("MicroBatcher closed before the request ran"))
+                aborted += 1
+        with self._stats_lock:
+            self._stats["aborted"] += aborted
+
+    # ——— worker ———
+    def _collect(self, first: _Request) -> tuple[List[_Request], bool]:
+        batch = [first]
+        deadline = first.enqueued + self.max_wait_s
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.perf_counter()
+            try:
+                req = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if req is None:
+                return batch, True
+            batch.append(req)
+        return batch, False
+
+    def _run_batch(self, batch: List[_Request]) -> None:
+        now = time.perf_counter()
+        groups: Dict[Optional[str], List[_Request]] = {}
+        for req in batch:
+            if req.future.set_running_or_notify_cancel():  # apredict cancelado: nadie espera el resultado
+                groups.setdefault(req.client_id, []).append(req)
+
+        t0 = time.perf_counter()
+        completed = failed = 0
+        for client_id, reqs in groups.items():
+            try:
+                yhat, errors = self._predict([r.payload for r in reqs], client_id)
+            except Exception as e:
+                for r in reqs:
+                    r.future.set_exception(e)
+                failed += len(reqs)
+                continue
+            by_row = dict(errors)
+            for i, r in enumerate(reqs):
+                if i in by_row:
+                    r.future.set_exception(ValueError(by_row[i]))
+                    failed += 1
+                else:
+                    r.future.set_result(float(yhat[i]))
+                    completed += 1
+
+        with self._stats_lock:
+            s = self._stats
+            s["batches"] += 1
+            s["rows"] += len(batch)
+            s["max_batch"] = max(s["max_batch"], len(batch))
+            s["completed"] += completed
+            s["failed"] += failed
+            s["queue_wait_s"] += sum(now - r.enqueued for r in batch)
+            s["predict_s"] += time.perf_counter() - t0
+
+    def _run(self) -> None:
+        while True:
+            first = self._queue.get()
+            if first is None:
+                return
+            batch, stop = self._collect(first)
+            self._run_batch(batch)
+            if stop:
+                return
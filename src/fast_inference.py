@@ -0,0 +1,303 @@
+"""
+Compiled, pandas-free scoring for freight_rate_pipeline.joblib.
+
+The fitted sklearn Pipeline is flattened once into plain NumPy arrays /
+Python lists (encoder lookups, scaler coefficients, tree or linear model
+parameters) so a single quote can be scored from a dict without building a
+DataFrame or going through ColumnTransformer dispatch.
+
+Supported pipelines: [ColumnTransformer(OneHotEncoder | OrdinalEncoder |
+StandardScaler | MinMaxScaler | passthrough | drop)] -> linear model
+(coef_/intercept_) or DecisionTree / RandomForest / ExtraTrees /
+GradientBoosting regressors. Anything else raises UnsupportedPipeline and
+callers fall back to the sklearn path.
+"""
+from __future__ import annotations
+
+import math
+from typing import Any, Dict, Iterable, List, Sequence, Tuple
+
+import numpy as np
+
+
+class UnsupportedPipeline(ValueError):
+    """The fitted pipeline contains a step we cannot compile."""
+
+
+class ParityError(AssertionError):
+    """Compiled and sklearn predictions differ beyond tolerance."""
+
+
+# ——— preprocessing blocks ———
+class _CategoricalBlock:
+    """One-hot (or ordinal) lookup for a single input column."""
+    __slots__ = ("column", "offset", "index", "width", "onehot", "unknown_error")
+
+    def __init__(self, column: str, categories: Sequence[Any], offset: int, onehot: bool,
+                 drop_idx: int | None = None, unknown_error: bool = False):
+        self.column = column
+        self.offset = offset
+        self.onehot = onehot
+        self.unknown_error = unknown_error
+        index: Dict[Any, int] = {}
+        pos = 0
+        for i, cat in enumerate(categories):
+            if drop_idx is not None and i == drop_idx:
+                index[cat] = -1  # categoría eliminada: todo ceros
+                continue
+            index[cat] = pos if onehot else i
+            pos += 1
+        self.index = index
+        self.width = pos if onehot else 1
+
+    def fill(self, value: Any, x: List[float]) -> None:
+        pos = self.index.get(value)
+        if pos is None:
+            if self.unknown_error:
+                raise ValueError(f"Unknown category {value!r} for '{self.column}'")
+            if not self.onehot:
+                x[self.offset] = math.nan
+            return
+        if self.onehot:
+            if pos >= 0:
+                x[self.offset + pos] = 1.0
+        else:
+            x[self.offset] = float(pos)
+
+
+class _AffineBlock:
+    """Numeric column mapped through x * scale + shift (scalers, passthrough)."""
+    __slots__ = ("column", "offset", "scale", "shift", "width")
+
+    def __init__(self, column: str, offset: int, scale: float = 1.0, shift: float = 0.0):
+        self.column = column
+        self.offset = offset
+        self.scale = scale
+        self.shift = shift
+        self.width = 1
+
+    def fill(self, value: Any, x: List[float]) -> None:
+        x[self.offset] = float(value) * self.scale + self.shift
+
+
+def _affine_params(trans, n_cols: int) -> Tuple[np.ndarray, np.ndarray]:
+    from sklearn.preprocessing import MinMaxScaler, StandardScaler
+
+    if trans == "passthrough":
+        return np.ones(n_cols), np.zeros(n_cols)
+    if isinstance(trans, StandardScaler):
+        mean = trans.mean_ if trans.with_mean else np.zeros(n_cols)
+        scale = trans.scale_ if trans.with_std else np.ones(n_cols)
+        return 1.0 / scale, -mean / scale
+    if isinstance(trans, MinMaxScaler):
+        if trans.clip:
+            raise UnsupportedPipeline("MinMaxScaler(clip=True) is not supported")
+        return trans.scale_.copy(), trans.min_.copy()
+    raise UnsupportedPipeline(f"Unsupported transformer: {type(trans).__name__}")
+
+
+def _compile_preprocessor(ct) -> Tuple[List[Any], int]:
+    from sklearn.compose import ColumnTransformer
+    from sklearn.preprocessing import OneHotEncoder, OrdinalEncoder
+
+    if not isinstance(ct, ColumnTransformer):
+        raise UnsupportedPipeline(f"Expected a ColumnTransformer, got {type(ct).__name__}")
+    names_in = list(getattr(ct, "feature_names_in_", []))
+
+    blocks: List[Any] = []
+    offset = 0
+    for _, trans, cols in ct.transformers_:
+        if trans == "drop" or len(cols) == 0:
+            continue
+        cols = [c if isinstance(c, str) else names_in[int(c)] for c in cols]
+        if isinstance(trans, OneHotEncoder):
+            if getattr(trans, "_infrequent_enabled", False):
+                raise UnsupportedPipeline("OneHotEncoder with infrequent categories is not supported")
+            drop_idx = trans.drop_idx_
+            for j, col in enumerate(cols):
+                d = None if drop_idx is None or drop_idx[j] is None else int(drop_idx[j])
+                block = _CategoricalBlock(col, list(trans.categories_[j]), offset, onehot=True,
+                                          drop_idx=d, unknown_error=trans.handle_unknown == "error")
+                blocks.append(block)
+                offset += block.width
+        elif isinstance(trans, OrdinalEncoder):
+            if trans.handle_unknown == "use_encoded_value" and not (
+                    isinstance(trans.unknown_value, float) and math.isnan(trans.unknown_value)):
+                raise UnsupportedPipeline("OrdinalEncoder unknown_value must be NaN")
+            for j, col in enumerate(cols):
+                blocks.append(_CategoricalBlock(col, list(trans.categories_[j]), offset, onehot=False,
+                                                unknown_error=trans.handle_unknown == "error"))
+                offset += 1
+        else:
+            scale, shift = _affine_params(trans, len(cols))
+            for j, col in enumerate(cols):
+                blocks.append(_AffineBlock(col, offset, float(scale[j]), float(shift[j])))
+                offset += 1
+    return blocks, offset
+
+
+# ——— models ———
+class _LinearModel:
+    kind = "linear"
+
+    def __init__(self, est):
+        coef = np.asarray(est.coef_, dtype=np.float64).ravel()
+        self.coef = coef
+        self.coef_list = coef.tolist()
+        self.intercept = float(np.ravel(est.intercept_)[0]) if np.ndim(est.intercept_) else float(est.intercept_)
+
+    def score(self, x: List[float]) -> float:
+        return self.intercept + sum(c * v for c, v in zip(self.coef_list, x) if v)
+
+    def score_matrix(self, X: np.ndarray) -> np.ndarray:
+        return X @ self.coef + self.intercept
+
+
+class _TreeEnsemble:
+    """All trees concatenated into flat arrays; node ids are global offsets."""
+    kind = "trees"
+
+    def __init__(self, trees: Sequence[Any], scale: float, base: float, average: bool):
+        left, right, feat, thr, val, roots = [], [], [], [], [], []
+        offset = 0
+        for t in trees:
+            tree = t.tree_
+            n = tree.node_count
+            is_leaf = tree.children_left == -1
+            left.append(np.where(is_leaf, -1, tree.children_left + offset))
+            right.append(np.where(is_leaf, -1, tree.children_right + offset))
+            feat.append(tree.feature)
+            thr.append(tree.threshold)
+            val.append(tree.value.reshape(n, -1)[:, 0])
+            roots.append(offset)
+            offset += n
+        self.left = np.concatenate(left).astype(np.int64)
+        self.right = np.concatenate(right).astype(np.int64)
+        self.feature = np.concatenate(feat).astype(np.int64)
+        self.threshold = np.concatenate(thr).astype(np.float64)
+        self.value = np.concatenate(val).astype(np.float64)
+        self.roots = np.asarray(roots, dtype=np.int64)
+        self.scale = scale / len(trees) if average else scale
+        self.base = base
+        # Listas Python: indexarlas es mucho más rápido que numpy para una sola fila
+        self._left = self.left.tolist()
+        self._right = self.right.tolist()
+        self._feature = self.feature.tolist()
+        self._threshold = self.threshold.tolist()
+        self._value = self.value.tolist()
+        self._roots = self.roots.tolist()
+
+    def score(self, x: List[float]) -> float:
+        # sklearn compara en float32
+        x = np.asarray(x, dtype=np.float32).tolist()
+        left, right, feat, thr, val = self._left, self._right, self._feature, self._threshold, self._value
+        total = 0.0
+        for node in self._roots:
+            while left[node] != -1:
+                node = left[node] if x[feat[node]] <= thr[node] else right[node]
+            total += val[node]
+        return self.base + self.scale * total
+
+    def score_matrix(self, X: np.ndarray) -> np.ndarray:
+        X = np.asarray(X, dtype=np.float32)
+        rows = np.arange(X.shape[0])
+        total = np.zeros(X.shape[0], dtype=np.float64)
+        for root in self._roots:
+            node = np.full(X.shape[0], root, dtype=np.int64)
+            active = self.left[node] != -1
+            while active.any():
+                n = node[active]
+                go_left = X[rows[active], self.feature[n]] <= self.threshold[n]
+                node[active] = np.where(go_left, self.left[n], self.right[n])
+                active = self.left[node] != -1
+            total += self.value[node]
+        return self.base + self.scale * total
+
+
+def _compile_model(est):
+    from sklearn.ensemble import (ExtraTreesRegressor, GradientBoostingRegressor,
+                                  RandomForestRegressor)
+    from sklearn.tree import DecisionTreeRegressor, ExtraTreeRegressor
+
+    if isinstance(est, (DecisionTreeRegressor, ExtraTreeRegressor)):
+        return _TreeEnsemble([est], scale=1.0, base=0.0, average=False)
+    if isinstance(est, (RandomForestRegressor, ExtraTreesRegressor)):
+        return _TreeEnsemble(list(est.estimators_), scale=1.0, base=0.0, average=True)
+    if isinstance(est, GradientBoostingRegressor):
+        if est.loss not in ("squared_error", "absolute_error", "huber", "quantile"):
+            raise UnsupportedPipeline(f"Unsupported GradientBoosting loss: {est.loss}")
+        if est.init_ == "zero":
+            base = 0.0
+        elif hasattr(est.init_, "constant_"):
+            base = float(np.ravel(est.init_.constant_)[0])
+        else:
+            raise UnsupportedPipeline("GradientBoosting init estimator must be a DummyRegressor")
+        return _TreeEnsemble(list(est.estimators_[:, 0]), scale=float(est.learning_rate),
+                             base=base, average=False)
+    if hasattr(est, "coef_") and hasattr(est, "intercept_") and np.ndim(est.coef_) <= 1:
+        return _LinearModel(est)
+    raise UnsupportedPipeline(f"Unsupported estimator: {type(est).__name__}")
+
+
+# ——— public engine ———
+class CompiledPipeline:
+    """Flat-array version of a fitted [preprocessor, regressor] Pipeline."""
+
+    def __init__(self, pipeline):
+        from sklearn.pipeline import Pipeline
+
+        if not isinstance(pipeline, Pipeline) or len(pipeline.steps) != 2:
+            raise UnsupportedPipeline("Expected Pipeline([preprocessor, regressor])")
+        self.pipeline = pipeline
+        self.blocks, self.n_features = _compile_preprocessor(pipeline.steps[0][1])
+        self.model = _compile_model(pipeline.steps[-1][1])
+        self.columns = sorted({b.column for b in self.blocks})
+
+    def transform_one(self, payload: Dict[str, Any]) -> List[float]:
+        x = [0.0] * self.n_features
+        for block in self.blocks:
+            try:
+                value = payload[block.column]
+            except KeyError:
+                raise KeyError(f"Missing feature '{block.column}'") from None
+            block.fill(value, x)
+        return x
+
+    def predict_one(self, payload: Dict[str, Any]) -> float:
+        return float(self.model.score(self.transform_one(payload)))
+
+    def predict_rows(self, payloads: Iterable[Dict[str, Any]]) -> np.ndarray:
+        X = np.array([self.transform_one(p) for p in payloads], dtype=np.float64)
+        if X.size == 0:
+            return np.empty(0, dtype=np.float64)
+        return self.model.score_matrix(X)
+
+    def check_parity(self, payloads: Sequence[Dict[str, Any]], rtol: float = 1e-6,
+                     atol: float = 1e-6) -> Dict[str, float]:
+        """Scores `payloads` on both paths; raises ParityError past tolerance."""
+        import pandas as pd
+
+        expected = np.asarray(self.pipeline.predict(pd.DataFrame(list(payloads))), dtype=np.float64)
+        got = np.array([self.predict_one(p) for p in payloads], dtype=np.float64)
+        diff = np.abs(got - expected)
+        bad = ~np.isclose(got, expected, rtol=rtol, atol=atol)
+        report = {
+            "n": int(len(payloads)),
+            "max_abs_diff": float(diff.max()) if len(diff) else 0.0,
+            "mismatches": int(bad.sum()),
+        }
+        if bad.any():
+            i = int(np.flatnonzero(bad)[0])
+            raise ParityError(
+                f"{report['mismatches']}/{report['n']} rows outside tolerance "
+                f"(row {i}: compiled={got[i]!r} sklearn={expected[i]!r})"
+            )
+        return report
+
+
+def compile_pipeline(pipeline, parity_sample: Sequence[Dict[str, Any]] | None = None) -> CompiledPipeline:
+    """Compiles `pipeline`; with parity_sample, verifies it before returning."""
+    compiled = CompiledPipeline(pipeline)
+    if parity_sample:
+        compiled.check_parity(parity_sample)
+    return compiled
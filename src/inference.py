@@ -1,24 +1,203 @@
+import os
 import pandas as pd
-import joblib
-from pathlib import Path
-
-_model = None
-
-def _default_model_path() -> Path:
-    repo_root = Path(__file__).resolve().parents[1]  # sube de src/ a raíz
-    return repo_root / "freight_rate_pipeline.joblib"
-
-def load_model(path: str | None = None):
-    global _model
-    if _model is None:
-        model_path = Path(path) if path else _default_model_path()
-        if not model_path.exists():
-            raise FileNotFoundError(f"Model file not found: {model_path}")
-        _model = joblib.load(model_path)
-    return _model
-
-def predict_one(payload: dict, model_path: str | None = None) -> float:
-    model = load_model(model_path)
-    X = pd.DataFrame([payload])
-    yhat = model.predict(X)[0]
-    return float(yhat)
\ No newline at end of file
+import numpy as np
+import weakref
+from typing import Any, Iterable, List, Tuple
+
+from .metrics import stage
+from .model_registry import ModelEntry, ModelRegistry
+
+# Feature contract of freight_rate_pipeline.joblib (same 18 fields the portal builds)
+CATEGORICAL_FEATURES = [
+    "client_type", "origin", "destination", "load_type",
+    "vehicle_type", "contract_type", "season", "weather",
+]
+NUMERIC_FEATURES = [
+    "distance_km", "load_weight_tons", "fuel_price_aed_per_litre", "salik_gates",
+    "salik_charges_aed", "customs_fees_aed", "waiting_time_hours",
+    "backhaul_available", "month", "peak_demand_factor",
+]
+FEATURE_COLUMNS = [
+    "client_type", "origin", "destination", "distance_km", "load_type",
+    "load_weight_tons", "vehicle_type", "fuel_price_aed_per_litre", "salik_gates",
+    "salik_charges_aed", "customs_fees_aed", "waiting_time_hours", "contract_type",
+    "backhaul_available", "month", "season", "weather", "peak_demand_factor",
+]
+
+DEFAULT_CHUNK_SIZE = 4096
+# predict_many: "local" en este proceso, "pool" en procesos de inferencia (src/inference_pool.py)
+INFERENCE_BACKEND = os.environ.get("INFERENCE_BACKEND", "local")
+# categóricas codificadas por columnas antes del modelo (src/pre_encoding.py); "0" = pipeline tal cual
+PRE_ENCODE = os.environ.get("INFERENCE_PRE_ENCODE", "1") != "0"
+
+# Modelos por ruta (y overrides por cliente), mmap y recarga en caliente
+registry = ModelRegistry()
+
+def get_model_entry(path: str | None = None, client_id: str | None = None) -> ModelEntry:
+    return registry.get(path, client_id)
+
+def load_model(path: str | None = None, client_id: str | None = None):
+    return registry.get(path, client_id).model
+
+def predict_one(payload: dict, model_path: str | None = None, client_id: str | None = None) -> float:
+    model = load_model(model_path, client_id)
+    with stage("frame_build"):
+        X = pd.DataFrame([payload])
+    with stage("model_predict"):
+        yhat = model.predict(X)[0]
+    return float(yhat)
+
+
+# ——— compiled fast path (src/fast_inference.py) ———
+# model -> CompiledPipeline | None (no compilable); se libera con el modelo al recargar
+_compiled: "weakref.WeakKeyDictionary[Any, Any]" = weakref.WeakKeyDictionary()
+
+def get_compiled(model):
+    """Compiled version of `model`, or None if the pipeline is not supported."""
+    from .fast_inference import UnsupportedPipeline, compile_pipeline
+
+    if model not in _compiled:
+        try:
+            _compiled[model] = compile_pipeline(model)
+        except UnsupportedPipeline:
+            _compiled[model] = None
+    return _compiled[model]
+
+def predict_one_fast(payload: dict, model_path: str | None = None, parity: bool = False,
+                     client_id: str | None = None) -> float:
+    """
+    Same contract as predict_one without pandas. Falls back to the sklearn
+    path when the pipeline cannot be compiled; parity=True also scores with
+    sklearn and raises ParityError if they disagree.
+    """
+    model = load_model(model_path, client_id)
+    compiled = get_compiled(model)
+    if compiled is None:
+        return predict_one(payload, model_path, client_id)
+    if parity:
+        compiled.check_parity([payload])
+    with stage("model_predict"):
+        return compiled.predict_one(payload)
+
+
+# ——— pre-encoding for batches (src/pre_encoding.py) ———
+_encoders: "weakref.WeakKeyDictionary[Any, Any]" = weakref.WeakKeyDictionary()
+
+def get_encoder(model):
+    """PreEncoder for `model`, or None if its pipeline is not supported."""
+    from .fast_inference import UnsupportedPipeline
+    from .pre_encoding import PreEncoder
+
+    if model not in _encoders:
+        try:
+            _encoders[model] = PreEncoder(model)
+        except UnsupportedPipeline:
+            _encoders[model] = None
+    return _encoders[model]
+
+
+# ——— batch quoting ———
+def _to_frame(payloads: Any) -> pd.DataFrame:
+    """Accepts a list of dicts, a pyarrow Table or a DataFrame."""
+    if isinstance(payloads, pd.DataFrame):
+        return payloads.reset_index(drop=True)
+    if hasattr(payloads, "to_pandas"):  # pyarrow.Table / RecordBatch
+        return payloads.to_pandas()
+    return pd.DataFrame.from_records(list(payloads))
+
+def _validate_frame(df: pd.DataFrame) -> Tuple[pd.DataFrame, List[Tuple[int, str]]]:
+    """Coerces feature columns and returns (clean frame, [(row, error), ...])."""
+    errors: dict[int, List[str]] = {}
+    missing = [c for c in FEATURE_COLUMNS if c not in df.columns]
+    X = df.reindex(columns=FEATURE_COLUMNS).copy()
+
+    def flag(mask: np.ndarray, reason: str) -> None:
+        for i in np.flatnonzero(mask):
+            errors.setdefault(int(i), []).append(reason)
+
+    for col in FEATURE_COLUMNS:
+        if col in missing:
+            flag(np.ones(len(X), dtype=bool), f"missing column '{col}'")
+            continue
+        absent = X[col].isna().to_numpy()
+        flag(absent, f"missing value for '{col}'")
+        if col in NUMERIC_FEATURES:
+            coerced = pd.to_numeric(X[col], errors="coerce").astype(float)
+            flag(~np.isfinite(coerced.to_numpy()) & ~absent, f"invalid numeric value for '{col}'")
+            X[col] = coerced
+        else:
+            X[col] = X[col].astype(object)
+
+    return X, [(i, "; ".join(msgs)) for i, msgs in sorted(errors.items())]
+
+def _predict_chunk(model, X: pd.DataFrame, rows: np.ndarray, out: np.ndarray,
+                   errors: List[Tuple[int, str]], encoder=None) -> None:
+    if encoder is not None:
+        try:
+            yhat, unseen = encoder.predict(X)
+        except Exception:
+            pass  # el pipeline completo (abajo) decide y aísla las filas culpables
+        else:
+            out[rows[~unseen]] = yhat[~unseen]
+            if not unseen.any():
+                return
+            X, rows = X[unseen], rows[unseen]  # categorías nuevas: sólo esas filas por el pipeline
+    try:
+        out[rows] = model.predict(X)
+    except Exception:
+        # Aísla las filas culpables sin tumbar el resto del chunk
+        for pos, i in enumerate(rows):
+            try:
+                out[i] = model.predict(X.iloc[pos:pos + 1])[0]
+            except Exception as e:
+                errors.append((int(i), f"{type(e).__name__}: {e}"))
+
+def set_backend(name: str) -> None:
+    """Switches predict_many between "local" and "pool" at runtime (same as INFERENCE_BACKEND)."""
+    global INFERENCE_BACKEND
+    if name not in ("local", "pool"):
+        raise ValueError(f"Unknown inference backend {name!r}")
+    INFERENCE_BACKEND = name
+
+def predict_many(
+    payloads: Iterable[dict] | pd.DataFrame,
+    model_path: str | None = None,
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+    return_errors: bool = False,
+    client_id: str | None = None,
+):
+    """
+    Vectorized predict_one: one model.predict per chunk of `chunk_size` rows.
+
+    Returns a float64 array in input order. Rows that fail validation or
+    prediction are NaN; with return_errors=True also returns a list of
+    (row_index, message) so callers can report them individually.
+    With INFERENCE_BACKEND=pool the batch is scored by the worker processes
+    of src/inference_pool.py, with the same contract.
+    """
+    if INFERENCE_BACKEND == "pool":
+        from .inference_pool import get_pool
+        return get_pool().predict_many(payloads, model_path, chunk_size, return_errors, client_id)
+    return _predict_many_local(payloads, model_path, chunk_size, return_errors, client_id)
+
+def _predict_many_local(payloads, model_path, chunk_size, return_errors, client_id):
+    if chunk_size < 1:
+        raise ValueError("chunk_size must be >= 1")
+    model = load_model(model_path, client_id)
+    encoder = get_encoder(model) if PRE_ENCODE else None
+    with stage("frame_build"):
+        X, errors = _validate_frame(_to_frame(payloads))
+
+    out = np.full(len(X), np.nan, dtype=np.float64)
+    ok = np.ones(len(X), dtype=bool)
+    ok[[i for i, _ in errors]] = False
+    valid_rows = np.flatnonzero(ok)
+
+    for start in range(0, len(valid_rows), chunk_size):
+        rows = valid_rows[start:start + chunk_size]
+        with stage("model_predict_batch"):
+            _predict_chunk(model, X.iloc[rows], rows, out, errors, encoder)
+
+    if return_errors:
+        return out, sorted(errors)
+    return out
@@ -0,0 +1,353 @@
+"""
+Process pool for batch scoring: predict_many on N cores instead of one GIL.
+
+    INFERENCE_BACKEND=pool INFERENCE_POOL_WORKERS=4   # src.inference.predict_many goes through here
+
+Each worker is a separate process that loads models through its own
+ModelRegistry (joblib mmap_mode="r": the arrays are the file's pages in the
+page cache, shared by every worker, not copies). Batches do not travel as
+pickled DataFrames: the caller writes the feature columns as an Arrow IPC
+stream straight into a per-worker SharedMemory segment, the worker maps it
+zero-copy, scores it with the same predict_many code path and writes the
+float64 rates into a second segment; only the row errors go through the
+pipe. Large batches are split across idle workers and scored in parallel.
+
+A worker that dies (segfault, OOM kill) is restarted and its slice retried
+once; a worker that exceeds INFERENCE_POOL_TIMEOUT_S is killed and
+restarted, and the call raises TimeoutError.
+"""
+from __future__ import annotations
+
+import atexit
+import math
+import multiprocessing as mp
+import os
+import queue
+import threading
+from multiprocessing.shared_memory import SharedMemory
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+from .metrics import METRICS, stage
+
+INFERENCE_POOL_WORKERS = int(os.environ.get("INFERENCE_POOL_WORKERS", 0) or 0) or (os.cpu_count() or 1)
+INFERENCE_POOL_START_METHOD = os.environ.get("INFERENCE_POOL_START_METHOD", "spawn")  # spawn | forkserver | fork
+INFERENCE_POOL_TIMEOUT_S = float(os.environ.get("INFERENCE_POOL_TIMEOUT_S", 120))
+MIN_ROWS_PER_WORKER = int(os.environ.get("INFERENCE_POOL_MIN_ROWS", 512))  # por debajo no compensa repartir
+
+_INITIAL_IN_BYTES = 1 << 20
+_INITIAL_OUT_ROWS = 1 << 14
+
+METRICS.describe("inference_pool_restarts_total", "Inference worker processes restarted after a crash or timeout")
+
+
+class WorkerCrashed(RuntimeError):
+    """An inference worker process died while scoring a batch."""
+
+
+# ——— lado del worker ———
+def _attach(cache: Dict[str, SharedMemory], name: str) -> SharedMemory:
+    shm = cache.get(name)
+    if shm is None:
+        for old in cache.values():
+            try:
+                old.close()
+            except BufferError:  # aún hay una vista viva: el mmap se libera con ella, no bloquea el lote
+                pass
+        cache.clear()
+        shm = cache[name] = SharedMemory(name=name)
+    return shm
+
+
+def _without_frames(exc: BaseException) -> BaseException:
+    """Drops the tracebacks: their frames keep the batch (a view of the input segment) alive."""
+    seen = set()
+    e: Optional[BaseException] = exc
+    while e is not None and id(e) not in seen:
+        seen.add(id(e))
+        e.__traceback__ = None
+        e = e.__cause__ or e.__context__
+    return exc
+
+
+def _worker_main(conn, sys_path: List[str]) -> None:
+    import sys
+
+    sys.path[:0] = [p for p in sys_path if p not in sys.path]
+    os.environ["INFERENCE_BACKEND"] = "local"  # un worker nunca delega en otro pool
+    import pyarrow as pa
+
+    from src.inference import _predict_many_local, get_model_entry
+
+    try:
+        get_model_entry()  # modelo por defecto precargado (mmap), como reprice._worker_init
+    except FileNotFoundError:
+        pass
+    conn.send(("ready", os.getpid()))
+
+    inputs: Dict[str, SharedMemory] = {}
+    outputs: Dict[str, SharedMemory] = {}
+    while True:
+        try:
+            msg = conn.recv()
+        except (EOFError, KeyboardInterrupt):
+            break
+        if msg[0] == "stop":
+            break
+        _, in_name, nbytes, out_name, model_path, client_id, chunk_size = msg
+        buf = table = out = None
+        try:
+            buf = _attach(inputs, in_name).buf
+            table = pa.ipc.open_stream(pa.py_buffer(buf[:nbytes])).read_all()
+            raw, errors = _predict_many_local(table, model_path, chunk_size, True, client_id)
+            out = np.ndarray(len(raw), dtype=np.float64, buffer=_attach(outputs, out_name).buf)
+            out[:] = raw
+            reply: Tuple[str, Any] = ("ok", errors)
+        except Exception as e:
+            reply = ("error", _without_frames(e))
+        finally:
+            buf = table = out = None  # sin referencias vivas a los segmentos (se pueden reasignar)
+        try:
+            conn.send(reply)
+        except Exception:  # excepción no serializable
+            conn.send(("error", RuntimeError(f"{type(reply[1]).__name__}: {reply[1]}")))
+    for shm in (*inputs.values(), *outputs.values()):
+        try:
+            shm.close()
+        except BufferError:
+            pass
+
+
+# ——— lado del llamador ———
+class _Worker:
+    def __init__(self, ctx, index: int):
+        self.ctx = ctx
+        self.index = index
+        self.proc = None
+        self.conn = None
+        self.in_shm = SharedMemory(create=True, size=_INITIAL_IN_BYTES)
+        self.out_shm = SharedMemory(create=True, size=_INITIAL_OUT_ROWS * 8)
+        try:
+            self.start()
+        except BaseException:
+            self.close()
+            raise
+
+    def start(self) -> None:
+        import sys
+
+        parent, child = self.ctx.Pipe()
+        self.proc = self.ctx.Process(target=_worker_main, args=(child, list(sys.path)),
+                                     name=f"inference-worker-{self.index}", daemon=True)
+        self.proc.start()
+        child.close()
+        self.conn = parent
+        if not parent.poll(INFERENCE_POOL_TIMEOUT_S):
+            raise TimeoutError(f"Inference worker {self.index} did not start")
+        try:
+            parent.recv()
+        except EOFError:
+            self.proc.join(5)
+            raise WorkerCrashed(f"Inference worker {self.index} failed to start "
+                                f"(exit code {self.proc.exitcode})") from None
+
+    def restart(self) -> None:
+        METRICS.inc("inference_pool_restarts_total")
+        self.kill()
+        self.start()
+
+    def kill(self) -> None:
+        if self.proc is not None and self.proc.is_alive():
+            self.proc.kill()
+        if self.proc is not None:
+            self.proc.join(5)
+        if self.conn is not None:
+            self.conn.close()
+
+    @staticmethod
+    def _grow(shm: SharedMemory, size: int) -> SharedMemory:
+        if shm.size >= size:
+            return shm
+        shm.close()
+        shm.unlink()
+        return SharedMemory(create=True, size=1 << max(size - 1, 1).bit_length())
+
+    def send(self, table, model_path: Optional[str], client_id: Optional[str], chunk_size: int) -> None:
+        import pyarrow as pa
+
+        sink = pa.MockOutputStream()  # tamaño exacto del stream sin copiar datos
+        with pa.ipc.new_stream(sink, table.schema) as writer:
+            writer.write_table(table)
+        nbytes = sink.size()
+        self.in_shm = self._grow(self.in_shm, nbytes)
+        self.out_shm = self._grow(self.out_shm, 8 * table.num_rows)
+        with pa.ipc.new_stream(pa.FixedSizeBufferWriter(pa.py_buffer(self.in_shm.buf)), table.schema) as writer:
+            writer.write_table(table)
+        msg = ("predict", self.in_shm.name, nbytes, self.out_shm.name, model_path, client_id, chunk_size)
+        if not self.proc.is_alive():  # murió mientras estaba libre
+            self.restart()
+        try:
+            self.conn.send(msg)
+        except (BrokenPipeError, ConnectionError):
+            self.restart()
+            self.conn.send(msg)
+
+    def recv(self, n_rows: int, timeout: float) -> Tuple[np.ndarray, List[Tuple[int, str]]]:
+        waited = 0.0
+        while not self.conn.poll(0.5):
+            waited += 0.5
+            if not self.proc.is_alive():
+                raise WorkerCrashed(f"Inference worker {self.index} exited with code {self.proc.exitcode}")
+            if waited >= timeout:
+                self.restart()
+                raise TimeoutError(f"Inference worker {self.index} took more than {timeout:g}s")
+        try:
+            status, body = self.conn.recv()
+        except (EOFError, ConnectionError):
+            raise WorkerCrashed(f"Inference worker {self.index} closed its pipe") from None
+        if status == "error":
+            raise body
+        raw = np.ndarray(n_rows, dtype=np.float64, buffer=self.out_shm.buf).copy()
+        return raw, body
+
+    def close(self) -> None:
+        try:
+            if self.proc is not None and self.proc.is_alive():
+                self.conn.send(("stop",))
+                self.proc.join(5)
+        except (OSError, ValueError):
+            pass
+        self.kill()
+        for shm in (self.in_shm, self.out_shm):
+            shm.close()
+            shm.unlink()
+
+
+def _to_arrow(payloads: Any):
+    """Feature columns of a batch as a pyarrow Table (mixed-type columns as strings)."""
+    import pandas as pd
+    import pyarrow as pa
+
+    from .inference import FEATURE_COLUMNS, _to_frame
+
+    if isinstance(payloads, pa.Table):
+        return payloads.select([c for c in FEATURE_COLUMNS if c in payloads.column_names])
+    df = _to_frame(payloads)
+    df = df[[c for c in FEATURE_COLUMNS if c in df.columns]]
+    try:
+        return pa.Table.from_pandas(df, preserve_index=False)
+    except (pa.ArrowInvalid, pa.ArrowTypeError):
+        # p.ej. "3.1" y 3.1 en la misma columna: el worker valida/convierte igual que predict_many
+        mixed = {c: df[c].map(lambda v: None if v is None or (isinstance(v, float) and math.isnan(v)) else str(v))
+                 for c in df.columns if df[c].dtype == object}
+        return pa.Table.from_pandas(df.assign(**mixed), preserve_index=False)
+
+
+class InferencePool:
+    """N scoring processes; predict_many() has the same contract as src.inference.predict_many."""
+
+    def __init__(self, workers: int = INFERENCE_POOL_WORKERS, start_method: str = INFERENCE_POOL_START_METHOD,
+                 timeout_s: float = INFERENCE_POOL_TIMEOUT_S, min_rows_per_worker: int = MIN_ROWS_PER_WORKER):
+        if workers < 1:
+            raise ValueError("workers must be >= 1")
+        ctx = mp.get_context(start_method)
+        self.timeout_s = timeout_s
+        self.min_rows_per_worker = max(1, min_rows_per_worker)
+        self._workers: List[_Worker] = []
+        try:
+            for i in range(workers):
+                self._workers.append(_Worker(ctx, i))
+        except BaseException:
+            for w in self._workers:
+                w.close()
+            raise
+        self._idle: "queue.Queue[_Worker]" = queue.Queue()
+        for w in self._workers:
+            self._idle.put(w)
+        self._closed = False
+
+    @property
+    def size(self) -> int:
+        return len(self._workers)
+
+    def _acquire(self, wanted: int) -> List[_Worker]:
+        got = [self._idle.get(timeout=self.timeout_s)]  # al menos uno, esperando si hace falta
+        while len(got) < wanted:
+            try:
+                got.append(self._idle.get_nowait())
+            except queue.Empty:
+                break
+        return got
+
+    def predict_many(self, payloads: Iterable[dict] | Any, model_path: str | None = None,
+                     chunk_size: int = 4096, return_errors: bool = False, client_id: str | None = None):
+        if self._closed:
+            raise RuntimeError("InferencePool is closed")
+        if chunk_size < 1:
+            raise ValueError("chunk_size must be >= 1")
+        with stage("pool_encode"):
+            table = _to_arrow(payloads)
+        n = table.num_rows
+        out = np.full(n, np.nan, dtype=np.float64)
+        errors: List[Tuple[int, str]] = []
+        if n == 0:
+            return (out, errors) if return_errors else out
+
+        workers = self._acquire(max(1, min(self.size, n // self.min_rows_per_worker)))
+        bounds = np.linspace(0, n, len(workers) + 1).astype(int).tolist()
+        parts = list(zip(workers, bounds[:-1], bounds[1:]))
+        failure: Optional[BaseException] = None
+        try:
+            with stage("pool_predict"):
+                for w, a, b in parts:
+                    w.send(table.slice(a, b - a), model_path, client_id, chunk_size)
+                for w, a, b in parts:
+                    try:
+                        try:
+                            raw, errs = w.recv(b - a, self.timeout_s)
+                        except WorkerCrashed:
+                            w.restart()  # un reintento con el worker nuevo
+                            w.send(table.slice(a, b - a), model_path, client_id, chunk_size)
+                            raw, errs = w.recv(b - a, self.timeout_s)
+                        out[a:b] = raw
+                        errors.extend((i + a, msg) for i, msg in errs)
+                    except BaseException as e:  # recogemos el resto antes de propagar
+                        failure = failure or e
+        finally:
+            for w in workers:
+                self._idle.put(w)
+        if failure is not None:
+            raise failure
+        if return_errors:
+            return out, sorted(errors)
+        return out
+
+    def close(self) -> None:
+        if self._closed:
+            return
+        self._closed = True
+        for w in self._workers:
+            w.close()
+
+
+_pool: Optional[InferencePool] = None
+_pool_lock = threading.Lock()
+
+
+def get_pool(workers: int | None = None) -> InferencePool:
+    """Process-wide pool, started on first use and stopped at interpreter exit."""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = InferencePool(workers or INFERENCE_POOL_WORKERS)
+            atexit.register(_pool.close)
+        return _pool
+
+
+def shutdown_pool() -> None:
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.close()
+            _pool = None
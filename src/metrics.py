@@ -0,0 +1,255 @@
+"""
+In-process metrics and per-request tracing.
+
+    with stage("model_predict"):
+        ...
+
+Each stage() feeds a latency histogram (stage_seconds{stage=...}) and, if
+the caller opened a trace(), appends (stage, ms) to it so one request's
+breakdown can be shown (Streamlit admin panel). Counters cover upstream
+errors; collectors registered with METRICS.add_collector() export gauges
+computed on scrape (cache hit ratios, queue depth...). render() produces
+the Prometheus text format served at /metrics.
+
+Profiling is opt-in: with PROFILE_SLOW_MS set, profile_if_slow() runs
+cProfile on a PROFILE_SAMPLE_RATE fraction of calls and dumps a .prof file
+(snakeviz / flameprof / gprof2dot) to PROFILE_DIR for the slow ones.
+Use it only around synchronous code (quote(), sweep(), a thread-pool job):
+cProfile hooks the calling thread, so around an await it would record
+everything else the event loop ran meanwhile.
+"""
+from __future__ import annotations
+
+import bisect
+import contextvars
+import cProfile
+import os
+import random
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+ROOT = Path(__file__).resolve().parents[1]
+
+# segundos; cubre desde una búsqueda en caché (<1 ms) hasta Mapbox con reintentos
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+Labels = Tuple[Tuple[str, str], ...]
+Sample = Tuple[str, str, str, Dict[str, Any], float]  # name, type, help, labels, value
+
+
+class Histogram:
+    """Cumulative-bucket histogram (Prometheus semantics)."""
+
+    def __init__(self, buckets: Iterable[float] = DEFAULT_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        self.counts = [0] * (len(self.buckets) + 1)  # último = +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def quantile(self, q: float) -> float:
+        """Upper bound of the bucket holding the q-quantile (inf if beyond the last)."""
+        if not self.count:
+            return 0.0
+        target, acc = q * self.count, 0
+        for bound, n in zip((*self.buckets, float("inf")), self.counts):
+            acc += n
+            if acc >= target:
+                return bound
+        return float("inf")
+
+
+class MetricsRegistry:
+    def __init__(self, namespace: str = "optimumlogit"):
+        self.namespace = namespace
+        self._lock = threading.Lock()
+        self._hist: Dict[Tuple[str, Labels], Histogram] = {}
+        self._counters: Dict[Tuple[str, Labels], float] = {}
+        self._help: Dict[str, str] = {}
+        self._collectors: List[Callable[[], Iterable[Sample]]] = []
+
+    @staticmethod
+    def _labels(labels: Dict[str, Any]) -> Labels:
+        return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+    def describe(self, name: str, help_text: str) -> None:
+        self._help[name] = help_text
+
+    def observe(self, name: str, value: float, **labels: Any) -> None:
+        key = (name, self._labels(labels))
+        with self._lock:
+            h = self._hist.get(key)
+            if h is None:
+                h = self._hist[key] = Histogram()
+            h.observe(value)
+
+    def inc(self, name: str, value: float = 1.0, **labels: Any) -> None:
+        key = (name, self._labels(labels))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0.0) + value
+
+    def add_collector(self, fn: Callable[[], Iterable[Sample]]) -> None:
+        """fn() -> [(name, "gauge"|"counter", help, labels, value), ...], called on every scrape."""
+        self._collectors.append(fn)
+
+    def snapshot(self) -> Dict[str, Any]:
+        """JSON-friendly summary: histograms as count/avg/p50/p95/p99 in ms, counters as-is."""
+        with self._lock:
+            hists = {k: (h.count, h.sum, h.quantile(0.5), h.quantile(0.95), h.quantile(0.99))
+                     for k, h in self._hist.items()}
+            counters = dict(self._counters)
+        out: Dict[str, Any] = {"histograms": {}, "counters": {}}
+        for (name, labels), (count, total, p50, p95, p99) in sorted(hists.items()):
+            out["histograms"][_series(name, labels)] = {
+                "count": count, "avg_ms": round(1000 * total / count, 3) if count else 0.0,
+                "p50_ms_le": 1000 * p50, "p95_ms_le": 1000 * p95, "p99_ms_le": 1000 * p99,
+            }
+        for (name, labels), v in sorted(counters.items()):
+            out["counters"][_series(name, labels)] = v
+        return out
+
+    def render(self) -> str:
+        """Prometheus text exposition format 0.0.4."""
+        ns = self.namespace
+        lines: List[str] = []
+        seen: set = set()
+
+        def header(name: str, kind: str, help_text: str = "") -> None:
+            if name not in seen:
+                seen.add(name)
+                lines.append(f"# HELP {ns}_{name} {help_text or self._help.get(name, name)}")
+                lines.append(f"# TYPE {ns}_{name} {kind}")
+
+        with self._lock:
+            hists = {k: (h.buckets, list(h.counts), h.sum, h.count) for k, h in self._hist.items()}
+            counters = dict(self._counters)
+
+        for (name, labels), (buckets, counts, total, count) in sorted(hists.items()):
+            header(name, "histogram")
+            acc = 0
+            for bound, n in zip((*buckets, float("inf")), counts):
+                acc += n
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                lines.append(f"{ns}_{name}_bucket{_fmt_labels(labels + (('le', le),))} {acc}")
+            lines.append(f"{ns}_{name}_sum{_fmt_labels(labels)} {total!r}")
+            lines.append(f"{ns}_{name}_count{_fmt_labels(labels)} {count}")
+
+        for (name, labels), v in sorted(counters.items()):
+            header(name, "counter")
+            lines.append(f"{ns}_{name}{_fmt_labels(labels)} {v!r}")
+
+        for collect in self._collectors:
+            try:
+                samples = list(collect())
+            except Exception:
+                continue  # un colector roto no debe tumbar /metrics
+            for name, kind, help_text, labels, value in samples:
+                if value is None:
+                    continue
+                header(name, kind, help_text)
+                lines.append(f"{ns}_{name}{_fmt_labels(self._labels(labels))} {float(value)!r}")
+        return "\n".join(lines) + "\n"
+
+    def reset(self) -> None:
+        with self._lock:
+            self._hist.clear()
+            self._counters.clear()
+
+
+def _fmt_labels(labels: Labels) -> str:
+    if not labels:
+        return ""
+    esc = lambda v: v.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+    return "{" + ",".join(f'{k}="{esc(v)}"' for k, v in labels) + "}"
+
+
+def _series(name: str, labels: Labels) -> str:
+    return name + _fmt_labels(labels)
+
+
+METRICS = MetricsRegistry()
+METRICS.describe("stage_seconds", "Latency of each quoting stage")
+METRICS.describe("mapbox_requests_total", "Upstream Mapbox HTTP requests (attempts, including retries)")
+METRICS.describe("mapbox_errors_total", "Upstream Mapbox HTTP errors by status")
+METRICS.describe("mapbox_timeouts_total", "Upstream Mapbox requests that timed out")
+METRICS.describe("mapbox_http_seconds", "Latency of each upstream Mapbox HTTP attempt")
+METRICS.describe("slow_profiles_total", "Slow calls dumped by the sampling profiler")
+METRICS.describe("routing_fallbacks_total", "Route features served by the local graph after a Mapbox failure")
+
+
+# ——— trazas por petición ———
+_trace: contextvars.ContextVar[Optional[List[Tuple[str, float]]]] = contextvars.ContextVar("trace", default=None)
+
+
+def current_trace() -> Optional[List[Tuple[str, float]]]:
+    return _trace.get()
+
+
+def bind_trace(spans: Optional[List[Tuple[str, float]]]) -> None:
+    """Attach an existing trace to the current context (e.g. inside a task on another loop)."""
+    _trace.set(spans)
+
+
+@contextmanager
+def trace() -> Iterator[List[Tuple[str, float]]]:
+    """Collects (stage, ms) for every stage() run in this context, in completion order."""
+    spans: List[Tuple[str, float]] = []
+    token = _trace.set(spans)
+    try:
+        yield spans
+    finally:
+        _trace.reset(token)
+
+
+@contextmanager
+def stage(name: str) -> Iterator[None]:
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        dt = time.perf_counter() - t0
+        METRICS.observe("stage_seconds", dt, stage=name)
+        spans = _trace.get()
+        if spans is not None:
+            spans.append((name, round(1000 * dt, 3)))
+
+
+# ——— profiling opcional ———
+PROFILE_SLOW_MS = float(os.environ.get("PROFILE_SLOW_MS", 0) or 0)   # 0 = desactivado
+PROFILE_SAMPLE_RATE = float(os.environ.get("PROFILE_SAMPLE_RATE", 0.1))
+PROFILE_DIR = Path(os.environ.get("PROFILE_DIR", ROOT / ".cache" / "profiles"))
+_profiler_lock = threading.Lock()  # cProfile: un perfilador activo por proceso
+
+
+@contextmanager
+def profile_if_slow(name: str, slow_ms: Optional[float] = None) -> Iterator[None]:
+    """
+    Profiles a sampled call and keeps the dump only if it took >= slow_ms.
+    Synchronous sections only: inside a coroutine it would profile the whole loop.
+    """
+    slow_ms = PROFILE_SLOW_MS if slow_ms is None else slow_ms
+    if slow_ms <= 0 or random.random() >= PROFILE_SAMPLE_RATE or not _profiler_lock.acquire(blocking=False):
+        yield
+        return
+    prof = cProfile.Profile()
+    t0 = time.perf_counter()
+    try:
+        prof.enable()
+        try:
+            yield
+        finally:
+            prof.disable()
+        elapsed_ms = 1000 * (time.perf_counter() - t0)
+        if elapsed_ms >= slow_ms:
+            PROFILE_DIR.mkdir(parents=True, exist_ok=True)
+            prof.dump_stats(PROFILE_DIR / f"{name}-{time.strftime('%Y%m%dT%H%M%S')}-{elapsed_ms:.0f}ms.prof")
+            METRICS.inc("slow_profiles_total", call=name)
+    finally:
+        _profiler_lock.release()
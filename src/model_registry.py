@@ -0,0 +1,261 @@
+"""
+Model registry: lazily loads fitted pipelines keyed by path, shares their
+arrays across worker processes via joblib's mmap_mode="r", and hot-swaps a
+model when its file changes on disk without blocking requests in flight.
+
+Per-client overrides: if clients/<client_id>/freight_rate_pipeline.joblib
+exists it is used for that client instead of the default model.
+
+With mmap the arrays stay backed by the file, so the registry never maps
+the deployed path itself: each version is first copied to an immutable
+snapshot (MODEL_SNAPSHOT_DIR/<name>-<sha12>.joblib) and the snapshot is
+mapped. Overwriting the model in place (joblib.dump to the same path)
+then cannot change or truncate the pages of the model still serving.
+"""
+from __future__ import annotations
+
+import hashlib
+import logging
+import os
+import shutil
+import threading
+import time
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+import joblib
+
+from .metrics import METRICS
+
+MODEL_FILENAME = "freight_rate_pipeline.joblib"
+ROOT = Path(__file__).resolve().parents[1]
+CLIENTS_DIR = Path(os.environ.get("CLIENTS_DIR", ROOT / "clients"))
+MODEL_SNAPSHOT_DIR = Path(os.environ.get("MODEL_SNAPSHOT_DIR", ROOT / ".cache" / "model_snapshots"))
+MODEL_SNAPSHOT_KEEP = int(os.environ.get("MODEL_SNAPSHOT_KEEP", 3))  # versiones por modelo en disco
+
+log = logging.getLogger(__name__)
+METRICS.describe("model_reload_errors_total", "Hot reloads that failed (the previous model kept serving)")
+
+
+@dataclass
+class ModelEntry:
+    path: Path
+    model: Any
+    version: str            # sha256 (12 hex) del fichero
+    mtime_ns: int
+    size: int
+    load_time_s: float
+    rss_delta_bytes: int
+    loaded_at: float = field(default_factory=time.time)
+    checked_at: float = field(default_factory=time.monotonic)
+    snapshot: Optional[Path] = None  # copia inmutable que está mapeada (mmap)
+
+    def info(self) -> Dict[str, Any]:
+        return {
+            "path": str(self.path),
+            "snapshot": str(self.snapshot) if self.snapshot else None,
+            "version": self.version,
+            "size_bytes": self.size,
+            "load_time_s": round(self.load_time_s, 4),
+            "rss_delta_bytes": self.rss_delta_bytes,
+            "loaded_at": self.loaded_at,
+        }
+
+
+def _rss_bytes() -> int:
+    """Resident set size of this process (Linux /proc; 0 if unavailable)."""
+    try:
+        with open("/proc/self/statm", "rb") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        return 0
+
+
+def file_sha256(path: Path, chunk: int = 1 << 20) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(chunk), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def snapshot_model(path: Path, snapshot_dir: Path = MODEL_SNAPSHOT_DIR, keep: int = MODEL_SNAPSHOT_KEEP,
+                   chunk: int = 1 << 20) -> Tuple[Path, str]:
+    """
+    Copies `path` to <snapshot_dir>/<stem>-<path hash>-<sha12><suffix> (hashing
+    while copying) and returns (snapshot, sha12). Raises OSError if the file
+    changed during the copy (a deploy still writing it). Older snapshots of
+    the same path beyond `keep` are removed; processes that still map them
+    keep their pages (POSIX unlink).
+    """
+    snapshot_dir.mkdir(parents=True, exist_ok=True)
+    prefix = f"{path.stem}-{hashlib.sha1(str(path).encode('utf-8')).hexdigest()[:8]}-"
+    st = path.stat()
+    tmp = snapshot_dir / f".{prefix}{os.getpid()}-{threading.get_ident()}.tmp"
+    h = hashlib.sha256()
+    try:
+        with open(path, "rb") as src, open(tmp, "wb") as dst:
+            for block in iter(lambda: src.read(chunk), b""):
+                h.update(block)
+                dst.write(block)
+        after = path.stat()
+        if (after.st_mtime_ns, after.st_size) != (st.st_mtime_ns, st.st_size) or tmp.stat().st_size != st.st_size:
+            raise OSError(f"{path} changed while it was being copied")
+        version = h.hexdigest()[:12]
+        target = snapshot_dir / f"{prefix}{version}{path.suffix}"
+        if target.exists():
+            tmp.unlink()
+        else:
+            os.chmod(tmp, 0o444)
+            os.replace(tmp, target)
+    except BaseException:
+        tmp.unlink(missing_ok=True)
+        raise
+    os.utime(target)  # la más reciente no se poda
+    old = sorted(snapshot_dir.glob(f"{prefix}*{path.suffix}"), key=lambda q: q.stat().st_mtime_ns, reverse=True)
+    for stale in old[max(keep, 1):]:
+        if stale != target:
+            stale.unlink(missing_ok=True)
+    return target, version
+
+
+class ModelRegistry:
+    """
+    Thread-safe map path -> ModelEntry.
+
+    get() stats the file at most every `check_interval` seconds; when the
+    mtime/size changed it reloads in a background thread and keeps serving
+    the previous model until the new one is ready, then swaps the entry.
+    """
+
+    def __init__(self, default_path: Path | None = None, check_interval: float = 2.0,
+                 mmap_mode: Optional[str] = "r"):
+        self.default_path = Path(default_path) if default_path else ROOT / MODEL_FILENAME
+        self.check_interval = check_interval
+        self.mmap_mode = mmap_mode
+        self._entries: Dict[str, ModelEntry] = {}
+        self._lock = threading.Lock()  # sólo para leer/escribir los dicts, nunca durante un joblib.load
+        self._load_locks: Dict[str, threading.Lock] = {}  # ruta -> lock de la primera carga
+        self._reloading: set[str] = set()
+        self._failed: Dict[str, Tuple[int, int]] = {}  # ruta -> (mtime, size) cuya recarga falló
+        # (ruta pedida, cliente) -> (cuándo se resolvió, ruta): sin stat/realpath por cotización
+        self._resolved: Dict[Tuple[Optional[str], Optional[str]], Tuple[float, Path]] = {}
+
+    # ——— resolución de rutas ———
+    def _resolve_now(self, path: str | Path | None, client_id: str | None) -> Path:
+        if path:
+            return Path(path).resolve()
+        if client_id:
+            override = CLIENTS_DIR / client_id / MODEL_FILENAME
+            if override.exists():
+                return override.resolve()
+        return self.default_path.resolve()
+
+    def resolve(self, path: str | Path | None = None, client_id: str | None = None) -> Path:
+        """Model file for (path, client); the override is re-checked every `check_interval` seconds."""
+        key = (str(path) if path else None, None if path else client_id)
+        now = time.monotonic()
+        cached = self._resolved.get(key)
+        if cached is not None and now - cached[0] < self.check_interval:
+            return cached[1]
+        resolved = self._resolve_now(path, client_id)
+        self._resolved[key] = (now, resolved)
+        return resolved
+
+    # ——— carga ———
+    def _load(self, path: Path) -> ModelEntry:
+        if not path.exists():
+            raise FileNotFoundError(f"Model file not found: {path}")
+        st = path.stat()
+        rss0 = _rss_bytes()
+        t0 = time.perf_counter()
+        if self.mmap_mode:
+            # se mapea la copia inmutable, nunca el fichero que se puede sobrescribir
+            snapshot, version = snapshot_model(path)
+            model = joblib.load(snapshot, mmap_mode=self.mmap_mode)
+        else:
+            snapshot, version = None, file_sha256(path)[:12]
+            model = joblib.load(path)
+        load_time = time.perf_counter() - t0
+        return ModelEntry(
+            path=path, model=model, version=version,
+            mtime_ns=st.st_mtime_ns, size=st.st_size,
+            load_time_s=load_time, rss_delta_bytes=max(_rss_bytes() - rss0, 0), snapshot=snapshot,
+        )
+
+    def _path_lock(self, key: str) -> threading.Lock:
+        with self._lock:
+            return self._load_locks.setdefault(key, threading.Lock())
+
+    def _reload_async(self, key: str, path: Path, stamp: Tuple[int, int]) -> None:
+        with self._lock:
+            if key in self._reloading:
+                return
+            self._reloading.add(key)
+
+        def run() -> None:
+            try:
+                entry = self._load(path)
+                with self._lock:
+                    self._entries[key] = entry  # swap atómico
+                    self._failed.pop(key, None)
+            except Exception:
+                # fichero a medio escribir o inválido: seguimos con el modelo anterior y no
+                # se reintenta hasta que el fichero vuelva a cambiar
+                self._failed[key] = stamp
+                METRICS.inc("model_reload_errors_total", model=path.name)
+                log.exception("Reload of %s failed; still serving the previous version", path)
+            finally:
+                with self._lock:
+                    self._reloading.discard(key)
+
+        threading.Thread(target=run, name=f"model-reload:{path.name}", daemon=True).start()
+
+    def _changed(self, entry: ModelEntry) -> Optional[Tuple[int, int]]:
+        """New (mtime, size) if the file changed since `entry` was loaded, else None."""
+        try:
+            st = entry.path.stat()
+        except OSError:
+            return None
+        stamp = (st.st_mtime_ns, st.st_size)
+        return stamp if stamp != (entry.mtime_ns, entry.size) else None
+
+    def get(self, path: str | Path | None = None, client_id: str | None = None) -> ModelEntry:
+        resolved = self.resolve(path, client_id)
+        key = str(resolved)
+        entry = self._entries.get(key)
+        if entry is None:
+            # lock por ruta: cargar un modelo grande no bloquea las peticiones de otros modelos ya cargados
+            with self._path_lock(key):
+                entry = self._entries.get(key)
+                if entry is None:
+                    entry = self._load(resolved)
+                    with self._lock:
+                        self._entries[key] = entry
+            return entry
+
+        now = time.monotonic()
+        if now - entry.checked_at >= self.check_interval:
+            entry.checked_at = now
+            stamp = self._changed(entry)
+            if stamp is not None and self._failed.get(key) != stamp:
+                self._reload_async(key, resolved, stamp)
+        return entry
+
+    def reload(self, path: str | Path | None = None, client_id: str | None = None) -> ModelEntry:
+        """Synchronous reload (e.g. after deploying a retrained model)."""
+        resolved = self.resolve(path, client_id)
+        entry = self._load(resolved)
+        with self._lock:
+            self._entries[str(resolved)] = entry
+        return entry
+
+    def stats(self) -> List[Dict[str, Any]]:
+        with self._lock:
+            return [e.info() for e in self._entries.values()]
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._resolved.clear()
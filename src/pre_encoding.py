@@ -0,0 +1,161 @@
+"""
+Columnar pre-encoding of categorical features for the batch path.
+
+The pipeline's OneHotEncoder / OrdinalEncoder re-encode every string of
+every row on each predict. PreEncoder reads the fitted encoders'
+categories once and, per batch, factorizes each categorical column (each
+distinct string is hashed once, then rows are integer codes) and maps the
+codes through a small lookup array into the encoder's output columns.
+Numeric columns still go through their own fitted transformers (scalers,
+passthrough), and the assembled matrix is handed to the fitted regressor,
+so results match pipeline.predict exactly.
+
+Rows with a category the encoder has never seen are not guessed: they are
+reported (warning + unseen_categories_total) and predict_many scores them
+through the original pipeline, which applies its own handle_unknown.
+"""
+from __future__ import annotations
+
+import logging
+from typing import Any, Dict, List, Sequence, Tuple
+
+import numpy as np
+
+from .fast_inference import UnsupportedPipeline
+from .metrics import METRICS
+
+log = logging.getLogger(__name__)
+
+METRICS.describe("unseen_categories_total", "Rows with a category the fitted encoder has not seen")
+
+_MAX_WARNED = 1000  # (columna, valor) ya avisados; acotado para no crecer con basura
+
+
+class _EncodedColumn:
+    """One categorical input column: category -> position in the encoder's output."""
+    __slots__ = ("column", "index", "offset", "width", "onehot")
+
+    def __init__(self, column: str, categories: Sequence[Any], offset: int, onehot: bool,
+                 drop_idx: int | None = None):
+        self.column = column
+        self.offset = offset
+        self.onehot = onehot
+        self.index: Dict[Any, int] = {}
+        pos = 0
+        for i, cat in enumerate(categories):
+            if onehot and drop_idx is not None and i == drop_idx:
+                self.index[cat] = -1  # categoría eliminada: fila de ceros
+                continue
+            self.index[cat] = pos if onehot else i
+            pos += 1
+        self.width = pos if onehot else 1
+
+    def codes(self, values: np.ndarray) -> np.ndarray:
+        """Output position per row; -1 dropped category, -2 unseen."""
+        import pandas as pd
+
+        inverse, uniques = pd.factorize(values, use_na_sentinel=False)
+        table = np.fromiter((self.index.get(u, -2) for u in uniques.tolist()), dtype=np.intp, count=len(uniques))
+        return table[inverse]
+
+
+class PreEncoder:
+    """Fast front end of a fitted Pipeline([ColumnTransformer, regressor])."""
+
+    def __init__(self, pipeline):
+        from sklearn.compose import ColumnTransformer
+        from sklearn.pipeline import Pipeline
+        from sklearn.preprocessing import OneHotEncoder, OrdinalEncoder
+
+        if not isinstance(pipeline, Pipeline) or len(pipeline.steps) != 2:
+            raise UnsupportedPipeline("Expected Pipeline([preprocessor, regressor])")
+        self.pipeline = pipeline
+        ct, self.regressor = pipeline.steps[0][1], pipeline.steps[-1][1]
+        if not isinstance(ct, ColumnTransformer):
+            raise UnsupportedPipeline(f"Expected a ColumnTransformer, got {type(ct).__name__}")
+        self.sparse_output = bool(getattr(ct, "sparse_output_", False))
+        names_in = list(getattr(ct, "feature_names_in_", []))
+
+        # (kind, transformer, columns, offset, width); kind: "cat" | "num"
+        self.parts: List[Tuple[str, Any, List[str], int, int]] = []
+        self.encoded: List[_EncodedColumn] = []
+        offset = 0
+        for _, trans, cols in ct.transformers_:
+            if (isinstance(trans, str) and trans == "drop") or len(cols) == 0:
+                continue
+            cols = [c if isinstance(c, str) else names_in[int(c)] for c in cols]
+            if isinstance(trans, (OneHotEncoder, OrdinalEncoder)):
+                onehot = isinstance(trans, OneHotEncoder)
+                if getattr(trans, "_infrequent_enabled", False):
+                    raise UnsupportedPipeline("Encoders with infrequent categories are not supported")
+                drop_idx = getattr(trans, "drop_idx_", None) if onehot else None
+                start = offset
+                for j, col in enumerate(cols):
+                    d = None if drop_idx is None or drop_idx[j] is None else int(drop_idx[j])
+                    enc = _EncodedColumn(col, list(trans.categories_[j]), offset, onehot, d)
+                    self.encoded.append(enc)
+                    offset += enc.width
+                self.parts.append(("cat", trans, cols, start, offset - start))
+            else:
+                # escaladores / passthrough: numéricos, se aplican tal cual (misma aritmética que el pipeline)
+                self.parts.append(("num", trans, cols, offset, len(cols)))
+                offset += len(cols)
+        self.n_features = offset
+        self.columns = [c for _, _, cols, _, _ in self.parts for c in cols]
+        self._warned: set = set()
+
+    def transform(self, X) -> Tuple[np.ndarray, np.ndarray]:
+        """(design matrix, unseen-row mask) for a validated feature frame."""
+        n = len(X)
+        out = np.zeros((n, self.n_features), dtype=np.float64)
+        unseen = np.zeros(n, dtype=bool)
+        rows = np.arange(n)
+        for enc in self.encoded:
+            codes = enc.codes(X[enc.column].to_numpy())
+            bad = codes == -2
+            if bad.any():
+                unseen |= bad
+                self._report(enc.column, X[enc.column].to_numpy()[bad])
+            if enc.onehot:
+                hit = codes >= 0
+                out[rows[hit], enc.offset + codes[hit]] = 1.0
+            else:
+                out[:, enc.offset] = np.where(bad, np.nan, codes)
+        for kind, trans, cols, offset, width in self.parts:
+            if kind == "num":
+                out[:, offset:offset + width] = X[cols] if isinstance(trans, str) else trans.transform(X[cols])
+        return out, unseen
+
+    def predict(self, X) -> Tuple[np.ndarray, np.ndarray]:
+        """(predictions, unseen-row mask); predictions of unseen rows are NaN."""
+        design, unseen = self.transform(X)
+        if self.sparse_output:
+            from scipy import sparse
+            design = sparse.csr_matrix(design)
+        yhat = np.asarray(self.regressor.predict(design), dtype=np.float64)
+        yhat[unseen] = np.nan
+        return yhat, unseen
+
+    def _report(self, column: str, values: np.ndarray) -> None:
+        METRICS.inc("unseen_categories_total", len(values), column=column)
+        for v in dict.fromkeys(values.tolist()):
+            if len(self._warned) < _MAX_WARNED and (column, v) not in self._warned:
+                self._warned.add((column, v))
+                log.warning("Unseen category %r for '%s': scoring those rows with the full pipeline", v, column)
+
+    def check_parity(self, X, rtol: float = 0.0, atol: float = 0.0) -> Dict[str, float]:
+        """Compares with pipeline.predict on the rows both paths score; raises ParityError on mismatch."""
+        from .fast_inference import ParityError
+
+        got, unseen = self.predict(X)
+        expected = np.asarray(self.pipeline.predict(X), dtype=np.float64)
+        ok = ~unseen
+        bad = ~np.isclose(got[ok], expected[ok], rtol=rtol, atol=atol)
+        report = {"n": int(ok.sum()), "unseen": int(unseen.sum()),
+                  "max_abs_diff": float(np.abs(got[ok] - expected[ok]).max()) if ok.any() else 0.0,
+                  "mismatches": int(bad.sum())}
+        if bad.any():
+            raise ParityError(f"{report['mismatches']}/{report['n']} rows differ from the pipeline "
+                              f"(max abs diff {report['max_abs_diff']!r})")
+        return report
+
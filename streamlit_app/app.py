@@ -17,23 +17,70 @@ import streamlit as st
 st.set_page_config(page_title="Freight Rate Prediction", page_icon="🚚", layout="centered")
 
 # ---- App imports ----
+# Streamlit re-ejecuta este script en cada interacción: aquí sólo lo ligero.
+# pandas/sklearn (src.inference, quoting) se importan al cotizar o en la
+# precarga en segundo plano; PIL y requests, donde se usan.
+import threading
+from concurrent.futures import Future, wait
+
 import streamlit_authenticator as stauth
-from PIL import Image
-import json
-import requests
 
-from src.inference import predict_one
-# Dynamic per-client rules (reads clients/<client_id>/pricing_rules.json)
-from pricing_rules import get_rules_for_client, postprocess_rate
+from src.metrics import trace
+
+
+# =========================
+#   Cached resources (one per server process, shared by sessions/reruns)
+# =========================
+@st.cache_resource(show_spinner=False)
+def get_rules_store():
+    """Per-client rules (clients/<client_id>/pricing_rules.json), hot-reloaded by its watcher."""
+    from pricing_rules import RULES_STORE
+    RULES_STORE.start_watcher()
+    return RULES_STORE
+
+
+@st.cache_resource(show_spinner=False)
+def preload_model(client: str) -> Future:
+    """
+    Loads (mmap) and compiles the client's model in a background thread the
+    first time someone of that client logs in. The registry keeps
+    hot-swapping it afterwards; this only makes the first quote warm.
+    """
+    done: Future = Future()
+
+    def run() -> None:
+        try:
+            from src.inference import get_compiled, get_model_entry
+            import quoting  # noqa: F401  (pandas, reglas: fuera del camino de la primera cotización)
+            get_compiled(get_model_entry(client_id=client).model)
+            done.set_result(True)
+        except Exception as e:  # sin modelo: la cotización mostrará el error
+            done.set_exception(e)
+
+    threading.Thread(target=run, name=f"model-preload:{client}", daemon=True).start()
+    return done
+
+
+@st.cache_resource(show_spinner=False)
+def get_client_logo(client: str):
+    path = ROOT / "clients" / client / "logo.png"
+    if not path.exists():
+        return None
+    from PIL import Image
+    with Image.open(path) as img:
+        img.load()
+        return img.copy()
 
 
 # =========================
 #   Authentication (0.4.x)
 # =========================
-def build_auth_objects():
+@st.cache_resource(show_spinner=False)
+def load_auth_config():
     """
-    Build credentials dict for streamlit-authenticator 0.4.x
-    from .streamlit/secrets.toml.
+    Credentials dict for streamlit-authenticator 0.4.x plus user -> client /
+    role maps, parsed once from .streamlit/secrets.toml. Only immutable
+    config is shared across sessions; the Authenticate object is not.
     """
     auth_cfg = st.secrets["auth"]
     users = st.secrets.get("users", [])  # [[users]] blocks in secrets.toml
@@ -52,17 +99,28 @@ def build_auth_objects():
         username_to_client[username] = u.get("client_id", "demo")
         username_to_role[username] = u.get("role", "viewer")
 
-    authenticator = stauth.Authenticate(
-        credentials,
-        auth_cfg["cookie_name"],
-        auth_cfg["cookie_key"],
-        auth_cfg.get("cookie_expiry_days", 7),
-    )
-    return authenticator, username_to_client, username_to_role
+    cookie = (auth_cfg["cookie_name"], auth_cfg["cookie_key"], auth_cfg.get("cookie_expiry_days", 7))
+    return credentials, cookie, username_to_client, username_to_role
+
+
+def get_authenticator():
+    """
+    One stauth.Authenticate per browser session: its cookie model keeps
+    per-login state (cookie manager, token, expiry) that must not leak to
+    other users. Built once per session, not per rerun.
+    """
+    if "_authenticator" not in st.session_state:
+        import copy
+        credentials, cookie, _, _ = load_auth_config()
+        # copia: Authenticate anota intentos/estado de login en el dict de credenciales
+        st.session_state["_authenticator"] = stauth.Authenticate(copy.deepcopy(credentials), *cookie)
+    return st.session_state["_authenticator"]
 
 
 # ------ Login (0.4.2 writes to st.session_state) ------
-authenticator, username_to_client, username_to_role = build_auth_objects()
+# El parseo de secrets no se repite por rerun; el autenticador es de cada sesión
+_, _, username_to_client, username_to_role = load_auth_config()
+authenticator = get_authenticator()
 with st.sidebar:
     st.header("Sign in")
 authenticator.login(location="sidebar")
@@ -82,6 +140,8 @@ elif auth_status is None:
 client_id = username_to_client.get(username, "demo")
 user_role = username_to_role.get(username, "viewer")
 
+model_ready = preload_model(client_id)  # no bloquea: la página se pinta mientras carga
+
 with st.sidebar:
     st.write(f"👋 {name} • Client: **{client_id}** • Role: **{user_role}**")
     authenticator.logout("Logout", "sidebar")
@@ -90,11 +150,7 @@ with st.sidebar:
 # =========================
 #   Branding per client
 # =========================
-def load_client_logo(client: str):
-    path = ROOT / "clients" / client / "logo.png"
-    return Image.open(path) if path.exists() else None
-
-logo = load_client_logo(client_id)
+logo = get_client_logo(client_id)
 if logo:
     st.image(logo, width=72)
 
@@ -237,7 +293,7 @@ with st.form("quote"):
 # =========================
 #   Route features (Mapbox) button outside the form
 # =========================
-st.markdown("—")
+st.divider()
 colA, colB = st.columns([1, 3])
 with colA:
     auto_btn = st.button("Auto-compute distance & SALIK")
@@ -245,6 +301,8 @@ with colB:
     st.caption("Use this to pre-fill distance and tolls from origin/destination. You can still edit values before predicting.")
 
 if auto_btn:
+    import requests
+
     try:
         headers = {"x-client-id": client_id, "x-api-key": API_KEY}
         params = {"origin": st.session_state.get("origin",""), "destination": st.session_state.get("destination","")}
@@ -254,6 +312,12 @@ if auto_btn:
             r = requests.get(f"{API_URL}/v1/route_features", headers=headers, params=params, timeout=30)
             r.raise_for_status()
             feat = r.json()
+            # Server-Timing: "geocode;dur=12.3, route;dur=80.1, ..." (+ round trip visto desde aquí)
+            st.session_state["route_timings"] = [
+                (name, float(dur.split("=", 1)[1]))
+                for name, _, dur in (t.strip().partition(";") for t in r.headers.get("Server-Timing", "").split(","))
+                if dur.startswith("dur=")
+            ] + [("route_features_http", round(1000 * r.elapsed.total_seconds(), 3))]
             st.session_state["distance_km"] = feat["distance_km"]
             st.session_state["salik_gates"] = feat["salik_gates"]
             st.session_state["salik_charges_aed"] = feat["salik_charges_aed"]
@@ -265,8 +329,9 @@ if auto_btn:
 # =========================
 #   Prediction + client rules
 # =========================
-if submitted:
-    payload = {
+def form_payload() -> dict:
+    """Quote payload from the form inputs (session state)."""
+    return {
         "client_type": st.session_state["client_type"],
         "origin": st.session_state["origin"],
         "destination": st.session_state["destination"],
@@ -287,15 +352,22 @@ if submitted:
         "peak_demand_factor": float(st.session_state["peak_demand_factor"]),
     }
 
-    try:
-        # Model prediction (raw)
-        raw = predict_one(payload)
 
-        # Per-client rules (dynamic JSON under clients/<client_id>/pricing_rules.json)
-        rules = get_rules_for_client(client_id)
+if submitted:
+    payload = form_payload()
 
-        # Post-processing (minimums, fixed charges, rounding)
-        pp = postprocess_rate(raw, payload["vehicle_type"], rules)
+    try:
+        with st.spinner("Loading model..."):
+            wait([model_ready])  # si la precarga falló, quote() reintenta y muestra el error
+        from quoting import quote
+        from src.inference import get_model_entry
+
+        # Model prediction (raw) + per-client rules (clients/<client_id>/pricing_rules.json)
+        # + post-processing (minimums, fixed charges, rounding); cached per model/rules version
+        with trace() as spans:
+            result = quote(payload, client_id)
+        pp = result["breakdown"]
+        rules = get_rules_store().get(client_id)
 
         st.subheader("Results")
         col1, col2 = st.columns(2)
@@ -311,9 +383,15 @@ if submitted:
             with st.expander("Breakdown details"):
                 st.json({
                     "client_id": client_id,
-                    "rules_in_use": rules,
-                    "calc": pp
+                    "rules_in_use": rules.as_dict(),
+                    "rules_version": rules.version,
+                    "calc": pp,
+                    "model": get_model_entry(client_id=client_id).info(),
                 })
+                if user_role == "admin":
+                    st.markdown("**Timings (ms)**")
+                    timings = spans + st.session_state.get("route_timings", [])
+                    st.table([{"stage": name, "ms": ms} for name, ms in timings])
         else:
             st.caption("Contact your administrator to view the breakdown.")
 
@@ -322,4 +400,117 @@ if submitted:
     except Exception as e:
         st.error(f"Prediction failed: {e}")
 else:
-    st.info("Select a preset on the sidebar or fill the form and click **Predict**.")
\ No newline at end of file
+    st.info("Select a preset on the sidebar or fill the form and click **Predict**.")
+
+
+# =========================
+#   What-if sweep (one or two inputs varied around the form values)
+# =========================
+# campo -> (etiqueta, inicio, fin) por defecto
+SWEEP_FIELDS = {
+    "fuel_price_aed_per_litre": ("Fuel price (AED/L)", 2.5, 4.5),
+    "peak_demand_factor": ("Peak demand factor", 0.8, 1.5),
+    "waiting_time_hours": ("Waiting time (hours)", 0.0, 8.0),
+    "month": ("Month", 1.0, 12.0),
+    "distance_km": ("Distance (km)", 10.0, 300.0),
+    "load_weight_tons": ("Load weight (tons)", 0.5, 20.0),
+}
+
+st.divider()
+st.subheader("What-if sweep")
+st.caption("Vary one or two inputs around the current form values; the whole grid is priced in one batch.")
+sweep_axes = []
+for col, axis in zip(st.columns(2), ("x", "y")):
+    with col:
+        options = list(SWEEP_FIELDS) if axis == "x" else ["", *SWEEP_FIELDS]
+        field = st.selectbox(
+            "First input" if axis == "x" else "Second input (optional)", options,
+            format_func=lambda f: SWEEP_FIELDS[f][0] if f else "—", key=f"sweep_{axis}_field",
+        )
+        if not field:
+            continue
+        label, lo, hi = SWEEP_FIELDS[field]
+        start = st.number_input("From", value=lo, key=f"sweep_{axis}_{field}_start")
+        stop = st.number_input("To", value=hi, key=f"sweep_{axis}_{field}_stop")
+        steps = st.number_input("Steps", min_value=2, max_value=100, value=12 if field == "month" else 10,
+                                step=1, key=f"sweep_{axis}_{field}_steps")
+        sweep_axes.append({"field": field, "start": start, "stop": stop, "steps": int(steps)})
+
+if st.button("Run sweep"):
+    try:
+        with st.spinner("Loading model..."):
+            wait([model_ready])
+        import pandas as pd
+        from sweep import sweep, sweep_rows
+
+        with trace() as spans:
+            result = sweep(form_payload(), sweep_axes, client_id)
+        grid = pd.DataFrame(sweep_rows(result))
+        fields = result["fields"]
+
+        if len(fields) == 1:
+            st.line_chart(grid.set_index(fields[0])[["raw_rate", "final_rate"]])
+        else:
+            import altair as alt
+            st.altair_chart(
+                alt.Chart(grid).mark_rect().encode(
+                    x=alt.X(f"{fields[1]}:O", title=SWEEP_FIELDS[fields[1]][0]),
+                    y=alt.Y(f"{fields[0]}:O", title=SWEEP_FIELDS[fields[0]][0], sort="descending"),
+                    color=alt.Color("final_rate:Q", title="Final rate (AED)"),
+                    tooltip=[*fields, "raw_rate", "final_rate"],
+                ),
+                use_container_width=True,
+            )
+        if result["errors"]:
+            st.warning(f"{len(result['errors'])} grid points could not be priced.")
+        st.dataframe(grid, use_container_width=True)
+        st.download_button(
+            "Download sweep (CSV)", grid.to_csv(index=False).encode("utf-8"),
+            file_name=f"sweep_{client_id}.csv", mime="text/csv",
+        )
+        if user_role == "admin":
+            st.caption(f"{len(grid):,} points — " + ", ".join(f"{name} {ms:.1f} ms" for name, ms in spans))
+    except Exception as e:
+        st.error(f"Sweep failed: {e}")
+
+
+# =========================
+#   Batch quoting (CSV / Parquet upload)
+# =========================
+st.divider()
+st.subheader("Batch quote")
+st.caption("Upload a CSV or Parquet file with one row per lane (same columns as the form) to price a whole tender.")
+upload = st.file_uploader("Lanes file", type=["csv", "parquet"])
+if upload is not None and st.button("Predict batch"):
+    import pandas as pd
+    from pricing_rules import postprocess_rates
+    from src.inference import predict_many
+
+    try:
+        if upload.name.lower().endswith(".parquet"):
+            lanes = pd.read_parquet(upload)
+        else:
+            lanes = pd.read_csv(upload)
+
+        raw_rates, row_errors = predict_many(lanes, return_errors=True, client_id=client_id)
+        rules = get_rules_store().get(client_id)
+
+        out = lanes.copy()
+        out["raw_rate"] = raw_rates
+        vehicles = lanes["vehicle_type"] if "vehicle_type" in lanes else [None] * len(lanes)
+        out["final_rate"] = postprocess_rates(raw_rates, vehicles, rules=rules)["final_rate"].to_numpy()  # NaN -> fila con error
+        out["error"] = None
+        error_col = out.columns.get_loc("error")
+        for i, msg in row_errors:  # i es la posición de la fila, no su etiqueta (Parquet conserva el índice)
+            out.iloc[i, error_col] = msg
+
+        st.write(f"Priced **{len(out) - len(row_errors)}** of {len(out)} rows.")
+        if row_errors:
+            st.warning(f"{len(row_errors)} rows could not be priced; see the `error` column.")
+        st.dataframe(out, use_container_width=True)
+        st.download_button(
+            "Download results (CSV)", out.to_csv(index=False).encode("utf-8"),
+            file_name=f"quotes_{client_id}.csv", mime="text/csv",
+        )
+    except Exception as e:
+        st.error(f"Batch prediction failed: {e}")
@@ -0,0 +1,32 @@
+"""
+Shared test setup: import paths as the app uses them (ROOT for `src`, app/
+flat) and no disk caches or background threads from app modules.
+"""
+import os
+import sys
+from pathlib import Path
+
+import pytest
+
+ROOT = Path(__file__).resolve().parents[1]
+for p in (ROOT, ROOT / "app", ROOT / "benchmarks"):
+    if str(p) not in sys.path:
+        sys.path.insert(0, str(p))
+
+# antes de importar app/: nada de disco ni hilos de fondo
+os.environ.setdefault("ROUTE_CACHE_DISABLE_DISK", "1")
+os.environ.setdefault("RULES_POLL_INTERVAL_S", "0")
+
+
+@pytest.fixture(scope="session")
+def synthetic_model():
+    """kind (rf|gb|ridge) -> path of the benchmarks' synthetic pipeline, trained once into benchmarks/.cache."""
+    import _fixtures
+
+    def path(kind: str = "rf") -> str:
+        p = _fixtures.CACHE_DIR / f"synthetic_{kind}.joblib"
+        if not p.exists():
+            _fixtures._train_synthetic(p, kind)
+        return str(p)
+
+    return path
@@ -0,0 +1,61 @@
+"""API auth fails closed: no API_KEYS / METRICS_TOKEN means 401 unless API_DEV_MODE=1."""
+import json
+
+import pytest
+from fastapi import HTTPException
+from fastapi.testclient import TestClient
+
+import api
+
+
+@pytest.fixture
+def keys(monkeypatch):
+    monkeypatch.setenv("API_KEYS", json.dumps({"acme": "s3cret", "empty": ""}))
+
+
+def _status(client_id: str, key: str) -> int:
+    try:
+        api.authenticate(client_id, key)
+    except HTTPException as e:
+        return e.status_code
+    return 200
+
+
+def test_valid_key_is_accepted(keys):
+    assert api.authenticate("acme", "s3cret") == "acme"
+
+
+@pytest.mark.parametrize("client_id,key", [("acme", "wrong"), ("acme", ""), ("globex", ""), ("empty", "")])
+def test_wrong_missing_or_empty_keys_are_rejected(keys, client_id, key):
+    assert _status(client_id, key) == 401
+
+
+def test_unset_api_keys_fails_closed(monkeypatch):
+    monkeypatch.delenv("API_KEYS", raising=False)
+    monkeypatch.setattr(api, "API_DEV_MODE", False)
+    assert _status("acme", "") == 401
+    monkeypatch.setattr(api, "API_DEV_MODE", True)
+    assert _status("acme", "") == 200
+    assert _status("../acme", "") == 400
+
+
+def test_metrics_requires_the_scrape_token(monkeypatch):
+    client = TestClient(api.app)  # sin "with": no arranca el lifespan (modelo, pool)
+    monkeypatch.setattr(api, "API_DEV_MODE", False)
+    monkeypatch.setattr(api, "METRICS_TOKEN", "")
+    assert client.get("/metrics").status_code == 401
+
+    monkeypatch.setattr(api, "METRICS_TOKEN", "scrape")
+    assert client.get("/metrics").status_code == 401
+    assert client.get("/metrics", headers={"authorization": "Bearer nope"}).status_code == 401
+    assert client.get("/metrics", headers={"authorization": "Bearer scrape"}).status_code == 200
+
+
+def test_stats_is_for_the_operator_not_for_client_keys(keys, monkeypatch):
+    client = TestClient(api.app)
+    monkeypatch.setattr(api, "API_DEV_MODE", False)
+    monkeypatch.setattr(api, "METRICS_TOKEN", "scrape")
+    tenant = {"x-client-id": "acme", "x-api-key": "s3cret"}
+    assert client.get("/v1/stats", headers=tenant).status_code == 401
+    r = client.get("/v1/stats", headers={"authorization": "Bearer scrape"})
+    assert r.status_code == 200 and "rules" in r.json()
@@ -0,0 +1,60 @@
+"""MicroBatcher shutdown and cancellation with a stub model (no real predict)."""
+import threading
+import time
+
+import pytest
+
+from src.batching import BatcherClosed, BatcherOverloaded, MicroBatcher
+
+
+class GatedPredict:
+    """predict_fn that blocks every batch until `gate` is set."""
+
+    def __init__(self):
+        self.gate = threading.Event()
+        self.started = threading.Event()
+        self.batches = []
+
+    def __call__(self, payloads, client_id):
+        self.started.set()
+        self.gate.wait(5)
+        self.batches.append(len(payloads))
+        return [p["x"] * 2.0 for p in payloads], []
+
+
+def test_close_with_a_full_queue_does_not_block_and_fails_the_waiting_requests():
+    predict = GatedPredict()
+    batcher = MicroBatcher(max_batch_size=1, max_wait_ms=0, max_queue=4, predict_fn=predict)
+    running = batcher.submit({"x": 1})
+    assert predict.started.wait(5)  # el worker está dentro de predict con la 1ª petición
+    queued = [batcher.submit({"x": i}) for i in range(4)]
+    with pytest.raises(BatcherOverloaded):
+        batcher.submit({"x": 99})
+
+    threading.Timer(0.2, predict.gate.set).start()
+    t0 = time.perf_counter()
+    batcher.close(timeout=5)
+    assert time.perf_counter() - t0 < 3
+    assert running.result(1) == 2.0
+    for f in queued:
+        with pytest.raises(BatcherClosed):
+            f.result(1)
+    assert predict.batches == [1]
+    assert batcher.metrics()["aborted"] == 4
+    with pytest.raises(BatcherClosed):
+        batcher.submit({"x": 1})
+
+
+def test_cancelled_requests_are_skipped_without_killing_the_worker():
+    predict = GatedPredict()
+    batcher = MicroBatcher(max_batch_size=1, max_wait_ms=0, predict_fn=predict)
+    try:
+        batcher.submit({"x": 1})
+        assert predict.started.wait(5)
+        cancelled = batcher.submit({"x": 2})
+        assert cancelled.cancel()  # p.ej. el cliente HTTP cortó la conexión
+        predict.gate.set()
+        assert batcher.predict({"x": 3}, timeout=5) == 6.0
+        assert predict.batches == [1, 1]
+    finally:
+        batcher.close()
@@ -0,0 +1,37 @@
+"""Compiled pipeline (src/fast_inference.py) scores like sklearn on the synthetic rf/gb/ridge pipelines."""
+import numpy as np
+import pandas as pd
+import pytest
+
+from _fixtures import random_payloads
+from src.fast_inference import CompiledPipeline, ParityError
+from src.inference import get_compiled, load_model, predict_many, predict_one_fast
+
+KINDS = ["rf", "gb", "ridge"]
+
+
+@pytest.mark.parametrize("kind", KINDS)
+def test_compiled_pipeline_matches_sklearn(synthetic_model, kind):
+    path = synthetic_model(kind)
+    model = load_model(path)
+    compiled = get_compiled(model)
+    assert isinstance(compiled, CompiledPipeline)
+
+    payloads = random_payloads(300, seed=11)
+    # categorías que el modelo no vio: el one-hot las deja a cero en ambos caminos
+    payloads += [dict(p, origin="Fujairah", weather="fog") for p in payloads[:20]]
+    expected = model.predict(pd.DataFrame(payloads))
+    np.testing.assert_allclose([compiled.predict_one(p) for p in payloads], expected, rtol=1e-9, atol=1e-9)
+    np.testing.assert_allclose(compiled.predict_rows(payloads), expected, rtol=1e-9, atol=1e-9)
+    np.testing.assert_allclose([predict_one_fast(p, path) for p in payloads[:25]], expected[:25], rtol=1e-9)
+    assert compiled.check_parity(payloads)["mismatches"] == 0
+    np.testing.assert_allclose(predict_many(payloads, path, chunk_size=64), expected, rtol=1e-9, atol=1e-9)
+
+
+def test_check_parity_raises_on_a_mismatch(synthetic_model):
+    compiled = CompiledPipeline(load_model(synthetic_model("ridge")))  # propia, no la de get_compiled
+    payloads = random_payloads(10, seed=12)
+    assert compiled.check_parity(payloads)["mismatches"] == 0
+    compiled.model.intercept += 1.0  # desalineada a propósito
+    with pytest.raises(ParityError):
+        compiled.check_parity(payloads)
@@ -0,0 +1,75 @@
+"""predict_many: bad rows are reported by position and never take the rest of the batch down."""
+import numpy as np
+import pandas as pd
+import pytest
+
+from _fixtures import random_payloads
+from src.inference import FEATURE_COLUMNS, _predict_chunk, predict_many
+
+KINDS = ["rf", "gb", "ridge"]
+
+
+def _broken(payloads):
+    """Copies with bad rows at known positions -> expected error substring."""
+    rows = [dict(p) for p in payloads]
+    del rows[1]["distance_km"]
+    rows[4]["month"] = None
+    rows[6]["load_weight_tons"] = "heavy"
+    rows[9]["fuel_price_aed_per_litre"] = float("inf")
+    return rows, {1: "distance_km", 4: "month", 6: "load_weight_tons", 9: "fuel_price_aed_per_litre"}
+
+
+@pytest.mark.parametrize("kind", KINDS)
+def test_bad_rows_are_reported_by_position_and_the_rest_are_scored(synthetic_model, kind):
+    path = synthetic_model(kind)
+    good = random_payloads(12, seed=5)
+    rows, bad = _broken(good)
+    out, errors = predict_many(rows, path, chunk_size=4, return_errors=True)
+
+    assert [i for i, _ in errors] == sorted(bad)
+    for i, msg in errors:
+        assert bad[i] in msg
+    assert np.isnan(out[sorted(bad)]).all()
+    keep = [i for i in range(len(rows)) if i not in bad]
+    np.testing.assert_allclose(out[keep], predict_many([good[i] for i in keep], path), rtol=1e-9)
+
+
+def test_errors_are_positions_even_when_the_frame_keeps_its_index(synthetic_model):
+    path = synthetic_model("ridge")
+    rows, bad = _broken(random_payloads(12, seed=6))
+    # p.ej. un Parquet subido con su propio índice (no 0..n-1)
+    df = pd.DataFrame(rows, index=[100 + 7 * i for i in range(len(rows))][::-1])
+    out, errors = predict_many(df, path, return_errors=True)
+    assert [i for i, _ in errors] == sorted(bad)
+
+    # como el lote del portal: la columna de error se escribe por posición
+    result = df.assign(final_rate=out, error=None)
+    col = result.columns.get_loc("error")
+    for i, msg in errors:
+        result.iloc[i, col] = msg
+    assert len(result) == len(rows)
+    assert result["error"].notna().to_numpy().nonzero()[0].tolist() == sorted(bad)
+    assert result["final_rate"].isna().to_numpy().nonzero()[0].tolist() == sorted(bad)
+
+
+class _Picky:
+    """Stub model whose predict fails for the whole chunk if any row comes from "Nowhere"."""
+
+    def predict(self, X):
+        if (X["origin"] == "Nowhere").any():
+            raise ValueError("unknown origin Nowhere")
+        return X["distance_km"].to_numpy() * 2.0
+
+
+def test_a_row_that_breaks_model_predict_only_fails_itself():
+    payloads = random_payloads(8, seed=7)
+    payloads[2]["origin"] = payloads[5]["origin"] = "Nowhere"
+    X = pd.DataFrame(payloads, columns=FEATURE_COLUMNS)
+    rows = np.arange(len(X))
+    out = np.full(len(X), np.nan)
+    errors = []
+    _predict_chunk(_Picky(), X, rows, out, errors)
+    assert errors == [(2, "ValueError: unknown origin Nowhere"), (5, "ValueError: unknown origin Nowhere")]
+    ok = [i for i in rows if i not in (2, 5)]
+    np.testing.assert_array_equal(out[ok], X["distance_km"].to_numpy()[ok] * 2.0)
+    assert np.isnan(out[[2, 5]]).all()
@@ -0,0 +1,38 @@
+"""Inference process pool: recovers from worker-side errors and from dead workers."""
+import numpy as np
+import pytest
+
+from _fixtures import random_payloads
+from src.inference import predict_many
+from src.inference_pool import InferencePool
+
+
+@pytest.fixture
+def pool():
+    p = InferencePool(workers=1, start_method="spawn", timeout_s=60)
+    yield p
+    p.close()
+
+
+def test_failed_batch_does_not_break_the_next_larger_one(pool, synthetic_model):
+    path = synthetic_model("ridge")
+    with pytest.raises(FileNotFoundError):
+        pool.predict_many(random_payloads(10), "/nonexistent.joblib")
+    # > segmento inicial de 1 MiB: el worker tiene que soltar el anterior y mapear uno nuevo
+    big = random_payloads(20_000, seed=1)
+    for _ in range(2):
+        np.testing.assert_array_equal(pool.predict_many(big, path), predict_many(big, path))
+
+
+def test_dead_worker_is_restarted(pool, synthetic_model):
+    path = synthetic_model("ridge")
+    payloads = random_payloads(50, seed=2)
+    expected = predict_many(payloads, path)
+    np.testing.assert_array_equal(pool.predict_many(payloads, path), expected)
+
+    worker = pool._workers[0]
+    old_pid = worker.proc.pid
+    worker.proc.kill()
+    worker.proc.join(5)
+    np.testing.assert_array_equal(pool.predict_many(payloads, path), expected)
+    assert worker.proc.is_alive() and worker.proc.pid != old_pid
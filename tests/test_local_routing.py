@@ -0,0 +1,115 @@
+"""Local routing backend on the bundled tiny_uae.osm fixture and on hand-written OSM snippets."""
+import numpy as np
+import pytest
+from scipy.sparse import csr_matrix
+from scipy.sparse.csgraph import dijkstra
+
+import local_routing as lr
+from route_features_mapbox import salik_gates_on_route
+
+FIXTURES = lr.ROOT / "benchmarks" / "fixtures"
+
+
+def _csr(arrays):
+    n = len(arrays["latlon"])
+    return csr_matrix((arrays["weights"].astype(np.float64), arrays["indices"], arrays["indptr"]), shape=(n, n))
+
+
+def _edges(arrays):
+    """Directed edges as (osm id, osm id) pairs."""
+    ids = arrays["osm_ids"].tolist()
+    indptr, indices = arrays["indptr"], arrays["indices"]
+    return {(ids[u], ids[int(v)]) for u in range(len(ids)) for v in indices[indptr[u]:indptr[u + 1]]}
+
+
+@pytest.fixture(scope="module")
+def graph_dir(tmp_path_factory):
+    out = tmp_path_factory.mktemp("road_graph")
+    lr.build(FIXTURES / "tiny_uae.osm", out, FIXTURES / "tiny_uae_hubs.csv")
+    return out
+
+
+@pytest.fixture(scope="module")
+def router(graph_dir):
+    return lr.LocalRouter(graph_dir)
+
+
+def test_build_writes_a_valid_csr_of_the_largest_component(graph_dir, router):
+    indptr, indices, weights = (np.load(graph_dir / f"{n}.npy") for n in ("indptr", "indices", "weights"))
+    n = len(router.latlon)
+    assert len(indptr) == n + 1 and indptr[0] == 0 and indptr[-1] == len(indices) == router.meta["edges"]
+    assert np.all(np.diff(indptr) >= 0) and indices.min() >= 0 and indices.max() < n
+    assert np.all(weights > 0)
+    # la carretera "island" (25.40, 55.10) no está conectada: fuera del grafo
+    assert not np.any(np.all(np.isclose(router.latlon, [25.40, 55.10]), axis=1))
+    # aristas ordenadas por cabeza dentro de cada nodo
+    assert all(np.all(np.diff(indices[indptr[u]:indptr[u + 1]]) > 0) for u in range(n))
+
+
+def test_astar_matches_dijkstra(router, graph_dir):
+    arrays = {n: np.load(graph_dir / f"{n}.npy") for n in ("indptr", "indices", "weights", "latlon")}
+    rng = np.random.default_rng(0)
+    sources = rng.choice(len(router.latlon), 8, replace=False)
+    dist = dijkstra(_csr(arrays), directed=True, indices=sources)
+    for k, s in enumerate(sources):
+        for t in rng.choice(len(router.latlon), 8, replace=False):
+            d, path = router.astar(int(s), int(t))
+            assert d == pytest.approx(dist[k, t], rel=1e-9)
+            assert path[0] == s and path[-1] == t
+
+
+def test_hub_table_matches_graph_search(router):
+    nodes = [h["node"] for h in router.hubs]
+    for i, a in enumerate(nodes):
+        for j, b in enumerate(nodes):
+            if i == j:
+                continue
+            d, path = router.astar(a, b)
+            assert float(router.hub_dist[i, j]) == pytest.approx(d, rel=1e-6)
+            gates = router.hub_gates[i, j]
+            assert [int(g) for g in gates[gates >= 0]] == salik_gates_on_route(router.latlon[path])
+    f = router.route_features("Jebel Ali Port", "Sharjah", online=False)
+    assert f["provider"] == "local:hub-table" and f["salik_gates"] == 3
+
+
+def test_hub_gate_ids_above_127_survive(tmp_path, monkeypatch):
+    # 200 gates: con int8, 150 y 199 se guardarían como -106 y -57 (y se filtrarían como relleno)
+    monkeypatch.setattr(lr, "SALIK_GATES", [(0.0, float(k)) for k in range(200)])
+    monkeypatch.setattr(lr, "salik_gates_on_route", lambda latlon, *a, **k: [150, 199])
+    lr.build(FIXTURES / "tiny_uae.osm", tmp_path, FIXTURES / "tiny_uae_hubs.csv")
+    router = lr.LocalRouter(tmp_path)
+    assert router.hub_gates.dtype == np.int16
+    o, d = (router.resolve(name, online=False) for name in ("Jebel Ali Port", "Sharjah"))
+    assert router.route(o, d) == (pytest.approx(float(router.hub_dist[0, 4])), (150, 199), "local:hub-table")
+
+
+def _osm(path, nodes, ways):
+    lines = ['<?xml version="1.0" encoding="UTF-8"?>', '<osm version="0.6">']
+    lines += [f'  <node id="{i}" lat="{lat}" lon="{lon}"/>' for i, (lat, lon) in nodes.items()]
+    for k, (refs, tags) in enumerate(ways, start=1):
+        lines.append(f'  <way id="{k}">')
+        lines += [f'    <nd ref="{r}"/>' for r in refs]
+        lines += [f'    <tag k="{a}" v="{b}"/>' for a, b in {"highway": "primary", **tags}.items()]
+        lines.append("  </way>")
+    path.write_text("\n".join(lines + ["</osm>"]) + "\n", encoding="utf-8")
+    return path
+
+
+NODES = {1: (25.00, 55.00), 2: (25.00, 55.01), 3: (25.01, 55.01), 4: (25.01, 55.00),
+         5: (25.005, 54.995), 6: (25.02, 55.005)}
+
+
+def test_oneway_tags(tmp_path):
+    ways = [([1, 2, 3], {"oneway": "yes"}),   # 1 -> 2 -> 3 sólo
+            ([3, 4, 1], {}),                   # doble sentido
+            ([4, 5, 1], {"oneway": "-1"})]     # se circula 1 -> 5 -> 4
+    edges = _edges(lr.build_graph(_osm(tmp_path / "oneway.osm", NODES, ways)))
+    assert {(1, 2), (2, 3), (3, 4), (4, 3), (4, 1), (1, 4), (1, 5), (5, 4)} == edges
+
+
+def test_refs_missing_from_the_extract_split_the_way(tmp_path):
+    ways = [([1, 2, 3, 4, 1], {}),
+            ([2, 999, 6, 4], {})]  # 999 no está en el extracto
+    edges = _edges(lr.build_graph(_osm(tmp_path / "gap.osm", NODES, ways)))
+    assert (6, 4) in edges and (4, 6) in edges
+    assert not {(2, 6), (6, 2)} & edges  # sin recta sobre el hueco
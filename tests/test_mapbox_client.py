@@ -0,0 +1,206 @@
+"""MapboxClient against an in-process stub (httpx.MockTransport): retries, in-flight dedup, matrix blocks."""
+import asyncio
+import itertools
+import time
+
+import httpx
+import pytest
+
+import route_features_mapbox as rf
+from route_cache import GEOCODE_CACHE, MATRIX_CACHE
+
+_run_ids = itertools.count()
+
+
+def _client(handler, **kwargs) -> rf.MapboxClient:
+    client = rf.MapboxClient("test-token", base_url="https://mapbox.stub", **kwargs)
+    client._client = httpx.AsyncClient(base_url=client.base_url, transport=httpx.MockTransport(handler))
+    return client
+
+
+def _place_lon(name: str) -> float:
+    return 55.0 + int(name.rsplit("-", 1)[1]) * 0.01  # "<run>-<k>" -> lon distinto por lugar
+
+
+def _geocode_body(request: httpx.Request) -> dict:
+    name = request.url.path.rsplit("/", 1)[-1].removesuffix(".json")
+    return {"features": [{"center": [_place_lon(name), 25.0]}]}
+
+
+@pytest.fixture(autouse=True)
+def _fresh_caches():
+    GEOCODE_CACHE.clear_memory()
+    MATRIX_CACHE.clear_memory()
+
+
+def test_retries_transient_errors_then_succeeds():
+    calls = []
+
+    def handler(request):
+        calls.append(request.url.path)
+        if len(calls) < 3:
+            return httpx.Response(503 if len(calls) == 1 else 429)
+        return httpx.Response(200, json=_geocode_body(request))
+
+    async def main():
+        client = _client(handler, use_cache=False)
+        try:
+            return await client.geocode("retry-3"), client.upstream_calls
+        finally:
+            await client.aclose()
+
+    point, upstream = asyncio.run(main())
+    assert point == {"lat": 25.0, "lon": _place_lon("retry-3")}
+    assert upstream == len(calls) == 3
+    assert all(r.startswith("/geocoding/") for r in calls)
+
+
+def test_client_errors_are_not_retried():
+    calls = []
+
+    def handler(request):
+        calls.append(request)
+        return httpx.Response(401, json={"message": "Not Authorized"})
+
+    async def main():
+        client = _client(handler, use_cache=False)
+        try:
+            await client.geocode("denied-1")
+        finally:
+            await client.aclose()
+
+    with pytest.raises(httpx.HTTPStatusError):
+        asyncio.run(main())
+    assert len(calls) == 1
+
+
+def test_gives_up_after_max_attempts():
+    calls = []
+
+    def handler(request):
+        calls.append(request)
+        return httpx.Response(502)
+
+    async def main():
+        client = _client(handler, use_cache=False, max_attempts=2)
+        try:
+            await client.geocode("down-1")
+        finally:
+            await client.aclose()
+
+    with pytest.raises(httpx.HTTPStatusError):
+        asyncio.run(main())
+    assert len(calls) == 2
+
+
+def test_concurrent_identical_lookups_share_one_upstream_call():
+    calls = []
+
+    async def handler(request):
+        calls.append(request.url.path)
+        await asyncio.sleep(0.05)  # las 10 peticiones llegan mientras la primera está en vuelo
+        return httpx.Response(200, json=_geocode_body(request))
+
+    async def main():
+        client = _client(handler, use_cache=False)
+        try:
+            same = await asyncio.gather(*(client.geocode("dedup-7") for _ in range(10)))
+            other = await client.geocode("dedup-8")
+            return same, other
+        finally:
+            await client.aclose()
+
+    same, other = asyncio.run(main())
+    assert len(calls) == 2
+    assert all(p == same[0] for p in same) and other["lon"] != same[0]["lon"]
+
+
+def test_matrix_is_split_into_blocks_within_the_coordinate_limit():
+    run = next(_run_ids)
+    origins = [f"o{run}-{k}" for k in range(20)]
+    destinations = [f"d{run}-{k}" for k in range(100, 120)]
+    matrix_calls = []
+
+    def handler(request):
+        path = request.url.path
+        if path.startswith("/geocoding/"):
+            return httpx.Response(200, json=_geocode_body(request))
+        assert path.startswith("/directions-matrix/")
+        coords = [tuple(map(float, c.split(","))) for c in path.rsplit("/", 1)[-1].split(";")]
+        src = [int(i) for i in request.url.params["sources"].split(";")]
+        dst = [int(i) for i in request.url.params["destinations"].split(";")]
+        matrix_calls.append((len(coords), len(src), len(dst)))
+        # distancia "falsa" pero deducible del par: |Δlon| * 1e5 m
+        distances = [[round(abs(coords[i][0] - coords[j][0]) * 1e5, 3) for j in dst] for i in src]
+        return httpx.Response(200, json={"code": "Ok", "distances": distances})
+
+    async def main():
+        client = _client(handler)
+        try:
+            return [row async for row in rf.iter_route_matrix(origins, destinations, salik="none", client=client)]
+        finally:
+            await client.aclose()
+
+    rows = asyncio.run(main())
+    assert all(n <= rf.MATRIX_MAX_COORDS for n, _, _ in matrix_calls)
+    assert sum(s * d for _, s, d in matrix_calls) == len(origins) * len(destinations)
+    assert len(matrix_calls) == 4  # 12 + 8 orígenes x 13 + 7 destinos
+    assert sorted((r["origin"], r["destination"]) for r in rows) == sorted(itertools.product(origins, destinations))
+    for r in rows:
+        expected_km = round(abs(_place_lon(r["origin"]) - _place_lon(r["destination"])) * 100, 2)
+        assert r["error"] is None and r["distance_km"] == pytest.approx(expected_km, abs=0.01)
+
+
+def test_clients_are_per_event_loop():
+    async def on_loop():
+        return rf.get_client("loop-token"), rf.get_client("loop-token")
+
+    a1, a2 = asyncio.run(on_loop())
+    b1, _ = asyncio.run(on_loop())
+    assert a1 is a2 and a1 is not b1
+    background = rf.get_client("loop-token")  # fuera de un loop: el loop de run_sync
+    assert background is rf.get_client("loop-token", rf._background_loop()) and background not in (a1, b1)
+
+
+def test_sync_matrix_stops_upstream_calls_when_the_consumer_stops():
+    run = next(_run_ids)
+    origins = [f"so{run}-{k}" for k in range(30)]
+    destinations = [f"sd{run}-{k}" for k in range(100, 130)]
+    matrix_calls = []
+
+    async def handler(request):
+        if request.url.path.startswith("/geocoding/"):
+            return httpx.Response(200, json=_geocode_body(request))
+        matrix_calls.append(request.url.path)
+        await asyncio.sleep(0.05)
+        n_src = len(request.url.params["sources"].split(";"))
+        n_dst = len(request.url.params["destinations"].split(";"))
+        return httpx.Response(200, json={"code": "Ok", "distances": [[1000.0] * n_dst] * n_src})
+
+    client = _client(handler)  # 3 x 3 bloques, de uno en uno
+    rows = rf.iter_route_matrix_sync(origins, destinations, salik="none", max_concurrency=1, client=client)
+    assert next(rows)["error"] is None
+    rows.close()
+    seen = len(matrix_calls)
+    time.sleep(0.5)  # sin cancelar, el loop de fondo seguiría con los 9 bloques
+    assert len(matrix_calls) == seen < 9
+    rf.run_sync(client.aclose())
+
+
+def test_run_sync_timeout_cancels_the_coroutine():
+    started, cancelled = asyncio.Event(), []
+
+    async def slow():
+        started.set()
+        try:
+            await asyncio.sleep(30)
+        except asyncio.CancelledError:
+            cancelled.append(True)
+            raise
+
+    with pytest.raises(TimeoutError):
+        rf.run_sync(slow(), timeout=0.2)
+    deadline = time.monotonic() + 5
+    while not cancelled and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert started.is_set() and cancelled == [True]
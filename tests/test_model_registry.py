@@ -0,0 +1,88 @@
+"""ModelRegistry: hot swap on file change, failed reloads, and first loads that don't block other models."""
+import shutil
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from _fixtures import random_payloads
+from src.inference import predict_many
+from src.model_registry import ModelRegistry
+
+
+def _wait(cond, timeout=30.0):
+    deadline = time.monotonic() + timeout
+    while not cond():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.02)
+
+
+@pytest.fixture
+def deployed(tmp_path, synthetic_model):
+    path = tmp_path / "freight_rate_pipeline.joblib"
+    shutil.copy(synthetic_model("rf"), path)
+    return path
+
+
+def test_replaced_file_is_swapped_in_and_a_failed_reload_keeps_the_previous_model(deployed, synthetic_model):
+    registry = ModelRegistry(default_path=deployed, check_interval=0)
+    first = registry.get()
+    payloads = random_payloads(20, seed=3)
+
+    tmp = deployed.with_suffix(".new")
+    shutil.copy(synthetic_model("ridge"), tmp)
+    tmp.replace(deployed)  # despliegue: nuevo fichero en la misma ruta
+    _wait(lambda: registry.get().version != first.version)
+    swapped = registry.get()
+    assert swapped.snapshot != first.snapshot
+    np.testing.assert_allclose(swapped.model.predict(pd.DataFrame(payloads)),
+                               predict_many(payloads, synthetic_model("ridge")), rtol=1e-9)
+    # quien ya tenía la entrada vieja sigue prediciendo con ella (su snapshot no se tocó)
+    np.testing.assert_allclose(first.model.predict(pd.DataFrame(payloads)),
+                               predict_many(payloads, synthetic_model("rf")), rtol=1e-9)
+
+    deployed.write_bytes(b"not a joblib file")
+    registry.get()
+    _wait(lambda: str(deployed.resolve()) in registry._failed and not registry._reloading)
+    for _ in range(3):  # no se reintenta hasta que el fichero vuelva a cambiar
+        assert registry.get() is swapped
+    assert not registry._reloading
+
+
+def test_first_load_of_one_model_does_not_block_others(deployed, synthetic_model, tmp_path, monkeypatch):
+    other = tmp_path / "other.joblib"
+    shutil.copy(synthetic_model("ridge"), other)
+    registry = ModelRegistry(default_path=deployed, check_interval=60)
+    loaded = registry.get(other)
+
+    gate, started, loads = threading.Event(), threading.Event(), []
+    real_load = registry._load
+
+    def slow_load(path):
+        loads.append(path)
+        if path == deployed.resolve():
+            started.set()
+            gate.wait(10)
+        return real_load(path)
+
+    monkeypatch.setattr(registry, "_load", slow_load)
+    results = []
+    slow = [threading.Thread(target=lambda: results.append(registry.get())) for _ in range(2)]
+    for t in slow:
+        t.start()
+    assert started.wait(10)
+
+    # mientras deployed carga: el modelo ya cargado se sirve y otra ruta nueva también carga
+    third = tmp_path / "third.joblib"
+    shutil.copy(synthetic_model("ridge"), third)
+    fast = threading.Thread(target=lambda: results.extend([registry.get(other), registry.get(third)]))
+    fast.start()
+    fast.join(10)
+    assert not fast.is_alive() and results[0] is loaded
+
+    gate.set()
+    for t in slow:
+        t.join(10)
+    assert results[2] is results[3] and loads.count(deployed.resolve()) == 1  # una sola carga por ruta
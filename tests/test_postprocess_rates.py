@@ -0,0 +1,63 @@
+"""postprocess_rates (columnar) must reproduce postprocess_rate (scalar) exactly, row by row."""
+import math
+
+import numpy as np
+import pytest
+
+from pricing_rules import CLIENTS_DIR, DEFAULT_RULES, ClientRules, RulesStore, postprocess_rate, postprocess_rates
+
+STORE = RulesStore(CLIENTS_DIR, poll_interval=0)
+RULE_SETS = [ClientRules("__default__", DEFAULT_RULES)] + [STORE.get(c) for c in sorted(STORE.stats()["clients"])]
+VEHICLES = ["van", "3t_truck", "7t_truck", "flatbed", "reefer_truck", "unknown_truck"]
+COLUMNS = ["raw_rate", "after_minimum", "after_fixed_charges", "final_rate", "vehicle_minimum_applied"]
+
+
+def _tie_heavy_rates(rules: ClientRules, rng: np.random.Generator) -> np.ndarray:
+    # x.xx5 en decimal: el caso que np.round(x, 2) resuelve distinto de round()
+    cents = [float(f"{i}.{j:02d}5") for i in rng.integers(0, 5000, 400).tolist() for j in (0, 12, 49, 99)]
+    # after_fixed_charges justo a medio múltiplo: empate del redondeo final (half-to-even)
+    fees = rules.fixed_charges_aed + rules.gate_in_out_aed
+    halves = [(k + 0.5) * rules.round_to - fees for k in range(0, 400)]
+    minimums = [m + d for m in rules.vehicle_minimums.values() for d in (-0.005, 0.0, 0.004999, 0.005)]
+    uniform = rng.uniform(-50, 20_000, 2000).tolist()
+    extreme = [0.0, -0.0, 1e-12, 0.005, 1e15, 123456789.125, math.nan]
+    return np.array(cents + halves + minimums + uniform + extreme, dtype=np.float64)
+
+
+def _same(a: float, b: float) -> bool:
+    return (math.isnan(a) and math.isnan(b)) or a == b
+
+
+@pytest.mark.parametrize("rules", RULE_SETS, ids=lambda r: r.client_id)
+def test_columnar_matches_scalar(rules):
+    rng = np.random.default_rng(12345)
+    raw = _tie_heavy_rates(rules, rng)
+    vehicles = rng.choice(VEHICLES, len(raw)).tolist()
+
+    df = postprocess_rates(raw, vehicles, rules=rules)
+
+    for i, (r, v) in enumerate(zip(raw.tolist(), vehicles)):
+        if math.isnan(r):
+            assert math.isnan(df["raw_rate"].iat[i]) and math.isnan(df["final_rate"].iat[i])
+            continue
+        expected = postprocess_rate(r, v, rules)
+        for col in COLUMNS:
+            assert _same(df[col].iat[i], expected[col]), (i, r, v, col, df[col].iat[i], expected[col])
+        assert df["rounded_multiple"].iat[i] == expected["rounded_multiple"]
+        assert df["doc_fee"].iat[i] == expected["fixed_charges"]["doc_fee"]
+        assert df["gate_in_out"].iat[i] == expected["fixed_charges"]["gate_in_out"]
+
+
+@pytest.mark.parametrize("rules", RULE_SETS, ids=lambda r: r.client_id)
+def test_dict_rules_match_frozen_rules(rules):
+    rng = np.random.default_rng(7)
+    raw = _tie_heavy_rates(rules, rng)
+    vehicles = rng.choice(VEHICLES, len(raw)).tolist()
+    frozen = postprocess_rates(raw, vehicles, rules=rules)
+    as_dict = postprocess_rates(raw, vehicles, rules=rules.as_dict())
+    assert frozen.equals(as_dict)
+
+
+def test_length_mismatch_is_rejected():
+    with pytest.raises(ValueError):
+        postprocess_rates([1.0, 2.0], ["van"], rules=RULE_SETS[0])
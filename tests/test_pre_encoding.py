@@ -0,0 +1,138 @@
+"""PreEncoder must score exactly like the pipeline it was built from; unseen categories go through the pipeline."""
+import logging
+
+import numpy as np
+import pandas as pd
+import pytest
+from sklearn.compose import ColumnTransformer
+from sklearn.ensemble import HistGradientBoostingRegressor, RandomForestRegressor
+from sklearn.linear_model import Ridge
+from sklearn.pipeline import Pipeline
+from sklearn.preprocessing import MinMaxScaler, OneHotEncoder, OrdinalEncoder, StandardScaler
+
+from src.fast_inference import UnsupportedPipeline
+from src.inference import CATEGORICAL_FEATURES, FEATURE_COLUMNS, NUMERIC_FEATURES, _predict_chunk, get_encoder
+from src.pre_encoding import PreEncoder
+
+CHOICES = {
+    "client_type": ["retailer", "manufacturer", "distributor"],
+    "origin": ["Jebel Ali Port", "Dubai South", "Al Quoz", "Sharjah"],
+    "destination": ["Al Quoz", "Abu Dhabi", "Sharjah", "Ajman"],
+    "load_type": ["dry", "reefer", "hazardous"],
+    "vehicle_type": ["van", "3t_truck", "7t_truck", "flatbed"],
+    "contract_type": ["spot", "contract"],
+    "season": ["winter", "spring", "summer", "autumn"],
+    "weather": ["clear", "hot", "sandstorm"],
+}
+
+
+def _frame(n: int, seed: int) -> pd.DataFrame:
+    rng = np.random.default_rng(seed)
+    cols = {c: rng.choice(v, n).astype(object) for c, v in CHOICES.items()}
+    for c in NUMERIC_FEATURES:
+        cols[c] = rng.uniform(0, 100, n).round(2)
+    return pd.DataFrame(cols, columns=FEATURE_COLUMNS)
+
+
+TRAIN = _frame(600, seed=1)
+Y = TRAIN["distance_km"] * 3 + TRAIN["month"] + TRAIN["origin"].map(
+    {"Jebel Ali Port": 40, "Dubai South": 10, "Al Quoz": 0, "Sharjah": 25})
+
+
+def _pipeline(encoder, numeric, regressor, **ct_kwargs) -> Pipeline:
+    ct = ColumnTransformer([("cat", encoder, CATEGORICAL_FEATURES), ("num", numeric, NUMERIC_FEATURES)], **ct_kwargs)
+    return Pipeline([("pre", ct), ("model", regressor)]).fit(TRAIN, Y)
+
+
+PIPELINES = {
+    "onehot_dense": lambda: _pipeline(OneHotEncoder(handle_unknown="ignore", sparse_output=False), StandardScaler(),
+                                      RandomForestRegressor(n_estimators=10, random_state=0)),
+    "ordinal": lambda: _pipeline(OrdinalEncoder(handle_unknown="use_encoded_value", unknown_value=np.nan),
+                                 MinMaxScaler(), HistGradientBoostingRegressor(max_iter=20, random_state=0)),
+    "onehot_drop_first": lambda: _pipeline(OneHotEncoder(drop="first", handle_unknown="error"), "passthrough",
+                                           Ridge(), sparse_threshold=0.0),
+    "onehot_sparse": lambda: _pipeline(OneHotEncoder(handle_unknown="ignore"), "passthrough", Ridge(),
+                                       sparse_threshold=1.0),
+}
+
+
+@pytest.fixture(params=sorted(PIPELINES), scope="module")
+def pipeline(request):
+    return PIPELINES[request.param]()
+
+
+def test_design_matrix_matches_column_transformer(pipeline):
+    X = _frame(500, seed=2)
+    design, unseen = PreEncoder(pipeline).transform(X)
+    expected = pipeline.steps[0][1].transform(X)
+    expected = expected.toarray() if hasattr(expected, "toarray") else expected
+    assert not unseen.any()
+    assert np.array_equal(design, expected, equal_nan=True)
+
+
+def test_predictions_match_pipeline_exactly(pipeline):
+    X = _frame(500, seed=3)
+    report = PreEncoder(pipeline).check_parity(X)  # rtol = atol = 0
+    assert report == {"n": 500, "unseen": 0, "max_abs_diff": 0.0, "mismatches": 0}
+
+
+def test_sparse_pipeline_is_scored_sparse():
+    enc = PreEncoder(PIPELINES["onehot_sparse"]())
+    assert enc.sparse_output
+
+
+def test_unseen_categories_fall_back_to_the_pipeline(pipeline, caplog):
+    X = _frame(300, seed=4)
+    X.loc[[3, 7], "origin"] = "Fujairah"
+    X.loc[11, "weather"] = "fog"
+    unseen_rows = [3, 7, 11]
+    rows = np.arange(len(X))
+
+    reference = np.full(len(X), np.nan)
+    ref_errors = []
+    _predict_chunk(pipeline, X, rows, reference, ref_errors)  # sin pre-encoding: el camino original
+
+    out = np.full(len(X), np.nan)
+    errors = []
+    with caplog.at_level(logging.WARNING, logger="src.pre_encoding"):
+        _predict_chunk(pipeline, X, rows, out, errors, PreEncoder(pipeline))
+
+    known = np.setdiff1d(rows, unseen_rows)
+    # con handle_unknown="error" el camino original cae a fila a fila; el lote de referencia es predict()
+    assert np.array_equal(out[known], pipeline.predict(X.iloc[known]))
+    # filas nuevas: las puntúa el pipeline por su cuenta (mismo handle_unknown, mismos errores)
+    assert errors == ref_errors
+    np.testing.assert_allclose(out[unseen_rows], reference[unseen_rows], rtol=0, atol=1e-9)
+    warned = [r.getMessage() for r in caplog.records]
+    assert sum("Fujairah" in m for m in warned) == 1 and sum("fog" in m for m in warned) == 1
+
+
+def test_handle_unknown_error_rows_are_reported_not_guessed():
+    pipeline = PIPELINES["onehot_drop_first"]()
+    X = _frame(50, seed=5)
+    X.loc[4, "load_type"] = "livestock"
+    out = np.full(len(X), np.nan)
+    errors = []
+    _predict_chunk(pipeline, X, np.arange(len(X)), out, errors, PreEncoder(pipeline))
+    assert [i for i, _ in errors] == [4]
+    assert np.isnan(out[4]) and not np.isnan(np.delete(out, 4)).any()
+
+
+def test_dropped_category_encodes_as_zeros():
+    pipeline = PIPELINES["onehot_drop_first"]()
+    enc = PreEncoder(pipeline)
+    ohe = pipeline.steps[0][1].named_transformers_["cat"]
+    X = _frame(20, seed=6)
+    X["origin"] = ohe.categories_[CATEGORICAL_FEATURES.index("origin")][0]  # la categoría eliminada
+    design, unseen = enc.transform(X)
+    col = next(c for c in enc.encoded if c.column == "origin")
+    assert not unseen.any()
+    assert not design[:, col.offset:col.offset + col.width].any()
+
+
+def test_infrequent_categories_are_not_supported():
+    pipeline = _pipeline(OneHotEncoder(handle_unknown="infrequent_if_exist", min_frequency=200,
+                                       sparse_output=False), "passthrough", Ridge())
+    with pytest.raises(UnsupportedPipeline):
+        PreEncoder(pipeline)
+    assert get_encoder(pipeline) is None
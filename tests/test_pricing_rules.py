@@ -0,0 +1,76 @@
+"""RulesStore hot reload: a rewritten file swaps in new values, an invalid one keeps the last good rules."""
+import json
+import os
+import time
+
+import pytest
+
+from pricing_rules import DEFAULT_RULES, ClientRules, RulesStore, postprocess_rate
+
+RULES = {"global": {"round_to": 10, "fixed_charges_aed": 30.0, "gate_in_out_aed": 12.0},
+         "vehicle_minimums": {"van": 180, "7t_truck": 270}}
+
+
+def _write(clients_dir, client_id, content):
+    path = clients_dir / client_id / "pricing_rules.json"
+    path.parent.mkdir(parents=True, exist_ok=True)
+    old = path.stat().st_mtime_ns if path.exists() else 0
+    path.write_text(content if isinstance(content, str) else json.dumps(content), encoding="utf-8")
+    if path.stat().st_mtime_ns == old:  # mismo tick del reloj del FS: forzar otro mtime
+        os.utime(path, ns=(old + 1_000_000, old + 1_000_000))
+    return path
+
+
+@pytest.fixture
+def store(tmp_path):
+    _write(tmp_path, "acme", RULES)
+    return RulesStore(tmp_path, poll_interval=0)
+
+
+def test_rewrite_bumps_the_version_and_serves_the_new_values(store, tmp_path):
+    before = store.get("acme")
+    assert before.round_to == 10 and before.minimum_for("van") == 180.0
+    assert store.refresh() == 0  # nada cambió
+
+    _write(tmp_path, "acme", {**RULES, "vehicle_minimums": {"van": 200, "7t_truck": 270}})
+    assert store.refresh() == 1
+    after = store.get("acme")
+    assert after.version != before.version and after.minimum_for("van") == 200.0
+    assert postprocess_rate(150.0, "van", after)["vehicle_minimum_applied"] == 200.0
+    assert before.minimum_for("van") == 180.0  # quien ya tenía la versión vieja no ve cambios a medias
+
+
+def test_invalid_file_is_rejected_and_the_last_good_rules_stay(store, tmp_path):
+    good = store.get("acme")
+    for bad in ("{ not json", {"global": {"round_to": -5}}, {"vehicle_minimums": {"van": "cheap"}}):
+        _write(tmp_path, "acme", bad)
+        assert store.refresh() == 0
+        assert store.get("acme") is good
+        assert "acme" in store.errors
+    assert store.counters["rejected"] == 3
+
+    _write(tmp_path, "acme", RULES)
+    assert store.refresh() == 1
+    assert store.get("acme").version == good.version and "acme" not in store.errors
+
+
+def test_new_client_without_valid_rules_gets_the_defaults(store, tmp_path):
+    _write(tmp_path, "globex", "[]")
+    store.refresh()
+    assert store.get("globex") is store.default
+    assert store.default.version == ClientRules("x", DEFAULT_RULES).version
+    assert "globex" in store.errors
+
+
+def test_watcher_picks_up_a_rewrite(tmp_path):
+    _write(tmp_path, "acme", RULES)
+    store = RulesStore(tmp_path, poll_interval=0.05)
+    store.start_watcher()
+    try:
+        _write(tmp_path, "acme", {**RULES, "global": {"round_to": 25}})
+        deadline = time.monotonic() + 5
+        while store.get("acme").round_to != 25 and time.monotonic() < deadline:
+            time.sleep(0.02)
+        assert store.get("acme").round_to == 25
+    finally:
+        store.stop_watcher()
@@ -0,0 +1,53 @@
+"""Quote cache keys (canonical payload + model/rules versions) and the SQLite L2 behind the in-memory L1."""
+from cachetools import TTLCache
+
+from _fixtures import BASE_PAYLOAD
+from quote_cache import QuoteCache, canonical_payload, quote_key
+
+QUOTE = {"client_id": "acme", "raw_rate": 279.13, "final_rate": 320.0}
+
+
+def test_equivalent_payloads_share_one_key():
+    reordered = dict(reversed(list(BASE_PAYLOAD.items())))
+    as_float = {k: float(v) if isinstance(v, int) and not isinstance(v, bool) else v for k, v in BASE_PAYLOAD.items()}
+    extra = dict(BASE_PAYLOAD, shipment_id="S-1", notes="fragile")  # campos que el modelo no ve
+    keys = {quote_key(p, "acme", "m1", "r1") for p in (BASE_PAYLOAD, reordered, as_float, extra)}
+    assert len(keys) == 1 and None not in keys
+
+
+def test_payloads_the_model_sees_differently_get_other_keys():
+    base = quote_key(BASE_PAYLOAD, "acme", "m1", "r1")
+    assert quote_key(dict(BASE_PAYLOAD, origin=" " + BASE_PAYLOAD["origin"]), "acme", "m1", "r1") != base
+    assert quote_key(dict(BASE_PAYLOAD, distance_km=BASE_PAYLOAD["distance_km"] + 1), "acme", "m1", "r1") != base
+    assert quote_key(BASE_PAYLOAD, "globex", "m1", "r1") != base
+    # incompletos o con números en texto: sin caché
+    assert canonical_payload({k: v for k, v in BASE_PAYLOAD.items() if k != "month"}) is None
+    assert quote_key(dict(BASE_PAYLOAD, distance_km="30"), "acme", "m1", "r1") is None
+
+
+def test_model_or_rules_version_bump_misses():
+    cache = QuoteCache(maxsize=16, ttl=60, shared_path=None)
+    cache.set(quote_key(BASE_PAYLOAD, "acme", "m1", "r1"), QUOTE)
+    assert cache.get(quote_key(BASE_PAYLOAD, "acme", "m1", "r1")) == QUOTE
+    assert cache.get(quote_key(BASE_PAYLOAD, "acme", "m2", "r1")) is None  # modelo reentrenado
+    assert cache.get(quote_key(BASE_PAYLOAD, "acme", "m1", "r2")) is None  # pricing_rules.json nuevo
+    assert cache.counters == {"hits": 1, "shared_hits": 0, "misses": 2}
+
+
+def test_sqlite_l2_serves_after_the_l1_entry_expires(tmp_path):
+    now = [0.0]
+    cache = QuoteCache(maxsize=16, ttl=60, shared_path=str(tmp_path / "quotes.sqlite"))
+    cache._mem = TTLCache(maxsize=16, ttl=1, timer=lambda: now[0])  # L1 con reloj propio, L2 con el real
+    key = quote_key(BASE_PAYLOAD, "acme", "m1", "r1")
+    cache.set(key, QUOTE)
+    assert cache.get(key) == QUOTE and cache.counters["hits"] == 1
+
+    now[0] += 2  # caduca en memoria, sigue vivo en SQLite
+    assert key not in cache._mem
+    assert cache.get(key) == QUOTE and cache.counters["shared_hits"] == 1
+    assert cache.get(key) == QUOTE and cache.counters["hits"] == 2  # subido otra vez a L1
+
+    # otro worker con el mismo fichero y la memoria vacía
+    other = QuoteCache(maxsize=16, ttl=60, shared_path=str(tmp_path / "quotes.sqlite"))
+    assert other.get(key) == QUOTE and other.counters["shared_hits"] == 1
+    assert other.get(quote_key(BASE_PAYLOAD, "acme", "m2", "r1")) is None
@@ -0,0 +1,105 @@
+"""Rate cards on benchmarks/fixtures/rate_card_example.json: grid hits, staleness and the background rebuild."""
+import json
+import shutil
+import time
+
+import pytest
+
+import quoting
+import rate_cards
+from pricing_rules import RulesStore
+from rate_cards import RateCardStore, card_payloads, load_spec
+from src.inference import get_model_entry, predict_one
+
+FIXTURE = rate_cards.ROOT / "benchmarks" / "fixtures" / "rate_card_example.json"
+CLIENT = "acme"
+RULES = {"global": {"round_to": 10, "fixed_charges_aed": 30.0, "gate_in_out_aed": 12.0},
+         "vehicle_minimums": {"van": 180, "3t_truck": 210, "7t_truck": 270, "flatbed": 320, "reefer_truck": 350}}
+
+
+@pytest.fixture
+def env(tmp_path, monkeypatch, synthetic_model):
+    """Client dir, rules store and model all under tmp_path; `env["model"]` picks the live model."""
+    client_dir = tmp_path / "clients" / CLIENT
+    client_dir.mkdir(parents=True)
+    shutil.copy(FIXTURE, client_dir / rate_cards.SPEC_FILENAME)
+    (client_dir / "pricing_rules.json").write_text(json.dumps(RULES), encoding="utf-8")
+    models = {kind: shutil.copy(synthetic_model(kind), tmp_path / f"{kind}.joblib") for kind in ("rf", "ridge")}
+    state = {"model": str(models["rf"]), "rules": RulesStore(tmp_path / "clients", poll_interval=0),
+             "dir": client_dir, "models": {k: str(v) for k, v in models.items()}}
+
+    def model_entry(path=None, client_id=None):
+        return get_model_entry(state["model"])
+
+    monkeypatch.setattr(rate_cards, "CLIENTS_DIR", tmp_path / "clients")
+    for module in (rate_cards, quoting):
+        monkeypatch.setattr(module, "get_model_entry", model_entry)
+        monkeypatch.setattr(module, "get_client_rules", lambda client_id: state["rules"].get(client_id))
+    return state
+
+
+def _live(payload, state):
+    return quoting.finish_quote(predict_one(payload, state["model"]), payload, CLIENT)
+
+
+def _wait_for_card(store, versions=None, timeout=60.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        card = store.card(CLIENT)
+        built = CLIENT not in store._building  # el hilo ya actualizó contadores y errores
+        if built and card is not None and (versions is None or card.versions != versions):
+            return card
+        time.sleep(0.05)
+    raise AssertionError(f"no rate card after {timeout}s: {store.stats()['errors']}")
+
+
+def test_grid_hit_returns_the_contract_price(env, tmp_path):
+    store = RateCardStore(tmp_path / "cards", autobuild=False, check_interval=0)
+    assert store.lookup(card_payloads(load_spec(CLIENT)[0])[0], CLIENT) is None  # sin tarjeta construida
+
+    card = rate_cards.build_card(CLIENT, tmp_path / "cards" / f"{CLIENT}.parquet")
+    payloads = card_payloads(load_spec(CLIENT)[0])
+    assert len(card) == len(payloads) == 2 * 5 * 4 * 12
+    for payload in payloads[::37]:
+        hit = store.lookup(payload, CLIENT)
+        live = _live(payload, env)
+        assert hit["final_rate"] == live["final_rate"]
+        assert hit["breakdown"] == live["breakdown"]
+        assert (hit["model_version"], hit["rules_version"]) == (live["model_version"], live["rules_version"])
+
+    # fuera de la tarjeta (otro precio de gasoil) o no contrato: cotización en vivo
+    assert store.lookup(dict(payloads[0], fuel_price_aed_per_litre=3.5), CLIENT) is None
+    assert store.lookup(dict(payloads[0], contract_type="spot"), CLIENT) is None
+    assert store.counters["hits"] == len(payloads[::37]) and store.counters["misses"] == 1
+
+
+@pytest.mark.parametrize("change", ["rules", "model"])
+def test_version_change_makes_the_card_stale_until_the_rebuild_swaps_it(env, tmp_path, change):
+    store = RateCardStore(tmp_path / "cards", autobuild=True, check_interval=0)
+    payload = card_payloads(load_spec(CLIENT)[0])[100]
+    assert store.lookup(payload, CLIENT) is None  # primera vez: se construye en segundo plano
+    old = _wait_for_card(store)
+    assert store.lookup(payload, CLIENT)["final_rate"] == _live(payload, env)["final_rate"]
+
+    if change == "rules":
+        rules = json.loads(json.dumps(RULES))
+        rules["global"]["fixed_charges_aed"] = 125.0
+        (env["dir"] / "pricing_rules.json").write_text(json.dumps(rules), encoding="utf-8")
+        assert env["rules"].refresh() == 1
+    else:
+        env["model"] = env["models"]["ridge"]
+
+    # la tarjeta vieja no se sirve: la cotización va en vivo mientras se reconstruye
+    builds = store.counters["builds"]
+    stale = store.counters["stale"]
+    assert store.lookup(payload, CLIENT) is None
+    assert store.counters["stale"] == stale + 1
+    new = _wait_for_card(store, old.versions)
+    assert new is not old and store.counters["builds"] == builds + 1
+    assert new.versions == store._current(CLIENT) != old.versions
+    hit = store.lookup(payload, CLIENT)
+    assert hit["final_rate"] == _live(payload, env)["final_rate"]
+    assert hit[f"{change}_version"] != old.meta[f"{change}_version"]
+    # en disco queda la nueva (reemplazo atómico, sin ficheros temporales)
+    assert rate_cards.RateCard.load(tmp_path / "cards" / f"{CLIENT}.parquet").versions == new.versions
+    assert [p.name for p in (tmp_path / "cards").iterdir()] == [f"{CLIENT}.parquet"]
@@ -0,0 +1,62 @@
+"""reprice.py input reading and checkpointing (no model needed)."""
+import csv
+
+import pyarrow as pa
+
+import reprice
+from src.inference import CATEGORICAL_FEATURES, FEATURE_COLUMNS, NUMERIC_FEATURES
+
+ROW = {
+    "client_type": "retailer", "origin": "Jebel Ali Port", "destination": "Al Quoz",
+    "distance_km": 30, "load_type": "dry", "load_weight_tons": 3, "vehicle_type": "7t_truck",
+    "fuel_price_aed_per_litre": 3, "salik_gates": 2, "salik_charges_aed": 8,
+    "customs_fees_aed": 60, "waiting_time_hours": 1, "contract_type": "spot",
+    "backhaul_available": 0, "month": 8, "season": "summer", "weather": "hot",
+    "peak_demand_factor": 1,
+}
+
+
+def _write_csv(path, n: int) -> None:
+    with open(path, "w", newline="") as f:
+        w = csv.DictWriter(f, fieldnames=["shipment_id", "client_id", *FEATURE_COLUMNS])
+        w.writeheader()
+        for i in range(n):
+            # el primer bloque parece todo entero (ids, cliente "101", origen "1001");
+            # el final trae texto y decimales en esas mismas columnas
+            late = i >= n - 5
+            w.writerow(dict(ROW, shipment_id=f"S-{i}" if late else i, client_id="acme" if late else "101",
+                            origin="Jebel Ali Port" if late else "1001",
+                            customs_fees_aed="N/A" if i == n - 1 else 60.5 if late else 60))
+
+
+def test_csv_column_types_do_not_depend_on_the_first_block(tmp_path, monkeypatch):
+    monkeypatch.setattr(reprice, "CSV_BLOCK_BYTES", 4096)  # decenas de bloques
+    path = tmp_path / "ship.csv"
+    _write_csv(path, 2000)
+
+    tables = list(reprice.iter_batches(path, batch_rows=300))
+    assert [t.num_rows for t in tables] == [300] * 6 + [200]
+    table = pa.concat_tables(tables)
+    for c in NUMERIC_FEATURES:
+        assert table.schema.field(c).type == pa.float64()
+    for c in CATEGORICAL_FEATURES + ["client_id", "shipment_id"]:
+        assert table.schema.field(c).type == pa.string()
+    assert table["origin"][0].as_py() == "1001" and table["client_id"][0].as_py() == "101"
+    assert table["shipment_id"][-1].as_py() == "S-1999"
+    assert table["customs_fees_aed"].to_pylist()[-2:] == [60.5, None]
+
+
+def test_restart_discards_the_checkpoint_with_the_parts(tmp_path):
+    src = tmp_path / "ship.csv"
+    _write_csv(src, 10)
+    out = tmp_path / "out"
+    out.mkdir()
+    fp = reprice._fingerprint(src, 5, None)
+    reprice.Checkpoint(out, fp).mark({"index": 0, "rows": 5, "failed": 0})
+    (out / "part-000000.parquet").write_bytes(b"old")
+
+    ckpt = reprice.Checkpoint(out, fp, restart=True)
+    assert not ckpt.done
+    assert not (out / reprice.CHECKPOINT).exists() and not list(out.glob("part-*"))
+    # una ejecución interrumpida antes del primer lote ya no "reanuda" parts borrados
+    assert not reprice.Checkpoint(out, fp).done
@@ -0,0 +1,83 @@
+"""polyline6 and cache-blob round trips, and SALIK-safe simplification."""
+import numpy as np
+import pytest
+
+from route_features_mapbox import SALIK_GATES, SalikGateIndex, salik_gates_on_route, simplify_route
+from route_geometry import decode_polyline6, douglas_peucker, encode_polyline6, pack_route, unpack_route
+
+# ejemplo de la especificación de polyline (precisión 6)
+KNOWN = ("_izlhA~rlgdF_{geC~ywl@_kwzCn`{nI", [(38.5, -120.2), (40.7, -120.95), (43.252, -126.453)])
+
+
+def _road(seed: int, n_waypoints: int = 6, step_km: float = 0.02) -> np.ndarray:
+    """Dense, slightly noisy polyline between random waypoints around the Dubai gates."""
+    rng = np.random.default_rng(seed)
+    gates = np.asarray(SALIK_GATES)
+    # waypoints sobre gates (cruces) o cerca (casi-cruces a pocos cientos de metros)
+    way = gates[rng.integers(0, len(gates), n_waypoints)] + rng.normal(0, 0.004, (n_waypoints, 2))
+    pieces = []
+    for a, b in zip(way[:-1], way[1:]):
+        k = max(2, int(np.hypot(*(b - a)) * 111 / step_km))
+        pieces.append(a + np.linspace(0, 1, k, endpoint=False)[:, None] * (b - a))
+    line = np.vstack(pieces + [way[-1:]])
+    return line + rng.normal(0, 0.00003, line.shape)  # ~3 m de ruido
+
+
+def test_known_polyline6():
+    encoded, points = KNOWN
+    np.testing.assert_allclose(decode_polyline6(encoded), points, rtol=0, atol=1e-9)
+    assert encode_polyline6(np.array(points)) == encoded
+    assert decode_polyline6("").shape == (0, 2)
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_polyline6_round_trip(seed):
+    rng = np.random.default_rng(seed)
+    latlon = np.column_stack((rng.uniform(-90, 90, 500), rng.uniform(-180, 180, 500)))
+    np.testing.assert_allclose(decode_polyline6(encode_polyline6(latlon)), latlon, rtol=0, atol=1e-6)
+
+
+@pytest.mark.parametrize("duration", [812.4, None])
+def test_pack_unpack_round_trip(duration):
+    latlon = _road(1)
+    back = unpack_route(pack_route({"distance": 12345.6, "duration": duration, "latlon": latlon}))
+    assert back["distance"] == 12345.6 and back["duration"] == duration
+    # precisión de polyline6: exactamente lo mismo que decode(encode(x))
+    np.testing.assert_array_equal(back["latlon"], decode_polyline6(encode_polyline6(latlon)))
+    np.testing.assert_allclose(back["latlon"], latlon, rtol=0, atol=1e-6)
+
+
+def test_unpack_rejects_foreign_blobs():
+    with pytest.raises(ValueError):
+        unpack_route(b"XX" + pack_route({"distance": 1.0, "duration": None, "latlon": _road(0)})[2:])
+
+
+@pytest.mark.parametrize("seed", range(20))
+def test_simplified_route_crosses_the_same_gates(seed):
+    full = _road(seed)
+    simple = simplify_route(full)
+    assert len(simple) <= len(full)
+    assert salik_gates_on_route(simple) == salik_gates_on_route(full)
+
+
+def test_simplification_drops_points_away_from_gates():
+    # Jebel Ali -> Sharjah por Al Garhoud: sólo el tramo a < 1 km del gate se guarda entero
+    way = np.array([(24.985, 55.06), SALIK_GATES[1], (25.35, 55.45)])
+    full = np.vstack([a + np.linspace(0, 1, 2000, endpoint=False)[:, None] * (b - a)
+                      for a, b in zip(way[:-1], way[1:])] + [way[-1:]])
+    simple = simplify_route(full)
+    assert len(simple) < len(full) / 10
+    assert salik_gates_on_route(simple) == salik_gates_on_route(full) == [1]
+
+
+def test_douglas_peucker_keeps_dropped_vertices_within_tolerance():
+    full = _road(3)
+    mask = douglas_peucker(full, tolerance_km=0.05)
+    kept = np.flatnonzero(mask)
+    assert mask[0] and mask[-1]
+    # cada vértice eliminado está a <= tolerancia del tramo simplificado que lo cubre
+    # (el índice de gates sirve de test punto-segmento con los vértices como "gates")
+    for a, b in zip(kept[:-1], kept[1:]):
+        if b - a > 1:
+            index = SalikGateIndex(full[a + 1:b])
+            assert len(index.crossings(full[[a, b]], threshold_km=0.0501)) == b - a - 1
@@ -0,0 +1,48 @@
+"""SALIK gate detection: point-to-segment distance on the KD-tree index, not nearest vertex."""
+import pytest
+
+from route_features_mapbox import SALIK_GATES, SalikGateIndex, haversine_km, salik_gates_on_route
+
+LAT = 25.2
+KM_PER_DEG_LAT = 6371.0 * 3.141592653589793 / 180  # ~111.19 km
+
+
+def _lat_off(km: float) -> float:
+    return LAT + km / KM_PER_DEG_LAT
+
+
+def test_gate_between_two_sparse_vertices_is_detected():
+    index = SalikGateIndex([(LAT, 55.30)])
+    route = [(_lat_off(0.2), 55.20), (_lat_off(0.2), 55.40)]  # un solo tramo de ~20 km a 200 m del gate
+    assert min(haversine_km(v, (LAT, 55.30)) for v in route) > 9  # el vértice más cercano está lejísimos
+    assert index.crossings(route, threshold_km=0.25) == [0]
+
+
+def test_near_miss_outside_the_radius_is_not_reported():
+    index = SalikGateIndex([(LAT, 55.30)])
+    assert index.crossings([(_lat_off(0.30), 55.20), (_lat_off(0.30), 55.40)], threshold_km=0.25) == []
+    assert index.crossings([(_lat_off(0.24), 55.20), (_lat_off(0.24), 55.40)], threshold_km=0.25) == [0]
+
+
+def test_gates_come_back_in_crossing_order():
+    # índices 0..2 de oeste a este, listados desordenados en el índice
+    index = SalikGateIndex([(LAT, 55.30), (LAT, 55.10), (LAT, 55.20)])
+    eastbound = [(LAT, 55.00), (_lat_off(0.1), 55.15), (LAT, 55.35)]
+    assert index.crossings(eastbound) == [1, 2, 0]
+    assert index.crossings(eastbound[::-1]) == [0, 2, 1]
+
+
+def test_real_gates_on_a_sparse_route():
+    garhoud, bridge = SALIK_GATES[1], SALIK_GATES[2]
+    # recta entre puntos a ambos lados de Al Garhoud (sin vértice cerca del gate)
+    a = (garhoud[0] - 0.02, garhoud[1] - 0.02)
+    b = (garhoud[0] + 0.02, garhoud[1] + 0.02)
+    assert salik_gates_on_route([a, b]) == [1]
+    assert salik_gates_on_route([b, a]) == [1]
+    assert 2 not in salik_gates_on_route([a, b]) and haversine_km(garhoud, bridge) > 5
+
+
+@pytest.mark.parametrize("route", [[], [(LAT, 55.30)]])
+def test_degenerate_routes(route):
+    index = SalikGateIndex([(LAT, 55.30)])
+    assert index.crossings(route) == ([0] if route else [])